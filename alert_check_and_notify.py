@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 import os
-import csv
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from slack_notifier import SlackNotifier
+from datetime import datetime
+from csv_tail import last_row
+from metering import COMPARABLE_METERS, row_meter
+import notify_queue
 
 # ログ関数
 
@@ -12,50 +12,29 @@ def log(msg):
     print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {msg}")
 
 
-# .env の読み込み
-load_dotenv("/home/pi/timelapse-system/.env")
-SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
-SLACK_DM_EMAIL = os.getenv("SLACK_DM_EMAIL")
-
 CSV_PATH = f"/home/pi/timelapse-system/log/brightness_{datetime.now():%Y-%m}.csv"
-ALERT_TIMESTAMP_FILE = "/home/pi/timelapse-system/log/last_alert_time"
+ALERT_KEY = "brightness"
 ALERT_COOLDOWN_MINUTES = 30
-
-# Slack通知クラス初期化
-if SLACK_BOT_TOKEN is None:
-    raise ValueError("環境変数 'SLACK_BOT_TOKEN' が未設定です。")
-notifier = SlackNotifier(bot_token=SLACK_BOT_TOKEN, user_email=SLACK_DM_EMAIL)
+# 添付は長辺 1024px・300KB までの縮小版を送る（DCT 縮小、cache/attachments/ に再利用）
+PREVIEW_MAX_PX = 1024
+PREVIEW_MAX_BYTES = 300 * 1024
 
 
 def should_send_alert():
-    if not os.path.exists(ALERT_TIMESTAMP_FILE):
-        return True
-    try:
-        with open(ALERT_TIMESTAMP_FILE, "r") as f:
-            last_time_str = f.read().strip()
-            last_time = datetime.strptime(last_time_str, "%Y-%m-%d %H:%M:%S")
-            return datetime.now() - last_time > timedelta(minutes=ALERT_COOLDOWN_MINUTES)
-    except Exception:
-        return True
-
-
-def update_last_alert_time():
-    with open(ALERT_TIMESTAMP_FILE, "w") as f:
-        f.write(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    # 抑制は notify_queue の alert_state.json（アラートの種類ごと）で判定する
+    return not notify_queue.suppressed(ALERT_KEY, ALERT_COOLDOWN_MINUTES * 60)
 
 
 def parse_latest_csv_entry():
-    if not os.path.exists(CSV_PATH):
-        return None, None, None
-    with open(CSV_PATH, "r") as f:
-        rows = list(csv.reader(f))
-        for row in reversed(rows):
-            if len(row) >= 8:
-                return row[0], row[6], row[7]
-    return None, None, None
+    # 末尾から8列以上ある最新行だけを読む（ファイル全体は読まない）
+    row = last_row(CSV_PATH, min_fields=8)
+    if row is None:
+        return None, None, None, None
+    return row[0], row[6], row[7], row_meter(row)
 
 
 def send_brightness_alert(timestamp, mean_str, filepath):
+    # 0.07 / 0.60 は identify（R,G,B 平均）の値。capture_daemon.py の rgb も同じ尺度
     try:
         mean_value = float(mean_str)
         if mean_value < 0.07:
@@ -69,16 +48,24 @@ def send_brightness_alert(timestamp, mean_str, filepath):
         status = "明るさ取得失敗"
 
     comment = f"📛 明るさ異常検出: `{mean_str}`（{status}）\n🕒 {timestamp}"
-    success = notifier.send_file(
+    if not os.path.exists(filepath):
+        # CSV のパスが archived へ移動済みなら台帳から今の場所を引く
+        import frame_catalog
+        filepath = frame_catalog.resolve(filepath) or filepath
+    # 送信はバックグラウンドの flusher が行う（Wi-Fi 断の間もキューに残って再送される）
+    queued = notify_queue.enqueue(
+        comment,
+        key=ALERT_KEY,
         filepath=filepath,
         title="異常時撮影画像",
-        comment=comment
+        max_px=PREVIEW_MAX_PX,
+        max_bytes=PREVIEW_MAX_BYTES,
+        suppress_sec=ALERT_COOLDOWN_MINUTES * 60
     )
-    if success:
-        update_last_alert_time()
-        log("✅ アラート送信完了")
+    if queued:
+        log("📮 アラートを送信キューに追加")
     else:
-        log("⚠️ アラート送信失敗")
+        log("⏳ クールタイム中のため、アラート送信をスキップ")
 
 
 if __name__ == "__main__":
@@ -86,9 +73,12 @@ if __name__ == "__main__":
         log("⏳ クールタイム中のため、アラート送信をスキップ")
         exit(0)
 
-    timestamp, filepath, mean_str = parse_latest_csv_entry()
+    timestamp, filepath, mean_str, meter = parse_latest_csv_entry()
     if not timestamp or not filepath or not mean_str:
         log("⚠️ CSVログの読み取りに失敗")
         exit(1)
+    if meter not in COMPARABLE_METERS:
+        log(f"🔍 閾値と尺度の違う明るさ（{meter}）のため判定しません")
+        exit(0)
 
     send_brightness_alert(timestamp, mean_str, filepath)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+archiver.py — images/ の前日以前の画像を archived/YYYY-MM-DD/ へ1回でまとめて移動する
+
+scripts/sync_to_archived.sh（2分ごとに find して 30 件ずつ mv）の置き換え。
+同じファイルシステム内なら os.rename（メタデータの書き換えだけ）で移し、
+別のファイルシステムのときだけコピー → 削除にする。
+
+負荷は件数の上限ではなく I/O の予算（ファイル/秒・バイト/秒、rate_limit.TokenBucket）で抑える。
+進み具合はジャーナル（log/archiver.journal）に書き、途中で落ちたら次の起動で
+書きかけのコピーを片付けてから続きを移す。ログはファイルごとではなく最後に1行の集計を出す。
+
+    python3 archiver.py              # 今日より前の画像をすべて移動
+    python3 archiver.py --day 2026-10-16
+    python3 archiver.py --dry-run    # 移動せずに件数だけ
+"""
+
+import argparse
+import errno
+import fcntl
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional
+
+import frame_catalog
+import frame_index
+from rate_limit import TokenBucket
+
+ROOT = Path("/home/pi/timelapse-system")
+SRC_DIR = ROOT / "images"
+DEST_DIR = ROOT / "archived"
+JOURNAL_PATH = ROOT / "log" / "archiver.journal"
+LOG_PATH = ROOT / "log" / "move_archived.log"
+
+FILES_PER_SEC = float(os.getenv("ARCHIVE_FILES_PER_SEC", 50))   # 0 で無制限
+BYTES_PER_SEC = float(os.getenv("ARCHIVE_BYTES_PER_SEC", 0))    # 0 で無制限（rename は実質 0 バイト）
+CHECKPOINT_FILES = 100
+
+
+class Journal:
+    """JSON Lines のジャーナル。正常に終わったら消える
+
+    {"start": ..., "planned": N}   実行開始
+    {"copy": name, "src": ..., "dest": ...}  別ファイルシステムへのコピー開始（rename は原子的なので書かない）
+    {"moved": n}                   CHECKPOINT_FILES 件ごとの進み具合
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.f = None
+
+    def recover(self) -> Optional[dict]:
+        """前回が途中で終わっていれば、書きかけのコピーを消して前回の状況を返す"""
+        lines = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        lines.append(json.loads(line))
+                    except ValueError:
+                        break       # 書き込み途中で落ちた最後の行
+        except FileNotFoundError:
+            return None
+        state = {"planned": 0, "moved": 0, "removed_partial": 0}
+        copying = None
+        for entry in lines:
+            if "start" in entry:
+                state["planned"] = entry.get("planned", 0)
+            elif "copy" in entry:
+                copying = entry
+            elif "moved" in entry:
+                state["moved"] = entry["moved"]
+        if copying:
+            # 元は残っているので、書きかけの .part だけ消せば次の移動でやり直せる
+            dest = Path(copying["dest"])
+            part = dest.with_name(f".{dest.name}.part")
+            if part.exists():
+                part.unlink()
+                state["removed_partial"] += 1
+        self.path.unlink()
+        return state
+
+    def open(self, **start):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.f = open(self.path, "a")
+        self.write(start=time.time(), **start)
+
+    def write(self, **entry):
+        self.f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        if self.f:
+            self.f.close()
+            self.f = None
+
+    def finish(self):
+        self.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _copy_move(src: Path, dest: Path, journal: Optional[Journal]):
+    """別ファイルシステムへの移動（.part に書いてから rename、最後に元を消す）"""
+    if journal:
+        journal.write(copy=src.name, src=str(src), dest=str(dest))
+    part = dest.with_name(f".{dest.name}.part")
+    shutil.copy2(src, part)
+    with open(part, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(part, dest)
+    src.unlink()
+
+
+def archive(src_dir: Path = SRC_DIR, dest_dir: Path = DEST_DIR,
+            day: Optional[date] = None, journal_path: Optional[Path] = JOURNAL_PATH,
+            files_per_sec: float = FILES_PER_SEC, bytes_per_sec: float = BYTES_PER_SEC,
+            dry_run: bool = False,
+            catalog_path: Optional[Path] = None) -> dict:
+    """day の画像（None なら今日より前の全部）を dest_dir/YYYY-MM-DD/ へ移す。集計を返す
+
+    移した先のパスは CHECKPOINT_FILES 件ごとにまとめてフレーム台帳へ書く（catalog_path が None なら frame_catalog.DB_PATH）。
+    """
+    src_dir, dest_dir = Path(src_dir), Path(dest_dir)
+    t0 = time.monotonic()
+    stats = {"moved": 0, "copied": 0, "failed": 0, "bytes": 0, "days": Counter(),
+             "waited": 0.0, "resumed": None}
+
+    journal = Journal(journal_path) if journal_path and not dry_run else None
+    if journal:
+        stats["resumed"] = journal.recover()
+
+    if day is not None:
+        start, end = frame_index.day_window(day)
+    else:
+        start, end = None, datetime.combine(date.today(), datetime.min.time())
+    frames = frame_index.list_frames(str(src_dir), start, end)
+    if not frames:
+        stats["elapsed"] = time.monotonic() - t0
+        return stats
+
+    files_bucket = TokenBucket(files_per_sec, burst=max(files_per_sec, 1))
+    bytes_bucket = TokenBucket(bytes_per_sec, burst=max(bytes_per_sec, 1)) \
+        if bytes_per_sec and bytes_per_sec > 0 else None
+    if journal:
+        journal.open(planned=len(frames))
+    made_dirs = set()
+    moves = []
+    try:
+        for fr in frames:
+            src = Path(fr.path)
+            day_name = datetime.fromtimestamp(fr.ts).strftime("%Y-%m-%d")
+            dest = dest_dir / day_name / src.name
+            if dry_run:
+                stats["moved"] += 1
+                stats["bytes"] += os.path.getsize(src)
+                stats["days"][day_name] += 1
+                continue
+            stats["waited"] += files_bucket.acquire()
+            try:
+                size = src.stat().st_size
+                if bytes_bucket:
+                    stats["waited"] += bytes_bucket.acquire(size)
+                if dest.parent not in made_dirs:
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                    made_dirs.add(dest.parent)
+                try:
+                    os.rename(src, dest)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    _copy_move(src, dest, journal)
+                    stats["copied"] += 1
+            except OSError as e:
+                logging.error(f"移動失敗: {src} → {dest}: {e}")
+                stats["failed"] += 1
+                continue
+            stats["moved"] += 1
+            stats["bytes"] += size
+            stats["days"][day_name] += 1
+            moves.append((str(src), str(dest)))
+            if stats["moved"] % CHECKPOINT_FILES == 0:
+                if journal:
+                    journal.write(moved=stats["moved"])
+                frame_catalog.record("mark_archived", moves, path=catalog_path)
+                moves = []
+    except BaseException:
+        # 中断されたときはジャーナルを残し、次回の recover() で片付ける
+        if journal:
+            journal.close()
+        raise
+    finally:
+        if moves and not dry_run:
+            frame_catalog.record("mark_archived", moves, path=catalog_path)
+    if journal:
+        journal.finish()
+
+    if not dry_run:
+        _remove_empty_dirs(src_dir)
+    stats["elapsed"] = time.monotonic() - t0
+    return stats
+
+
+def _remove_empty_dirs(root: Path):
+    """find -type d -empty -delete 相当（root 自体は残す）"""
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        if Path(dirpath) == root or filenames:
+            continue
+        try:
+            os.rmdir(dirpath)
+        except OSError:
+            pass
+
+
+def summary(stats: dict, dry_run: bool = False) -> str:
+    days = ", ".join(f"{d}: {n}" for d, n in sorted(stats["days"].items())) or "なし"
+    head = "🧪 [dry-run] 移動予定" if dry_run else "📦 archived へ移動"
+    line = (f"{head} {stats['moved']} 件（{days}）/ {stats['bytes'] / 1024 / 1024:.0f} MB"
+            f" / {stats['elapsed']:.1f} 秒（待ち {stats['waited']:.1f} 秒）")
+    if stats["copied"]:
+        line += f" / コピーで移動 {stats['copied']} 件"
+    if stats["failed"]:
+        line += f" / ❌ 失敗 {stats['failed']} 件"
+    return line
+
+
+def main():
+    p = argparse.ArgumentParser(description="images/ の前日以前の画像を archived/ へ移動する")
+    p.add_argument("--day", type=date.fromisoformat, help="対象日（既定: 今日より前の全部）")
+    p.add_argument("--src", type=Path, default=SRC_DIR)
+    p.add_argument("--dest", type=Path, default=DEST_DIR)
+    p.add_argument("--files-per-sec", type=float, default=FILES_PER_SEC, help="0 で無制限")
+    p.add_argument("--bytes-per-sec", type=float, default=BYTES_PER_SEC, help="0 で無制限")
+    p.add_argument("--dry-run", action="store_true", help="移動せずに対象件数だけ出す")
+    a = p.parse_args()
+
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if not a.dry_run:
+        LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        handlers.append(logging.FileHandler(LOG_PATH))
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(message)s", handlers=handlers)
+
+    # cron の起動が重なったら後から来た方は何もしない
+    JOURNAL_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(JOURNAL_PATH.with_suffix(".lock"), "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        stats = archive(a.src, a.dest, a.day, files_per_sec=a.files_per_sec,
+                        bytes_per_sec=a.bytes_per_sec, dry_run=a.dry_run)
+
+    resumed = stats["resumed"]
+    if resumed:
+        logging.warning(f"⚠️ 前回の移動が途中で終わっていました（予定 {resumed['planned']} 件中 "
+                        f"{resumed['moved']} 件以上済み、書きかけ {resumed['removed_partial']} 件を削除）。続きから移動します")
+    if stats["moved"] or stats["failed"]:
+        logging.info(summary(stats, a.dry_run))
+    if stats["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
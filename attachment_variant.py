@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+attachment_variant.py — Slack 添付用の縮小 JPEG を作ってキャッシュする
+
+撮影画像（2304x1296 q90）をそのまま送ると数百 KB になるので、プレビューには長辺 max_px の縮小版を送る。
+縮小は PIL の draft()（JPEG の DCT 係数の段階で 1/2・1/4・1/8 に落としてデコード）で行い、
+フル解像度でのデコードはしない。最後に残った分だけ通常の縮小をかける。
+
+作った縮小版は cache/attachments/ に (デバイス, inode, mtime, サイズ, 指定) をキーに保存し、同じ画像なら再利用する。
+パスをキーにしないのは、notify_queue が通知ごとに別のパス（spool/notify/files/<id>/）へハードリンクして
+送るため。ハードリンクは inode を共有するので、同じ撮影画像なら何度送っても同じ縮小版に当たる。
+"""
+
+import hashlib
+import io
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+BASE_DIR = Path(__file__).resolve().parent
+CACHE_DIR = BASE_DIR / "cache" / "attachments"
+CACHE_MAX_FILES = 200
+QUALITY_STEPS = (85, 75, 65, 55, 45)
+MIN_PX = 320
+
+
+def _cache_path(src: str, st: os.stat_result, max_px: Optional[int],
+                max_bytes: Optional[int]) -> Path:
+    key = f"{st.st_dev}|{st.st_ino}|{st.st_mtime_ns}|{st.st_size}|{max_px}|{max_bytes}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return CACHE_DIR / f"{Path(src).stem}_{digest}.jpg"
+
+
+def _encode(img, quality: int) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def _shrink(src: str, max_px: int):
+    from PIL import Image
+    img = Image.open(src)
+    # draft は要求サイズ以上を保つ最小の 1/2^n スケールでデコードする（JPEG のみ有効）
+    scale = max(img.size) / max_px
+    img.draft("RGB", (int(img.size[0] / scale), int(img.size[1] / scale)))
+    img = img.convert("RGB")
+    if max(img.size) > max_px:
+        img.thumbnail((max_px, max_px), Image.BILINEAR)
+    return img
+
+
+def make_variant(src: str, max_px: Optional[int] = None,
+                 max_bytes: Optional[int] = None) -> bytes:
+    """長辺 max_px 以下・max_bytes 以下（できる範囲で）の JPEG バイト列"""
+    from PIL import Image
+    with Image.open(src) as probe:
+        long_side = max(probe.size)
+    px = min(max_px or long_side, long_side)
+    size = os.path.getsize(src)
+    if max_bytes and size > max_bytes:
+        # バイト数はおおよそ画素数に比例するので、最初から見当をつけた大きさで始める
+        px = min(px, int(long_side * (max_bytes / size) ** 0.5 * 1.3))
+    while True:
+        img = _shrink(src, px)
+        for q in QUALITY_STEPS:
+            data = _encode(img, q)
+            if max_bytes is None or len(data) <= max_bytes:
+                return data
+        if px <= MIN_PX:
+            # これ以上小さくしても読めないので、予算超過のまま一番小さいものを使う
+            return data
+        px = max(MIN_PX, int(px * 0.75))
+
+
+def _prune():
+    try:
+        files = sorted(CACHE_DIR.glob("*.jpg"), key=lambda p: p.stat().st_mtime)
+    except OSError:
+        return
+    for p in files[:-CACHE_MAX_FILES]:
+        try:
+            p.unlink()
+        except OSError:
+            pass
+
+
+def variant(src: str, max_px: Optional[int] = None,
+            max_bytes: Optional[int] = None) -> str:
+    """送信用ファイルのパス。指定がない・元ファイルが既に収まっている・JPEG でないときは元のまま"""
+    if not max_px and not max_bytes:
+        return src
+    if Path(src).suffix.lower() not in (".jpg", ".jpeg"):
+        return src
+    st = os.stat(src)
+    if max_bytes and st.st_size <= max_bytes and not max_px:
+        return src
+    cached = _cache_path(src, st, max_px, max_bytes)
+    if cached.exists():
+        os.utime(cached)      # 最近使ったものを残す
+        return str(cached)
+    try:
+        data = make_variant(src, max_px, max_bytes)
+    except Exception as e:
+        logging.warning(f"[添付] 縮小版の作成に失敗（元画像を送信）: {e}")
+        return src
+    if len(data) >= st.st_size:
+        return src
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = cached.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, cached)
+    _prune()
+    return str(cached)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+bench_dir_size.py — dir_size.DirSizeCache と `du -s` の比較
+
+archived/YYYY-MM-DD/ x 50日 + images/ の合成ツリー（既定 70,000 ファイル）を作り、
+du・初回（キャッシュなし）・2回目（変更なし）・今日の画像を追加した後 の時間と値を比べる。
+
+    python3 benchmarks/bench_dir_size.py --files 70000
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dir_size import DirSizeCache  # noqa: E402
+
+
+def build_tree(root: Path, files: int, days: int):
+    per_day = files // (days + 1)
+    today = date.today()
+    for d in range(days, 0, -1):
+        day = today - timedelta(days=d)
+        day_dir = root / "archived" / day.isoformat()
+        day_dir.mkdir(parents=True)
+        for i in range(per_day):
+            (day_dir / f"{day:%Y%m%d}_{i:06d}.jpg").write_bytes(b"\xff")
+    images = root / "images"
+    images.mkdir()
+    for i in range(per_day):
+        (images / f"{today:%Y%m%d}_{i:06d}.jpg").write_bytes(b"\xff")
+
+
+def du_kb(path: Path) -> int:
+    out = subprocess.check_output(["du", "-s", "--block-size=1K", str(path)], text=True)
+    return int(out.split()[0])
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    value = fn()
+    return value, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    p = argparse.ArgumentParser(description="dir_size と du の比較")
+    p.add_argument("--files", type=int, default=70000)
+    p.add_argument("--days", type=int, default=50)
+    a = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        print(f"合成ツリー作成中: {a.files} files ...", flush=True)
+        build_tree(root, a.files, a.days)
+        cache_path = root / "dir_size.json"
+        targets = [root / "images", root / "archived"]
+
+        def run_cache():
+            cache = DirSizeCache(cache_path)
+            values = [cache.size_kb(str(t)) for t in targets]
+            cache.save()
+            return values, cache.rescanned
+
+        def run_du():
+            return [du_kb(t) for t in targets]
+
+        du_vals, du_ms = timed(run_du)
+        print(f"du -s            : {du_ms:8.1f} ms  {du_vals}")
+        (vals, n), ms = timed(run_cache)
+        print(f"cache (初回)     : {ms:8.1f} ms  {vals}  rescanned={n}")
+        (vals, n), ms = timed(run_cache)
+        print(f"cache (変更なし) : {ms:8.1f} ms  {vals}  rescanned={n}")
+        for i in range(60):
+            (root / "images" / f"{date.today():%Y%m%d}_new{i:03d}.jpg").write_bytes(b"\xff")
+        du_vals, du_ms = timed(run_du)
+        (vals, n), ms = timed(run_cache)
+        print(f"du -s (追加後)   : {du_ms:8.1f} ms  {du_vals}")
+        print(f"cache (追加後)   : {ms:8.1f} ms  {vals}  rescanned={n}")
+        print("一致" if vals == du_vals else "不一致!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+bench_frame_catalog.py — frame_catalog（SQLite 台帳）とファイルシステムをたどる方法の比較
+
+archived/YYYY-MM-DD/ x 48日 + images/（既定 70,000 フレーム、1分間隔）と brightness CSV を作り、
+rebuild の時間と、「直近1時間の枚数」「前日の枚数」「最新フレーム」「その日の未送信」を
+frame_index / CSV 末尾 と台帳で比べる。
+
+    python3 benchmarks/bench_frame_catalog.py --files 70000
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import frame_index  # noqa: E402
+from frame_catalog import FrameCatalog  # noqa: E402
+
+
+def build_tree(root: Path, files: int) -> datetime:
+    """1分間隔のフレームを今から files 分さかのぼって作る。最新の撮影時刻を返す"""
+    now = datetime.now().replace(second=0, microsecond=0)
+    today = now.date()
+    log_dir = root / "log"
+    log_dir.mkdir()
+    csvs = {}
+    for i in range(files, 0, -1):
+        t = now - timedelta(minutes=i - 1)
+        if t.date() == today:
+            d = root / "images"
+        else:
+            d = root / "archived" / t.date().isoformat()
+        if not d.exists():
+            d.mkdir(parents=True)
+        path = d / f"{t:%Y%m%d_%H%M%S}.jpg"
+        path.write_bytes(b"\xff")
+        f = csvs.get(t.strftime("%Y-%m"))
+        if f is None:
+            f = csvs[t.strftime("%Y-%m")] = open(log_dir / f"brightness_{t:%Y-%m}.csv", "a")
+        f.write(f"{t:%Y-%m-%d %H:%M:%S},indoor,auto,midday,auto,auto,{path},0.3,0\n")
+    for f in csvs.values():
+        f.close()
+    return now
+
+
+def timed(fn, repeat: int = 1):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        value = fn()
+    return value, (time.perf_counter() - t0) * 1000 / repeat
+
+
+def main():
+    p = argparse.ArgumentParser(description="フレーム台帳とファイルシステム走査の比較")
+    p.add_argument("--files", type=int, default=70000)
+    p.add_argument("--repeat", type=int, default=20)
+    a = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        print(f"合成ツリー作成中: {a.files} frames ...", flush=True)
+        build_tree(root, a.files)
+        images, archived = str(root / "images"), str(root / "archived")
+        yesterday = date.today() - timedelta(days=1)
+        y_start, y_end = frame_index.day_window(yesterday)
+
+        cat = FrameCatalog(root / "log" / "frames.db")
+        r, ms = timed(lambda: cat.rebuild(root / "images", root / "archived", root / "log", None))
+        print(f"rebuild (初回)          : {ms:8.1f} ms  {r['frames']} frames")
+        r, ms = timed(lambda: cat.rebuild(root / "images", root / "archived", root / "log", None))
+        print(f"rebuild (2回目)         : {ms:8.1f} ms  {r['frames']} frames")
+
+        rows = [
+            ("直近1時間の枚数",
+             lambda: frame_index.count_recent(images, 3600),
+             lambda: cat.count(datetime.fromtimestamp(time.time() - 3600))),
+            ("前日の枚数",
+             lambda: frame_index.count_frames(archived, y_start, y_end),
+             lambda: cat.count(y_start, y_end, archived=True)),
+            ("最新フレーム",
+             lambda: Path(frame_index.list_frames(images)[-1].path).name,
+             lambda: cat.latest().name),
+            ("前日の未送信",
+             lambda: len(frame_index.list_frames(archived, y_start, y_end)),
+             lambda: len(cat.unsynced(yesterday))),
+        ]
+        for label, fs, db in rows:
+            v_fs, ms_fs = timed(fs, a.repeat)
+            v_db, ms_db = timed(db, a.repeat)
+            mark = "" if v_fs == v_db else "  不一致!"
+            print(f"{label:<12}: fs {ms_fs:8.2f} ms / 台帳 {ms_db:6.2f} ms  ({v_db}){mark}")
+        cat.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+bench_hotpaths.py — 履歴の長さで重くなる監視・レポート処理の計測（1 / 30 / 365 日分）
+
+gen_fixtures.py で N 日分の合成データを作り、各モジュールのパス定数をそこへ向けてから
+次の処理を計測する。Slack へは送らない（notify_queue のスプールを合成データ側に置き、
+flusher は起動しない）。
+
+    monitor.run_daily_summary        system_log.csv（→ system_metrics.db）の大きさ
+    alert.parse_latest_csv_entry     月の brightness CSV の大きさ
+    report.analyze_trend             同上
+    monitor.dir_size_kb              archived/ の大きさ
+    monitor.count_recent_images      images/ の大きさ
+    plot_mean                        CSV と描く期間の両方
+
+cold は合成データを作った直後（キャッシュなし）の1回目、warm はその後 --repeat 回の中央値。
+結果は JSON に書き、--compare で前回の JSON と比べて warm が --tolerance 倍を超えて遅くなったら終了コード 1。
+
+    python3 benchmarks/bench_hotpaths.py
+    python3 benchmarks/bench_hotpaths.py --days 1 30 --frames-per-day 288
+    python3 benchmarks/bench_hotpaths.py --compare log/bench/hotpaths_20261001_120000.json
+"""
+
+import argparse
+import io
+import json
+import logging
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+# monitor は import 時に本番の log/monitor.log へ書くハンドラを付けるので、先にログの出先を
+# 標準エラーに決めておく（basicConfig は2回目以降何もしない）。計測中の警告を本番ログに混ぜない
+logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s", stream=sys.stderr)
+import alert_check_and_notify  # noqa: E402
+import brightness_cache  # noqa: E402
+import csv_tail  # noqa: E402
+import dir_size  # noqa: E402
+import frame_catalog  # noqa: E402
+import monitor  # noqa: E402
+import notify_queue  # noqa: E402
+import plot_mean  # noqa: E402
+import send_report_to_slack  # noqa: E402
+from gen_fixtures import FRAMES_PER_DAY, generate  # noqa: E402
+
+RESULT_DIR = ROOT / "log" / "bench"
+TOLERANCE = 1.5
+MIN_DELTA_MS = 1.0      # これより小さい差は計測の揺れとみなす
+
+
+@contextmanager
+def patched(targets: List[tuple]):
+    """[(モジュール, 名前, 値)] を差し替え、抜けるときに戻す"""
+    saved = [(obj, name, getattr(obj, name)) for obj, name, _ in targets]
+    try:
+        for obj, name, value in targets:
+            setattr(obj, name, value)
+        yield
+    finally:
+        for obj, name, value in saved:
+            setattr(obj, name, value)
+
+
+def fixture_targets(root: Path, sent: List[float]) -> List[tuple]:
+    csv_path = str(root / "log" / f"brightness_{datetime.now():%Y-%m}.csv")
+    return [
+        (monitor, "ROOT", root),
+        (monitor, "DISK_PATHS", {"images": str(root / "images"),
+                                 "archived": str(root / "archived")}),
+        (monitor, "PARTITION_ROOT", str(root)),
+        (monitor, "CSV_PATH", root / "log" / "system_log.csv"),
+        (monitor, "DB_PATH", root / "log" / "system_metrics.db"),
+        (frame_catalog, "DB_PATH", root / "log" / "frames.db"),
+        (dir_size, "CACHE_PATH", root / "cache" / "dir_size.json"),
+        (csv_tail, "CACHE_DIR", root / "cache"),
+        (brightness_cache, "CACHE_DIR", root / "cache" / "brightness"),
+        (plot_mean, "LOG_DIR", str(root / "log")),
+        (alert_check_and_notify, "CSV_PATH", csv_path),
+        (send_report_to_slack, "CSV_PATH", csv_path),
+        # Slack スタブ: キューには積むが、送信する flusher は起動しない
+        (notify_queue, "SPOOL_DIR", root / "spool" / "notify"),
+        (notify_queue, "STATE_PATH", root / "log" / "alert_state.json"),
+        (notify_queue, "spawn_flusher", lambda: sent.append(time.time())),
+    ]
+
+
+def hot_paths(root: Path, days: int) -> Dict[str, Callable]:
+    yesterday = date.today() - timedelta(days=1)
+    plot_out = str(root / "log" / "brightness_plot.png")
+    return {
+        "monitor.run_daily_summary": lambda: monitor.run_daily_summary(yesterday),
+        "alert.parse_latest_csv_entry": alert_check_and_notify.parse_latest_csv_entry,
+        "report.analyze_trend": send_report_to_slack.analyze_trend,
+        "monitor.dir_size_kb": lambda: monitor.dir_size_kb(str(root / "archived")),
+        "monitor.count_recent_images": lambda: monitor.count_recent_images(
+            str(root / "images"), 3600),
+        "plot_mean": lambda: plot_mean.main(["--days", str(days), "--out", plot_out]),
+    }
+
+
+def measure(fn: Callable, repeat: int) -> dict:
+    # plot_mean などの print は捨てる（計測結果の表示と混ざるので）
+    with redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        fn()
+        cold = (time.perf_counter() - t0) * 1000
+        warm = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            warm.append((time.perf_counter() - t0) * 1000)
+    return {"cold_ms": round(cold, 3), "warm_ms": round(statistics.median(warm), 3),
+            "min_ms": round(min(warm), 3)}
+
+
+def reset_caches(root: Path):
+    """前回の計測で作られたキャッシュ・ストアを消して cold から測れるようにする"""
+    shutil.rmtree(root / "cache", ignore_errors=True)
+    shutil.rmtree(root / "spool", ignore_errors=True)
+    for p in (root / "log").glob("system_metrics.db*"):
+        p.unlink()
+
+
+def run(days: int, base: Path, frames_per_day: int, repeat: int) -> dict:
+    root = base / f"days_{days}_{frames_per_day}"
+    meta_path = root / "fixture.json"
+    try:
+        with open(meta_path) as f:
+            fixture = json.load(f)
+    except (OSError, ValueError):
+        fixture = {}
+    # 合成データは「今日」基準なので、作った日が違えば作り直す
+    if fixture.get("date") != date.today().isoformat():
+        shutil.rmtree(root, ignore_errors=True)
+        print(f"合成データ作成中: {days} 日 x {frames_per_day} フレーム ...", flush=True)
+        fixture = generate(root, days, frames_per_day)
+        fixture["date"] = date.today().isoformat()
+        with open(meta_path, "w") as f:
+            json.dump(fixture, f)
+    reset_caches(root)
+    sent: List[float] = []
+    results = {}
+    with patched(fixture_targets(root, sent)):
+        for name, fn in hot_paths(root, days).items():
+            results[name] = measure(fn, repeat)
+            r = results[name]
+            print(f"  {days:>3} 日 {name:<30} cold {r['cold_ms']:9.1f} ms"
+                  f" / warm {r['warm_ms']:9.1f} ms", flush=True)
+    return {"fixture": fixture, "paths": results, "notifications": len(sent)}
+
+
+def git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(new: dict, old: dict, tolerance: float) -> List[str]:
+    """warm が tolerance 倍（かつ MIN_DELTA_MS）を超えて遅くなったもの"""
+    regressions = []
+    for days, res in new["results"].items():
+        old_paths = old.get("results", {}).get(days, {}).get("paths", {})
+        for name, r in res["paths"].items():
+            o = old_paths.get(name)
+            if not o:
+                continue
+            ratio = r["warm_ms"] / o["warm_ms"] if o["warm_ms"] else float("inf")
+            mark = ""
+            if ratio > tolerance and r["warm_ms"] - o["warm_ms"] > MIN_DELTA_MS:
+                mark = "  ❌ 遅くなった"
+                regressions.append(f"{days} 日 {name}")
+            print(f"  {days:>3} 日 {name:<30} {o['warm_ms']:9.1f} → {r['warm_ms']:9.1f} ms"
+                  f" (x{ratio:.2f}){mark}")
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser(description="監視・レポート処理の計測（合成データ、Slack スタブ）")
+    p.add_argument("--days", type=int, nargs="+", default=[1, 30, 365])
+    p.add_argument("--frames-per-day", type=int, default=FRAMES_PER_DAY)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--fixtures", type=Path,
+                   help="合成データの置き場所（指定すると残して次回も使う。既定: 一時ディレクトリ）")
+    p.add_argument("--json", type=Path, help=f"結果の出力先（既定 {RESULT_DIR}/hotpaths_<日時>.json）")
+    p.add_argument("--compare", type=Path, help="前回の結果 JSON と比べる")
+    p.add_argument("--tolerance", type=float, default=TOLERANCE)
+    a = p.parse_args()
+    # 計測する処理の INFO ログは出さない（警告・エラーは出す）
+    logging.disable(logging.INFO)
+
+    report = {
+        "meta": {"created": datetime.now().isoformat(timespec="seconds"),
+                 "host": platform.node(), "machine": platform.machine(),
+                 "python": platform.python_version(), "git": git_rev(),
+                 "frames_per_day": a.frames_per_day, "repeat": a.repeat},
+        "results": {},
+    }
+    tmp = None
+    base = a.fixtures
+    if base is None:
+        tmp = tempfile.TemporaryDirectory(prefix="bench_hotpaths_")
+        base = Path(tmp.name)
+    try:
+        for days in a.days:
+            report["results"][str(days)] = run(days, base, a.frames_per_day, a.repeat)
+    finally:
+        if tmp:
+            tmp.cleanup()
+
+    out = a.json or RESULT_DIR / f"hotpaths_{datetime.now():%Y%m%d_%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"結果: {out}")
+
+    if a.compare:
+        with open(a.compare) as f:
+            old = json.load(f)
+        print(f"比較: {a.compare}（{old['meta'].get('git')} → {report['meta']['git']}）")
+        regressions = compare(report, old, a.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} 件が {a.tolerance:g} 倍を超えて遅くなりました")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+bench_mjpeg_clients.py — mjpeg_server の threaded / asyncio エンジン比較
+
+ダミーカメラ (--fake-camera) でサーバーを起動し、N 本のクライアントで
+/stream.mjpg を受信し続けたときのサーバープロセスの RSS・スレッド数・CPU 使用率を測る。
+
+    python3 benchmarks/bench_mjpeg_clients.py --clients 1 5 20 --duration 20
+"""
+
+import argparse
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+BOUNDARY = b"--FRAME\r\n"
+
+
+def proc_status(pid: int) -> dict:
+    info = {}
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        key, _, value = line.partition(":")
+        info[key] = value.strip()
+    return info
+
+
+def proc_cpu_sec(pid: int) -> float:
+    fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    # utime, stime は comm 以降の 12, 13 番目
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK
+
+
+def wait_port(port: int, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"サーバーが起動しません (port {port})")
+
+
+def run_clients(port: int, n: int, duration: float, proc: subprocess.Popen) -> dict:
+    sel = selectors.DefaultSelector()
+    frames = {}
+    for _ in range(n):
+        s = socket.create_connection(("127.0.0.1", port))
+        s.sendall(b"GET /stream.mjpg HTTP/1.1\r\nHost: bench\r\n\r\n")
+        s.setblocking(False)
+        sel.register(s, selectors.EVENT_READ)
+        frames[s] = [0, b""]
+
+    def pump(until: float, sample: bool) -> int:
+        rss_peak = 0
+        next_sample = time.monotonic()
+        while time.monotonic() < until:
+            for key, _ in sel.select(timeout=0.1):
+                s = key.fileobj
+                try:
+                    data = s.recv(1 << 16)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    sel.unregister(s)
+                    continue
+                # 境界文字列がチャンクをまたいでも数え漏れ・二重計上しないよう末尾だけ残す
+                tail = frames[s][1] + data
+                frames[s][0] += tail.count(BOUNDARY)
+                frames[s][1] = tail[-(len(BOUNDARY) - 1):]
+            if sample and time.monotonic() >= next_sample:
+                rss_kb = int(proc_status(proc.pid)["VmRSS"].split()[0])
+                rss_peak = max(rss_peak, rss_kb)
+                next_sample += 0.5
+        return rss_peak
+
+    # 接続が落ち着くまで読み捨ててから計測開始
+    pump(time.monotonic() + 2.0, sample=False)
+    for v in frames.values():
+        v[0] = 0
+    cpu0, t0 = proc_cpu_sec(proc.pid), time.monotonic()
+    rss_peak = pump(t0 + duration, sample=True)
+    elapsed = time.monotonic() - t0
+    cpu = proc_cpu_sec(proc.pid) - cpu0
+    status = proc_status(proc.pid)
+    for s in frames:
+        s.close()
+    received = [v[0] for v in frames.values()]
+    return {
+        "clients": n,
+        "rss_kb": rss_peak,
+        "threads": int(status["Threads"]),
+        "cpu_pct": cpu / elapsed * 100,
+        "fps_min": min(received) / elapsed,
+        "fps_avg": sum(received) / len(received) / elapsed,
+    }
+
+
+def bench(engine: str, clients: int, duration: float, port: int) -> dict:
+    proc = subprocess.Popen(
+        [sys.executable, str(ROOT / "mjpeg_server.py"), "--fake-camera",
+         "--engine", engine, "--port", str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_port(port)
+        result = run_clients(port, clients, duration, proc)
+    finally:
+        proc.terminate()
+        proc.wait()
+    result["engine"] = engine
+    return result
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    p.add_argument("--engines", nargs="+", default=["threaded", "asyncio"])
+    p.add_argument("--clients", nargs="+", type=int, default=[1, 5, 20])
+    p.add_argument("--duration", type=float, default=20.0)
+    p.add_argument("--port", type=int, default=18000)
+    a = p.parse_args()
+
+    print("| engine | clients | RSS (MB) | threads | CPU % | fps min/avg |")
+    print("|---|---:|---:|---:|---:|---:|")
+    for engine in a.engines:
+        for n in a.clients:
+            r = bench(engine, n, a.duration, a.port)
+            print(f"| {r['engine']} | {r['clients']} | {r['rss_kb'] / 1024:.1f} "
+                  f"| {r['threads']} | {r['cpu_pct']:.1f} "
+                  f"| {r['fps_min']:.1f} / {r['fps_avg']:.1f} |", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+bench_slack_upload.py — SlackNotifier.send_files（send_files_timed）の逐次 / 並行アップロード比較
+
+ローカルの Slack スタブ（slack_stub.py）に対して、レート制限（429 + Retry-After）と
+アップロード遅延を与えた状態で send_files を実行し、所要時間・1ファイルあたりの遅延・429 の回数を出す。
+結果が入力順に並んでいることも確認する。
+
+    python3 benchmarks/bench_slack_upload.py --files 12 --latency 2 --api-rate 6 --upload-rate 3
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import slack_notifier  # noqa: E402
+from rate_limit import TokenBucket  # noqa: E402
+from slack_stub import SlackStub  # noqa: E402
+
+
+def run(files, workers: int, a) -> dict:
+    stub = SlackStub(rate=a.api_rate, latency=a.latency, retry_after=a.retry_after).start()
+    try:
+        notifier = slack_notifier.SlackNotifier(
+            "xoxb-bench", "bench@example.com", base_url=stub.base_url)
+        notifier.upload_bucket = TokenBucket(a.upload_rate, burst=workers)
+        t0 = time.monotonic()
+        results = notifier.send_files_timed([str(f) for f in files], title_template="bench",
+                                            max_workers=workers)
+        elapsed = time.monotonic() - t0
+    finally:
+        stub.stop()
+    latencies = [r.latency for r in results]
+    return {
+        "elapsed": elapsed,
+        "ok": sum(r.success for r in results),
+        "ordered": [r.path for r in results] == [str(f) for f in files],
+        "p50": statistics.median(latencies),
+        "max": max(latencies),
+        "limited": stub.rate_limited,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="send_files の逐次 / 並行比較（Slack スタブ使用）")
+    p.add_argument("--files", type=int, default=20)
+    p.add_argument("--size-kb", type=int, default=200)
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    p.add_argument("--latency", type=float, default=0.8, help="スタブのアップロード遅延（秒）")
+    p.add_argument("--api-rate", type=float, default=3, help="スタブの API 呼び出し上限（回/秒）")
+    p.add_argument("--retry-after", type=int, default=1)
+    p.add_argument("--upload-rate", type=float, default=slack_notifier.UPLOAD_RATE_PER_SEC,
+                   help="クライアント側のアップロード開始レート（ファイル/秒）")
+    a = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        slack_notifier.SlackNotifier.USER_ID_CACHE_DIR = Path(tmp) / "cache"
+        files = []
+        for i in range(a.files):
+            f = Path(tmp) / f"20250101_{i:06d}.jpg"
+            f.write_bytes(b"\xff" * (a.size_kb * 1024))
+            files.append(f)
+
+        print(f"{'workers':>7} {'time (s)':>9} {'ok':>5} {'p50 (s)':>8} {'max (s)':>8} {'429':>5} 順序")
+        for workers in a.workers:
+            r = run(files, workers, a)
+            print(f"{workers:>7} {r['elapsed']:9.1f} {r['ok']:>2}/{a.files:<2} "
+                  f"{r['p50']:8.2f} {r['max']:8.2f} {r['limited']:>5} "
+                  f"{'OK' if r['ordered'] else 'NG'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+bench_startup.py — cron / systemd から起動されるスクリプトの起動コスト計測
+
+各スクリプトを `python3 -X importtime -c "import <module>"` で読み込み、
+モジュール自身の累積 import 時間と、直接 import しているモジュールの内訳を出す。
+startup_budget.json の予算（ミリ秒）を超えたスクリプトや、
+遅延 import にしたはずの重いモジュール（forbid）が起動時に読み込まれていたら終了コード 1。
+
+    python3 benchmarks/bench_startup.py
+    python3 benchmarks/bench_startup.py --runs 7 --json log/startup.json
+    python3 benchmarks/bench_startup.py --update-budget   # この機械の実測 x2 で予算を書き直す
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+ROOT = Path(__file__).resolve().parent.parent
+BUDGET_PATH = Path(__file__).resolve().parent / "startup_budget.json"
+BUDGET_MARGIN = 2.0
+
+
+class ImportLine(NamedTuple):
+    name: str
+    level: int          # 0 = -c から直接 import されたもの
+    self_us: int
+    cumulative_us: int
+
+
+def parse_importtime(stderr: str) -> List[ImportLine]:
+    lines = []
+    for raw in stderr.splitlines():
+        if not raw.startswith("import time:") or "imported package" in raw:
+            continue
+        # "import time:   self |   cumulative |   <字下げ>name"
+        head, cum_us, name = raw.split("|", 2)
+        self_us = head.split(":", 1)[1]
+        indent = len(name) - len(name.lstrip()) - 1
+        lines.append(ImportLine(name.strip(), indent // 2,
+                                int(self_us), int(cum_us)))
+    return lines
+
+
+def import_once(module: str) -> List[ImportLine]:
+    env = dict(os.environ)
+    # .env が無くても import 時に落ちないことも確認対象
+    env.pop("SLACK_BOT_TOKEN", None)
+    env.pop("SLACK_DM_EMAIL", None)
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=str(ROOT), env=env, capture_output=True, text=True)
+    if r.returncode != 0:
+        tail = r.stderr.strip().splitlines()[-1:] or [""]
+        raise RuntimeError(f"{module} の import に失敗: {tail[0]}")
+    return parse_importtime(r.stderr)
+
+
+def measure(module: str, runs: int) -> dict:
+    import_once(module)   # .pyc を作っておく
+    totals = []
+    breakdown: Dict[str, List[int]] = {}
+    loaded = set()
+    for _ in range(runs):
+        lines = import_once(module)
+        # 出力は子→親の順なので、モジュール自身の行の直前の字下げされた行がその子孫
+        # （それより前は site などインタプリタ起動時の import）
+        top = next(i for i, line in enumerate(lines)
+                   if line.level == 0 and line.name == module)
+        first = top
+        while first > 0 and lines[first - 1].level > 0:
+            first -= 1
+        totals.append(lines[top].cumulative_us)
+        loaded.update(line.name.split(".")[0] for line in lines[first:top])
+        for line in lines[first:top]:
+            if line.level == 1:
+                breakdown.setdefault(line.name, []).append(line.cumulative_us)
+    children = sorted(((name, statistics.median(v) / 1000)
+                       for name, v in breakdown.items()),
+                      key=lambda x: -x[1])
+    return {
+        "import_ms": statistics.median(totals) / 1000,
+        "min_ms": min(totals) / 1000,
+        "children": [{"module": n, "ms": round(ms, 2)} for n, ms in children],
+        "loaded": sorted(loaded),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="エントリポイントの import 時間と予算チェック")
+    p.add_argument("modules", nargs="*", help="既定: startup_budget.json の全スクリプト")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--top", type=int, default=8, help="内訳の表示件数")
+    p.add_argument("--budget", default=str(BUDGET_PATH))
+    p.add_argument("--json", metavar="PATH", help="計測結果を JSON で書き出す")
+    p.add_argument("--update-budget", action="store_true",
+                   help=f"実測 x{BUDGET_MARGIN} で予算を書き直す（forbid はそのまま）")
+    a = p.parse_args()
+
+    budget_path = Path(a.budget)
+    budget = json.loads(budget_path.read_text())
+    modules = a.modules or list(budget)
+
+    results = {}
+    failed = []
+    for module in modules:
+        res = measure(module, a.runs)
+        results[module] = res
+        limit = budget.get(module, {}).get("import_ms")
+        forbid = budget.get(module, {}).get("forbid", [])
+        bad = [m for m in forbid if m in res["loaded"]]
+        over = limit is not None and res["import_ms"] > limit
+        mark = "NG" if over or bad else "OK"
+        limit_str = f"{limit:.0f}" if limit is not None else "-"
+        print(f"[{mark}] {module:<26} {res['import_ms']:7.1f} ms "
+              f"(min {res['min_ms']:.1f}, 予算 {limit_str} ms)")
+        for child in res["children"][:a.top]:
+            print(f"       {child['ms']:7.1f} ms  {child['module']}")
+        if bad:
+            print(f"       起動時に読み込まれている: {', '.join(bad)}")
+        if over or bad:
+            failed.append(module)
+
+    if a.json:
+        Path(a.json).write_text(json.dumps(results, ensure_ascii=False, indent=2))
+
+    if a.update_budget:
+        for module, res in results.items():
+            entry = budget.setdefault(module, {})
+            entry["import_ms"] = round(res["import_ms"] * BUDGET_MARGIN, 1)
+        budget_path.write_text(json.dumps(budget, ensure_ascii=False, indent=2) + "\n")
+        print(f"予算を更新しました: {budget_path}")
+        return
+
+    if failed:
+        print(f"予算超過: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
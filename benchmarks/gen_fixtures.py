@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+gen_fixtures.py — ベンチマーク用の合成データ（本番と同じ配置）を作る
+
+    <root>/images/YYYYMMDD_HHMMSS.jpg            今日の分（今の時刻まで）
+    <root>/archived/YYYY-MM-DD/YYYYMMDD_HHMMSS.jpg  それより前の日
+    <root>/log/brightness_YYYY-MM.csv            capture_daemon.py と同じ列（毎フレーム1行）
+    <root>/log/system_log.csv                    monitor.py と同じ列（SYSTEM_EVERY_MIN 分ごと）
+
+JPEG は先頭の SOI だけ書いて本番と同じ大きさまで truncate した疎ファイルなので、
+ファイル数・ディレクトリ構成は本物どおりでもディスクはほとんど使わない。
+
+    python3 benchmarks/gen_fixtures.py --days 30 --out /tmp/fixtures
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from capture_daemon import MANUAL_GAIN, MANUAL_SHUTTER_US, MANUAL_THRESHOLD, time_info  # noqa: E402
+
+FRAMES_PER_DAY = 1440          # 毎分撮影
+FRAME_BYTES = 1_300_000        # 2304x1296 / 品質 90 の JPEG 程度
+SYSTEM_EVERY_MIN = 10          # monitor.timer の間隔
+JPEG_SOI = b"\xff\xd8\xff\xe0"
+
+
+def brightness(t: datetime, rng: random.Random) -> float:
+    """昼に明るく夜に暗い、室内らしい明るさ（0.0-1.0）"""
+    hour = t.hour + t.minute / 60
+    daylight = max(0.0, math.sin((hour - 6) / 12 * math.pi))
+    return max(0.0, min(1.0, 0.04 + 0.30 * daylight + rng.gauss(0, 0.01)))
+
+
+def brightness_row(t: datetime, path: str, rng: random.Random) -> str:
+    mean = brightness(t, rng)
+    manual = mean >= MANUAL_THRESHOLD
+    shutter, gain, ev = (str(MANUAL_SHUTTER_US), str(MANUAL_GAIN), "n/a") if manual \
+        else ("auto", "auto", "0")
+    regions = ";".join(f"{mean + rng.uniform(-0.03, 0.03):.4f}" for _ in range(9))
+    return (f"{t:%Y-%m-%d %H:%M:%S},indoor,{'manual' if manual else 'auto'},{time_info(t.hour)},"
+            f"{shutter},{gain},{path},{mean:.6f},{ev},0.0000,{0.3 if mean < 0.1 else 0.0:.4f},"
+            f"{regions},{';'.join(['4096'] * 16)},rgb\n")
+
+
+def system_row(t: datetime, day_index: int, frames_per_day: int, rng: random.Random) -> str:
+    archived_kb = day_index * frames_per_day * FRAME_BYTES // 1024
+    images_kb = (t.hour * 60 + t.minute) * frames_per_day // 1440 * FRAME_BYTES // 1024
+    total_kb = 64 * 1024 * 1024           # 64 GB の SD カード
+    temp = 48 + 6 * math.sin(t.hour / 24 * 2 * math.pi) + rng.gauss(0, 0.8)
+    new_img = SYSTEM_EVERY_MIN * frames_per_day // 1440
+    return (f"{t:%Y-%m-%d %H:%M},{images_kb},{archived_kb},{images_kb / total_kb * 100:.1f},"
+            f"{archived_kb / total_kb * 100:.1f},{temp:.1f},{new_img},{new_img},"
+            f"{abs(rng.gauss(0.4, 0.2)):.2f},{rng.uniform(30, 45):.1f}\n")
+
+
+def _sparse_jpeg(path: Path, size: int):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, JPEG_SOI)
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+def generate(root: Path, days: int, frames_per_day: int = FRAMES_PER_DAY,
+             end: Optional[datetime] = None, seed: int = 0) -> dict:
+    """今日を含む days 日分の合成データを root に作る。件数を返す"""
+    rng = random.Random(seed)
+    root = Path(root)
+    end = (end or datetime.now()).replace(microsecond=0)
+    first_day = (end - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0)
+    step = timedelta(seconds=86400 / frames_per_day)
+    log_dir = root / "log"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    (root / "images").mkdir(exist_ok=True)
+    (root / "archived").mkdir(exist_ok=True)
+
+    stats = {"days": days, "frames": 0, "brightness_rows": 0, "system_rows": 0}
+    t0 = time.monotonic()
+    csvs = {}
+    with open(log_dir / "system_log.csv", "w") as sys_csv:
+        for d in range(days):
+            day_start = first_day + timedelta(days=d)
+            is_today = day_start.date() == end.date()
+            day_dir = root / "images" if is_today else root / "archived" / f"{day_start:%Y-%m-%d}"
+            day_dir.mkdir(parents=True, exist_ok=True)
+            month = f"{day_start:%Y-%m}"
+            if month not in csvs:
+                csvs[month] = open(log_dir / f"brightness_{month}.csv", "w")
+            out = csvs[month]
+            rows = []
+            for i in range(frames_per_day):
+                t = day_start + step * i
+                if t > end:
+                    break
+                path = day_dir / f"{t:%Y%m%d_%H%M%S}.jpg"
+                _sparse_jpeg(path, FRAME_BYTES + rng.randrange(-200_000, 200_000))
+                # capture は images/ に撮るので、CSV のパスは移動前のまま
+                rows.append(brightness_row(t, f"{root / 'images'}/{path.name}", rng))
+            out.writelines(rows)
+            stats["frames"] += len(rows)
+            stats["brightness_rows"] += len(rows)
+            for m in range(0, 1440, SYSTEM_EVERY_MIN):
+                t = day_start + timedelta(minutes=m)
+                if t > end:
+                    break
+                sys_csv.write(system_row(t, d, frames_per_day, rng))
+                stats["system_rows"] += 1
+    for f in csvs.values():
+        f.close()
+    stats["elapsed"] = time.monotonic() - t0
+    return stats
+
+
+def main():
+    p = argparse.ArgumentParser(description="ベンチマーク用の合成データを作る")
+    p.add_argument("--days", type=int, default=30)
+    p.add_argument("--frames-per-day", type=int, default=FRAMES_PER_DAY)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", type=Path, required=True)
+    a = p.parse_args()
+    s = generate(a.out, a.days, a.frames_per_day, seed=a.seed)
+    print(f"{a.out}: {s['days']} 日 / フレーム {s['frames']} / system_log {s['system_rows']} 行"
+          f" / {s['elapsed']:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
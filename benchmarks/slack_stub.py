@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+slack_stub.py — SlackNotifier を試すためのローカル Slack API スタブ
+
+files_upload_v2 が使う files.getUploadURLExternal / アップロード先 URL / files.completeUploadExternal と、
+users.lookupByEmail / conversations.open / chat.postMessage だけを返す。
+API 呼び出しを rate 回/秒に絞って超えたら 429 + Retry-After を返し、アップロードには latency 秒の遅延を入れる。
+
+    stub = SlackStub(rate=2, latency=0.5).start()
+    notifier = SlackNotifier("xoxb-test", "me@example.com", base_url=stub.base_url)
+    ...
+    stub.stop()
+
+単体でも起動できる（SlackNotifier(base_url="http://127.0.0.1:8099/api/") で接続）。
+
+    python3 benchmarks/slack_stub.py --port 8099 --rate 2 --latency 0.5
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rate_limit import TokenBucket  # noqa: E402
+
+
+class SlackStub:
+    def __init__(self, port: int = 0, rate: float = 0, latency: float = 0.0,
+                 retry_after: int = 1):
+        self.latency = latency
+        self.retry_after = retry_after
+        # バケットの残高がなければ 429 を返す
+        self._allow = TokenBucket(rate, burst=max(1.0, rate)) if rate > 0 else None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.calls = {}
+        self.rate_limited = 0
+        self.uploaded = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/api/"
+
+    def start(self) -> "SlackStub":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _limited(self) -> bool:
+        return self._allow is not None and not self._allow.try_acquire()
+
+    def _api(self, method: str, params: dict) -> dict:
+        if method == "users.lookupByEmail":
+            return {"ok": True, "user": {"id": "U0STUB"}}
+        if method == "conversations.open":
+            return {"ok": True, "channel": {"id": "D0STUB"}}
+        if method == "chat.postMessage":
+            return {"ok": True, "ts": f"{time.time():.6f}"}
+        if method == "files.getUploadURLExternal":
+            file_id = f"F{next(self._ids):06d}"
+            return {"ok": True, "file_id": file_id,
+                    "upload_url": f"http://127.0.0.1:{self.port}/upload/{file_id}"}
+        if method == "files.completeUploadExternal":
+            files = json.loads(params.get("files", "[]"))
+            return {"ok": True, "files": [{"id": f["id"], "title": f.get("title")}
+                                          for f in files]}
+        return {"ok": False, "error": "unknown_method"}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, body: bytes, headers=None,
+                       content_type="application/json; charset=utf-8"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                data = self.rfile.read(length)
+                if self.path.startswith("/upload/"):
+                    time.sleep(stub.latency)
+                    with stub._lock:
+                        stub.uploaded.append((self.path.rsplit("/", 1)[1], len(data)))
+                    self._reply(200, f"OK - {len(data)}".encode(), content_type="text/plain")
+                    return
+                method = self.path.rsplit("/", 1)[-1]
+                with stub._lock:
+                    stub.calls[method] = stub.calls.get(method, 0) + 1
+                if stub._limited():
+                    with stub._lock:
+                        stub.rate_limited += 1
+                    body = json.dumps({"ok": False, "error": "ratelimited"}).encode()
+                    self._reply(429, body, {"Retry-After": str(stub.retry_after)})
+                    return
+                ctype = self.headers.get("Content-Type", "")
+                if "json" in ctype:
+                    params = json.loads(data or b"{}")
+                else:
+                    params = {k: v[0] for k, v in parse_qs(data.decode()).items()}
+                self._reply(200, json.dumps(stub._api(method, params)).encode())
+
+        return Handler
+
+
+def main():
+    p = argparse.ArgumentParser(description="ローカル Slack API スタブ")
+    p.add_argument("--port", type=int, default=8099)
+    p.add_argument("--rate", type=float, default=0, help="API 呼び出し/秒の上限（0 = 無制限）")
+    p.add_argument("--latency", type=float, default=0.0, help="アップロード1件の遅延（秒）")
+    p.add_argument("--retry-after", type=int, default=1)
+    a = p.parse_args()
+    stub = SlackStub(a.port, a.rate, a.latency, a.retry_after)
+    print(f"Slack スタブ起動: {stub.base_url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+brightness_cache.py — brightness_YYYY-MM.csv の列キャッシュ（NumPy でそのまま読める生バイナリ）
+
+月次 CSV ごとに cache/brightness/<CSV名>/ へ次の列を追記していく。
+
+    ts.i8    int64   撮影時刻（ローカル時刻をそのまま UTC とみなした UNIX 秒。datetime64[s] として読める）
+    mean.f8  float64 明るさ（n/a は NaN）
+    ev.f8    float64 EV（n/a は NaN）
+    mode.i1  int8    0 = auto, 1 = manual, -1 = その他
+    meter.i1 int8    mean の測り方 0 = identify, 1 = rgb, 2 = luma（METERS）
+
+meta.json に CSV の inode・解析済みのバイト位置・行数を持ち、次回は前回位置から EOF までの
+追記分だけを解析する。inode が変わったか CSV が縮んだとき、列の構成（VERSION）が変わったときは作り直す。
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import time
+from array import array
+from calendar import timegm
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from metering import METER_IDENTIFY, METER_LUMA, METER_RGB, row_meter
+
+BASE_DIR = Path(__file__).resolve().parent
+CACHE_DIR = BASE_DIR / "cache" / "brightness"
+LOG_DIR = Path("/home/pi/timelapse-system/log")
+
+# 列名 → (ファイル名, array の型, NumPy の dtype)
+COLUMNS = {
+    "ts": ("ts.i8", "q", "<i8"),
+    "mean": ("mean.f8", "d", "<f8"),
+    "ev": ("ev.f8", "d", "<f8"),
+    "mode": ("mode.i1", "b", "i1"),
+    "meter": ("meter.i1", "b", "i1"),
+}
+VERSION = 2
+MODES = {"auto": 0, "manual": 1}
+NAN = float("nan")
+# meter.i1 の値（metering.row_meter の測り方 → コード）
+METERS = {METER_IDENTIFY: 0, METER_RGB: 1, METER_LUMA: 2}
+
+
+def _cache_dir(csv_path: Path) -> Path:
+    return CACHE_DIR / csv_path.stem
+
+
+def _load_meta(cdir: Path) -> Optional[dict]:
+    try:
+        with open(cdir / "meta.json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_meta(cdir: Path, meta: dict):
+    tmp = cdir / "meta.json.tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, cdir / "meta.json")
+
+
+def _num(s: str) -> float:
+    try:
+        return float(s)
+    except ValueError:
+        return NAN
+
+
+def _epoch(s: str) -> Optional[int]:
+    # "YYYY-MM-DD HH:MM:SS" 固定なので strptime を使わず切り出す（数倍速い）
+    try:
+        if len(s) != 19 or s[4] != "-" or s[13] != ":":
+            raise ValueError(s)
+        return timegm((int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                       int(s[11:13]), int(s[14:16]), int(s[17:19]), 0, 0, 0))
+    except ValueError:
+        return None
+
+
+def _parse(text: str) -> Dict[str, array]:
+    cols = {name: array(code) for name, (_, code, _) in COLUMNS.items()}
+    for row in csv.reader(io.StringIO(text)):
+        if len(row) < 8:
+            continue
+        ts = _epoch(row[0])
+        if ts is None:
+            continue
+        cols["ts"].append(ts)
+        cols["mean"].append(_num(row[7]))
+        cols["ev"].append(_num(row[8]) if len(row) > 8 else NAN)
+        cols["mode"].append(MODES.get(row[2], -1))
+        cols["meter"].append(METERS.get(row_meter(row), -1))
+    return cols
+
+
+def update(csv_path: Path) -> int:
+    """CSV の追記分をキャッシュへ反映する。キャッシュの行数を返す"""
+    csv_path = Path(csv_path)
+    cdir = _cache_dir(csv_path)
+    try:
+        st = os.stat(csv_path)
+    except FileNotFoundError:
+        return 0
+    meta = _load_meta(cdir)
+    if (meta is None or meta.get("version") != VERSION or meta["inode"] != st.st_ino
+            or st.st_size < meta["offset"]):
+        # 作り直し（初回・ファイルの置き換え・切り詰め・列の追加）
+        meta = {"version": VERSION, "inode": st.st_ino, "offset": 0, "rows": 0}
+    if st.st_size == meta["offset"]:
+        return meta["rows"]
+
+    with open(csv_path, "rb") as f:
+        f.seek(meta["offset"])
+        buf = f.read(st.st_size - meta["offset"])
+    end = buf.rfind(b"\n") + 1      # 書きかけの最終行は次回に回す
+    if end == 0:
+        return meta["rows"]
+    cols = _parse(buf[:end].decode("utf-8", errors="replace"))
+
+    cdir.mkdir(parents=True, exist_ok=True)
+    n = meta["rows"]
+    for name, (fname, code, _) in COLUMNS.items():
+        with open(cdir / fname, "r+b" if n and (cdir / fname).exists() else "wb") as f:
+            # meta より先に落ちた前回の書き込みがあれば、その分は捨てて上書きする
+            f.seek(n * cols[name].itemsize)
+            f.truncate()
+            f.write(cols[name].tobytes())
+    meta.update(offset=meta["offset"] + end, rows=n + len(cols["ts"]))
+    _save_meta(cdir, meta)
+    return meta["rows"]
+
+
+def load_file(csv_path: Path, refresh: bool = True):
+    """1つの CSV の列を memmap で返す（{列名: ndarray}、ts は datetime64[s]）"""
+    import numpy as np
+    csv_path = Path(csv_path)
+    if refresh:
+        update(csv_path)
+    cdir = _cache_dir(csv_path)
+    meta = _load_meta(cdir)
+    out = {}
+    for name, (fname, _, dtype) in COLUMNS.items():
+        rows = meta["rows"] if meta else 0
+        if rows == 0:
+            out[name] = np.empty(0, dtype=dtype)
+        else:
+            out[name] = np.memmap(cdir / fname, dtype=dtype, mode="r", shape=(rows,))
+    out["ts"] = out["ts"].view("datetime64[s]")
+    return out
+
+
+def load(csv_paths: Iterable[Path], start=None, end=None, refresh: bool = True):
+    """複数 CSV を連結し start <= ts < end で絞り込む（start / end は datetime か None）"""
+    import numpy as np
+    parts = [load_file(p, refresh) for p in csv_paths if Path(p).exists()]
+    if not parts:
+        return None
+    cols = {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+    mask = np.ones(len(cols["ts"]), dtype=bool)
+    if start is not None:
+        mask &= cols["ts"] >= np.datetime64(start, "s")
+    if end is not None:
+        mask &= cols["ts"] < np.datetime64(end, "s")
+    return {name: v[mask] for name, v in cols.items()}
+
+
+def main():
+    p = argparse.ArgumentParser(description="brightness CSV の列キャッシュを更新する")
+    p.add_argument("csv", nargs="*", help="既定: log/brightness_*.csv すべて")
+    p.add_argument("--rebuild", action="store_true", help="キャッシュを捨てて作り直す")
+    a = p.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    paths = [Path(c) for c in a.csv] or sorted(LOG_DIR.glob("brightness_*.csv"))
+    for path in paths:
+        if a.rebuild:
+            meta = _cache_dir(path) / "meta.json"
+            if meta.exists():
+                meta.unlink()
+        t0 = time.perf_counter()
+        rows = update(path)
+        logging.info("%s: %d 行 (%.0f ms)", path.name, rows, (time.perf_counter() - t0) * 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+camera_backend.py — Picamera2 とダミーカメラの切り替え
+
+実機では picamera2 をそのまま使い、`fake=True` のときは同じ API の一部だけを
+真似たダミー実装を返す。カメラのない開発機でのベンチマーク・動作確認用。
+"""
+
+import enum
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+
+def load_backend(fake: bool = False) -> SimpleNamespace:
+    if fake:
+        return SimpleNamespace(
+            Picamera2=FakePicamera2,
+            JpegEncoder=FakeJpegEncoder,
+            FileOutput=FakeFileOutput,
+            Quality=FakeQuality,
+            controls=FakeControls,
+        )
+    from libcamera import controls
+    from picamera2 import Picamera2
+    from picamera2.encoders import JpegEncoder, Quality
+    from picamera2.outputs import FileOutput
+    return SimpleNamespace(
+        Picamera2=Picamera2,
+        JpegEncoder=JpegEncoder,
+        FileOutput=FileOutput,
+        Quality=Quality,
+        controls=controls,
+    )
+
+
+class FakeQuality(enum.Enum):
+    VERY_LOW = 25
+    LOW = 50
+    MEDIUM = 70
+    HIGH = 85
+    VERY_HIGH = 95
+
+
+class FakeJpegEncoder:
+    pass
+
+
+class FakeControls:
+    """libcamera.controls の列挙型のうち使うものだけ"""
+
+    class AwbModeEnum(enum.IntEnum):
+        Auto = 0
+        Fluorescent = 3
+
+    class AeMeteringModeEnum(enum.IntEnum):
+        CentreWeighted = 0
+
+    class AfModeEnum(enum.IntEnum):
+        Manual = 0
+
+    class draft:
+        class NoiseReductionModeEnum(enum.IntEnum):
+            Off = 0
+
+
+class FakeFileOutput:
+    def __init__(self, file=None):
+        self.fileoutput = file
+
+
+def make_test_jpeg(size, quality: int = 50) -> bytes:
+    """グラデーションのテスト画像を JPEG にする（Pillow がなければ同程度のサイズの疑似データ）"""
+    width, height = size
+    try:
+        import io
+        from PIL import Image
+        img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality)
+        return buf.getvalue()
+    except ImportError:
+        logging.warning("[fake] Pillow がないため疑似JPEGデータを使用します")
+        payload = width * height * quality // 1000
+        return b"\xff\xd8" + b"\x00" * payload + b"\xff\xd9"
+
+
+def make_test_image(size, level: float = 0.5):
+    """横グラデーションに明るさ level を掛けたテスト画像 (PIL.Image, RGB)"""
+    from PIL import Image
+    width, height = size
+    img = Image.linear_gradient("L").rotate(90).resize((width, height))
+    img = img.point(lambda v: min(255, int(v * level * 2)))
+    return img.convert("RGB")
+
+
+def scene_level(now: datetime) -> float:
+    """ダミーの被写体の明るさ。昼 12 時に最大、夜は暗い。"""
+    hour = now.hour + now.minute / 60
+    return max(0.03, 0.5 * math.sin((hour - 6) / 12 * math.pi))
+
+
+class FakeRequest:
+    def __init__(self, camera):
+        self.camera = camera
+
+    def make_image(self, name):
+        return make_test_image(self.camera.config[name]["size"],
+                               self.camera.exposed_level())
+
+    def make_array(self, name):
+        return self.camera.capture_array(name)
+
+    def save(self, name, file_output, format=None):
+        self.make_image(name).save(file_output, format="JPEG",
+                                   quality=self.camera.options["quality"])
+
+    def get_metadata(self):
+        return self.camera.capture_metadata()
+
+    def release(self):
+        pass
+
+
+class FakePicamera2:
+    """Picamera2 のうち本システムで使う部分だけを真似たダミーカメラ"""
+
+    def __init__(self):
+        self.config = None
+        self.started = False
+        self.options = {"quality": 90}
+        self.controls = {}
+        self._encoders = {}
+
+    def create_preview_configuration(self, main=None, lores=None, controls=None,
+                                     **kwargs):
+        return {"main": main or {"size": (640, 480)},
+                "lores": lores, "controls": controls or {}}
+
+    create_still_configuration = create_preview_configuration
+
+    def configure(self, config):
+        self.config = config
+        self.controls.update(config["controls"])
+
+    def set_controls(self, controls):
+        self.controls.update(controls)
+
+    def exposed_level(self) -> float:
+        level = scene_level(datetime.now())
+        if self.controls.get("AeEnable", True):
+            # 自動露出は適正値 0.3 付近へ寄せる（暗すぎる場面では追いつかない）
+            return min(0.3, level * 4)
+        exposure = self.controls.get("ExposureTime", 10000)
+        gain = self.controls.get("AnalogueGain", 1.0)
+        return min(1.0, level * exposure * gain / 30000)
+
+    def capture_array(self, name="main"):
+        """YUV420 の lores と同じ形 (h*3/2, w) の配列を返す"""
+        import numpy as np
+        width, height = self.config[name]["size"]
+        y = np.linspace(0, 2 * self.exposed_level(), width).clip(0, 1) * 255
+        arr = np.full((height * 3 // 2, width), 128, dtype=np.uint8)
+        arr[:height] = y.astype(np.uint8)
+        return arr
+
+    def _frame_interval(self) -> float:
+        limits = (self.config or {}).get("controls", {}).get("FrameDurationLimits")
+        return limits[0] / 1_000_000 if limits else 0.1
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        for encoder in list(self._encoders):
+            self.stop_encoder(encoder)
+        self.started = False
+
+    def close(self):
+        self.stop()
+
+    def start_encoder(self, encoder, output, name="main",
+                      quality=FakeQuality.MEDIUM):
+        frame = make_test_jpeg(self.config[name]["size"], quality.value)
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._encode_loop, args=(output.fileoutput, frame, stop),
+            daemon=True)
+        self._encoders[encoder] = (thread, stop)
+        thread.start()
+
+    def _encode_loop(self, fileoutput, frame, stop):
+        interval = self._frame_interval()
+        next_t = time.monotonic()
+        while not stop.is_set():
+            fileoutput.write(frame)
+            next_t += interval
+            stop.wait(max(0.0, next_t - time.monotonic()))
+
+    def capture_request(self):
+        # 実機同様、次のフレームを待つ
+        time.sleep(self._frame_interval())
+        return FakeRequest(self)
+
+    def capture_metadata(self):
+        time.sleep(self._frame_interval())
+        return {"ExposureTime": self.controls.get("ExposureTime", 10000),
+                "AnalogueGain": self.controls.get("AnalogueGain", 1.0)}
+
+    def stop_encoder(self, encoder):
+        thread, stop = self._encoders.pop(encoder)
+        stop.set()
+        thread.join()
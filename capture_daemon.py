@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+capture_daemon.py — Picamera2 常駐撮影サービス
+
+capture.sh は毎分 libcamera-jpeg を2回コールドスタートしていたが、こちらはカメラを
+開いたまま一定間隔で撮影する。出力は capture.sh と同じ
+images/YYYYMMDD_HHMMSS.jpg と log/brightness_YYYY-MM.csv（同じ列）。
+
+    python3 capture_daemon.py                       # 毎分撮影（systemd から起動）
+    python3 capture_daemon.py --fake-camera --base-dir /tmp/tl --interval 2 --count 5
+"""
+
+import argparse
+import csv
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import frame_catalog
+import metering
+from camera_backend import load_backend
+
+BASE_DIR = Path("/home/pi/timelapse-system")
+INTERVAL_SEC = 60
+
+# ==== 撮影条件（capture.sh と同じ） ====
+MAIN_RESOLUTION = (2304, 1296)
+LORES_RESOLUTION = (640, 360)
+JPEG_QUALITY = 90
+FOCUS_POS = 0.8
+MANUAL_THRESHOLD = 0.15   # 仮測光の明るさ（identify と同じ R,G,B 平均）がこれ以上ならマニュアル露出
+MANUAL_SHUTTER_US = 10000
+MANUAL_GAIN = 3.0
+AUTO_EV = 0
+SETTLE_FRAMES = 6         # 露出設定を切り替えてから安定するまで待つフレーム数
+RETRY_COUNT = 2
+
+logger = logging.getLogger("capture_daemon")
+
+
+def time_info(hour: int) -> str:
+    if hour in (4, 5):
+        return "early_morning"
+    if 6 <= hour <= 9:
+        return "morning"
+    if 10 <= hour <= 13:
+        return "midday"
+    if 14 <= hour <= 17:
+        return "afternoon"
+    if 18 <= hour <= 21:
+        return "evening"
+    return "night"
+
+
+class CaptureDaemon:
+    def __init__(self, backend, base_dir: Path = BASE_DIR,
+                 interval: float = INTERVAL_SEC):
+        self.backend = backend
+        self.img_dir = base_dir / "images"
+        self.log_dir = base_dir / "log"
+        self.catalog_path = self.log_dir / "frames.db"
+        self.interval = interval
+        self.picam2 = None
+        self.auto_mode: Optional[bool] = None
+        self.stop_event = threading.Event()
+
+    # ---- カメラ ----
+    def open(self):
+        self.img_dir.mkdir(parents=True, exist_ok=True)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        c = self.backend.controls
+        self.picam2 = self.backend.Picamera2()
+        config = self.picam2.create_still_configuration(
+            main={"size": MAIN_RESOLUTION},
+            lores={"size": LORES_RESOLUTION, "format": "YUV420"},
+            buffer_count=2,
+            controls={
+                "AwbMode": c.AwbModeEnum.Fluorescent,
+                "AeMeteringMode": c.AeMeteringModeEnum.CentreWeighted,
+                "NoiseReductionMode": c.draft.NoiseReductionModeEnum.Off,
+                "AfMode": c.AfModeEnum.Manual,
+                "LensPosition": FOCUS_POS,
+            })
+        self.picam2.configure(config)
+        self.picam2.options["quality"] = JPEG_QUALITY
+        self.picam2.start()
+        logger.info("カメラ起動完了")
+
+    def close(self):
+        if self.picam2:
+            self.picam2.stop()
+            self.picam2.close()
+            self.picam2 = None
+
+    def _set_mode(self, auto: bool):
+        if self.auto_mode == auto:
+            return
+        if auto:
+            self.picam2.set_controls({"AeEnable": True, "ExposureValue": AUTO_EV})
+        else:
+            self.picam2.set_controls({"AeEnable": False,
+                                      "ExposureTime": MANUAL_SHUTTER_US,
+                                      "AnalogueGain": MANUAL_GAIN})
+        self.auto_mode = auto
+        for _ in range(SETTLE_FRAMES):
+            self.picam2.capture_metadata()
+
+    def meter(self) -> float:
+        """自動露出での lores の明るさ（capture.sh の仮撮影の identify に相当）"""
+        self._set_mode(True)
+        return self._measure(self.picam2.capture_array("lores")).mean
+
+    @staticmethod
+    def _measure(arr) -> metering.Metering:
+        # mean は U/V も使って identify と同じ R,G,B 平均にする（閾値が capture.sh と共通なので）
+        h = LORES_RESOLUTION[1]
+        return metering.measure(metering.y_plane(arr, h), metering.uv_planes(arr, h))
+
+    # ---- 撮影 ----
+    def shoot(self, stamp: datetime):
+        t0 = time.monotonic()
+        outfile = self.img_dir / f"{stamp:%Y%m%d_%H%M%S}.jpg"
+        mean = self.meter()
+        auto = mean < MANUAL_THRESHOLD
+        self._set_mode(auto)
+
+        result = None
+        for attempt in range(1, RETRY_COUNT + 1):
+            try:
+                request = self.picam2.capture_request()
+                try:
+                    # 書きかけのファイルを他のジョブに拾われないよう一時ファイル経由
+                    tmp = outfile.with_suffix(".jpg.part")
+                    with open(tmp, "wb") as f:
+                        request.save("main", f, format="jpeg")
+                    os.replace(tmp, outfile)
+                    # 本番と同じリクエストの lores で測光（JPEG を読み直さない）
+                    result = self._measure(request.make_array("lores"))
+                finally:
+                    request.release()
+                break
+            except Exception as e:
+                logger.warning("撮影失敗のためリトライ中 (%d/%d): %s",
+                               attempt, RETRY_COUNT, e)
+                time.sleep(1)
+
+        if result is not None:
+            path_str = str(outfile)
+            mean_final = f"{result.mean:.6f}"
+            extra = result.csv_fields()
+        else:
+            logger.error("撮影失敗（リトライ%d回）", RETRY_COUNT)
+            path_str = "N/A"
+            mean_final = "n/a"
+            extra = []
+
+        self.append_csv(auto, stamp, path_str, mean_final, extra)
+        logger.info("撮影完了 %s mode=%s mean=%s (%.0f ms)", path_str,
+                    "auto" if auto else "manual", mean_final,
+                    (time.monotonic() - t0) * 1000)
+
+    def append_csv(self, auto: bool, stamp: datetime, path: str, mean: str,
+                   extra: List[str]):
+        now = datetime.now()
+        if auto:
+            shutter, gain, ev = "auto", "auto", str(AUTO_EV)
+        else:
+            shutter, gain, ev = str(MANUAL_SHUTTER_US), str(MANUAL_GAIN), "n/a"
+        csv_path = self.log_dir / f"brightness_{now:%Y-%m}.csv"
+        with csv_path.open("a", newline="") as f:
+            csv.writer(f, lineterminator="\n").writerow([
+                now.strftime("%Y-%m-%d %H:%M:%S"), "indoor",
+                "auto" if auto else "manual", time_info(stamp.hour),
+                shutter, gain, path, mean, ev, *extra])
+        if path != "N/A":
+            frame_catalog.record("add", path, path=self.catalog_path, ts=stamp.timestamp(),
+                                 mean=mean, mode="auto" if auto else "manual",
+                                 shutter=shutter, gain=gain)
+
+    # ---- スケジュール ----
+    def run(self, count: Optional[int] = None):
+        # 壁時計の interval 境界に揃え、処理時間に関係なく next を積み上げる（ドリフトしない）
+        next_t = (time.time() // self.interval + 1) * self.interval
+        shots = 0
+        while not self.stop_event.is_set():
+            if self.stop_event.wait(max(0.0, next_t - time.time())):
+                break
+            try:
+                self.shoot(datetime.fromtimestamp(next_t))
+            except Exception as e:
+                logger.exception("撮影処理で例外: %s", e)
+            shots += 1
+            if count is not None and shots >= count:
+                break
+            next_t += self.interval
+            now = time.time()
+            if next_t <= now:
+                skipped = int((now - next_t) // self.interval) + 1
+                logger.warning("撮影が間に合わず %d 回分スキップ", skipped)
+                next_t += skipped * self.interval
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Picamera2 常駐撮影サービス")
+    p.add_argument("--interval", type=float, default=INTERVAL_SEC)
+    p.add_argument("--count", type=int, help="指定枚数撮影したら終了")
+    p.add_argument("--base-dir", type=Path, default=BASE_DIR)
+    p.add_argument("--fake-camera", action="store_true",
+                   help="カメラなしでダミー画像を撮影（動作確認・ベンチマーク用）")
+    return p.parse_args()
+
+
+def main():
+    a = parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    daemon = CaptureDaemon(load_backend(a.fake_camera), a.base_dir, a.interval)
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop_event.set())
+    daemon.open()
+    try:
+        daemon.run(a.count)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+        logger.info("撮影サービス終了")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+csv_tail.py — 追記型 CSV の末尾 N 行を読む
+
+月次の brightness CSV は月末には数万行になるが、通知・レポートが使うのは末尾の数行だけ。
+EOF から後ろ向きにブロック単位で読み、整形済みの行が N 行そろったら止める。
+さらに「末尾 N 行の先頭バイト位置」を inode・サイズと一緒にキャッシュしておき、
+次回はそこから EOF までだけを読む（前回以降に追記された分 + N 行）。
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent
+CACHE_DIR = BASE_DIR / "cache"
+BLOCK_SIZE = 8192
+
+Row = Tuple[int, List[str]]   # (行頭のバイト位置, 列)
+
+
+def _cache_path(path: str, n: int, min_fields: int) -> Path:
+    key = hashlib.sha256(f"{os.path.abspath(path)}:{n}:{min_fields}".encode()).hexdigest()
+    return CACHE_DIR / f"csv_tail_{key[:16]}.json"
+
+
+def _load_cache(cache_path: Path) -> Optional[dict]:
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_cache(cache_path: Path, data: dict):
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, cache_path)
+    except OSError as e:
+        logging.warning(f"[csv_tail] キャッシュ保存失敗: {e}")
+
+
+def _parse_lines(buf: bytes, base: int, first_is_partial: bool,
+                 min_fields: int) -> List[Row]:
+    rows = []
+    offset = base
+    lines = buf.split(b"\n")
+    for i, line in enumerate(lines):
+        start = offset
+        offset += len(line) + 1
+        if i == 0 and first_is_partial:
+            continue
+        text = line.decode("utf-8", errors="replace").rstrip("\r")
+        if not text:
+            continue
+        fields = next(csv.reader([text]))
+        if len(fields) >= min_fields:
+            rows.append((start, fields))
+    return rows
+
+
+def _read_forward(f, start: int, size: int, min_fields: int) -> List[Row]:
+    f.seek(start)
+    return _parse_lines(f.read(size - start), start, False, min_fields)
+
+
+def _read_backward(f, size: int, n: int, min_fields: int) -> List[Row]:
+    pos = size
+    buf = b""
+    while True:
+        step = min(BLOCK_SIZE, pos)
+        pos -= step
+        f.seek(pos)
+        buf = f.read(step) + buf
+        # pos > 0 の間は先頭行が途中から始まっている可能性がある
+        rows = _parse_lines(buf, pos, pos > 0, min_fields)
+        if len(rows) >= n or pos == 0:
+            return rows
+
+
+def tail_rows(path: str, n: int, min_fields: int = 1,
+              use_cache: bool = True) -> List[List[str]]:
+    """path の末尾から、列数が min_fields 以上の行を最大 n 行（古い順）返す"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return []
+
+    cache_path = _cache_path(path, n, min_fields)
+    cache = _load_cache(cache_path) if use_cache else None
+
+    with open(path, "rb") as f:
+        rows = None
+        if (cache and cache.get("inode") == st.st_ino
+                and cache.get("size", -1) <= st.st_size
+                and cache.get("offset", -1) <= cache.get("size", -1)):
+            # 同じファイルが伸びただけ → 前回の末尾 N 行の先頭から読めば足りる
+            rows = _read_forward(f, cache["offset"], st.st_size, min_fields)
+            if len(rows) < n and cache["offset"] > 0:
+                rows = None
+        if rows is None:
+            rows = _read_backward(f, st.st_size, n, min_fields)
+
+    rows = rows[-n:]
+    if use_cache:
+        _save_cache(cache_path, {
+            "inode": st.st_ino,
+            "size": st.st_size,
+            "offset": rows[0][0] if rows else 0,
+        })
+    return [fields for _, fields in rows]
+
+
+def last_row(path: str, min_fields: int = 1) -> Optional[List[str]]:
+    rows = tail_rows(path, 1, min_fields)
+    return rows[-1] if rows else None
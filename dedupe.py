@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+dedupe.py — 夜間などのほぼ同じフレームを間引き・ハードリンク化して、保存容量と NAS 転送を減らす
+
+archived/YYYY-MM-DD/ のフレームを 1/8 縮小デコード（DCT 段階）→ さらにブロック平均した
+小さなサムネイル（72x40 程度）にし、最後に残したフレームとの差を NumPy でまとめて比べる。
+差が小さい（変化した画素の割合が DEDUPE_MAX_CHANGED 以下）フレームを重複とみなし、
+時間帯（capture.sh の TIME_INFO）ごとの方針で扱う。
+
+    keep  何もしない（集計だけ）
+    link  残したフレームへのハードリンクに置き換える（ファイル名はそのまま、容量は1枚分）
+    thin  消す（NAS にも送らない）
+
+どのフレームを何で置き換えたかは log/dedupe/YYYY-MM-DD.json に書くので、
+make_timelapse.py は間引いた時刻に残したフレームを入れて元の時間軸どおりに並べられる。
+静止が続いても DEDUPE_KEEP_EVERY_MIN 分ごと・時間帯の変わり目では必ず1枚残す。
+
+archiver.py のあと、nas_sync.py の前に動かす（cron 1:30）。
+
+    python3 dedupe.py                  # 昨日分
+    python3 dedupe.py 2026-10-16 --dry-run
+    python3 dedupe.py --report         # 日ごとの削減量
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+import frame_catalog
+import frame_index
+from capture_daemon import time_info
+
+ROOT = Path("/home/pi/timelapse-system")
+ARCHIVED_DIR = ROOT / "archived"
+MANIFEST_DIR = ROOT / "log" / "dedupe"
+LOG_PATH = ROOT / "log" / "dedupe.log"
+
+load_dotenv(ROOT / ".env")
+
+DECODE_SCALE = 8       # JPEG を 1/8 で縮小デコード（2304x1296 → 288x162）
+BLOCK = 4              # さらに 4x4 のブロック平均（→ 72x40、撮影ノイズもならす）
+PIXEL_TOL = float(os.getenv("DEDUPE_PIXEL_TOL", 8))              # 変化とみなす画素差 (0-255)
+MAX_CHANGED = float(os.getenv("DEDUPE_MAX_CHANGED", 0.005))      # 変化した画素がこの割合以下なら重複
+KEEP_EVERY_MIN = int(os.getenv("DEDUPE_KEEP_EVERY_MIN", 30))     # 静止が続いてもこの間隔で1枚は残す
+# 時間帯ごとの方針（TIME_INFO=keep|link|thin をカンマ区切り、書かない時間帯は keep）
+POLICY_SPEC = os.getenv("DEDUPE_POLICY", "night=thin,early_morning=link,evening=link")
+ACTIONS = ("keep", "link", "thin")
+
+
+def parse_policy(spec: str) -> Dict[str, str]:
+    policy = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        band, _, action = item.partition("=")
+        if action not in ACTIONS:
+            raise ValueError(f"DEDUPE_POLICY の指定が不正です: {item}")
+        policy[band.strip()] = action
+    return policy
+
+
+def thumbnail(path: str) -> np.ndarray:
+    """グレースケールの小さなサムネイル（uint8）"""
+    from PIL import Image
+    with Image.open(path) as img:
+        img.draft("L", (img.width // DECODE_SCALE, img.height // DECODE_SCALE))
+        y = np.asarray(img.convert("L"), dtype=np.uint16)
+    h, w = (y.shape[0] // BLOCK) * BLOCK, (y.shape[1] // BLOCK) * BLOCK
+    blocks = y[:h, :w].reshape(h // BLOCK, BLOCK, w // BLOCK, BLOCK)
+    return (blocks.sum(axis=(1, 3)) // (BLOCK * BLOCK)).astype(np.uint8)
+
+
+def changed_ratio(ref: np.ndarray, thumbs: np.ndarray, pixel_tol: float = PIXEL_TOL) -> np.ndarray:
+    """ref に対する各サムネイル（N, h, w）の、PIXEL_TOL を超えて変化した画素の割合"""
+    diff = np.abs(thumbs.astype(np.int16) - ref.astype(np.int16))
+    return (diff > pixel_tol).mean(axis=(1, 2))
+
+
+def find_duplicates(names: List[str], thumbs: np.ndarray, bands: List[str],
+                    max_changed: float = MAX_CHANGED, pixel_tol: float = PIXEL_TOL,
+                    keep_every_min: int = KEEP_EVERY_MIN) -> Dict[str, str]:
+    """{重複フレーム名: 代わりに使う（残す）フレーム名}
+
+    最後に残したフレームとだけ比べる（隣どうしでは、ゆっくりした変化がいつまでも重複扱いになる）。
+    比べる相手が変わるまでの区間は1回の配列演算でまとめて求める。
+    """
+    dup = {}
+    n = len(names)
+    times = [frame_index.frame_time(name) for name in names]
+    i = 0
+    while i < n:
+        kept = i
+        j = i + 1
+        # 同じ時間帯で、残したフレームから keep_every_min 分以内の区間
+        end = j
+        while end < n and bands[end] == bands[kept] and \
+                (times[end] - times[kept]) < timedelta(minutes=keep_every_min):
+            end += 1
+        if end > j:
+            ratio = changed_ratio(thumbs[kept], thumbs[j:end], pixel_tol)
+            moved = np.flatnonzero(ratio > max_changed)
+            stop = j + int(moved[0]) if moved.size else end
+            for k in range(j, stop):
+                dup[names[k]] = names[kept]
+            j = stop
+        i = j
+    return dup
+
+
+def manifest_path(day: date, manifest_dir: Path = MANIFEST_DIR) -> Path:
+    return Path(manifest_dir) / f"{day.isoformat()}.json"
+
+
+def load_manifest(day: date, manifest_dir: Path = MANIFEST_DIR) -> dict:
+    try:
+        with open(manifest_path(day, manifest_dir)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"day": day.isoformat(), "thinned": {}, "linked": {}, "bytes_saved": 0}
+
+
+def save_manifest(manifest: dict, day: date, manifest_dir: Path = MANIFEST_DIR):
+    path = manifest_path(day, manifest_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _hardlink(src: Path, dest: Path):
+    """dest を src へのハードリンクに置き換える（一時名でリンクしてから rename）"""
+    tmp = dest.with_name(f".{dest.name}.link")
+    try:
+        os.unlink(tmp)
+    except FileNotFoundError:
+        pass
+    os.link(src, tmp)
+    os.replace(tmp, dest)
+
+
+def dedupe_day(day: date, archived_dir: Path = ARCHIVED_DIR,
+               manifest_dir: Path = MANIFEST_DIR, policy: Optional[Dict[str, str]] = None,
+               max_changed: float = MAX_CHANGED, pixel_tol: float = PIXEL_TOL,
+               keep_every_min: int = KEEP_EVERY_MIN, dry_run: bool = False,
+               catalog_path: Optional[Path] = None) -> dict:
+    """day の重複フレームを方針どおりに扱う。集計を返す"""
+    t0 = time.monotonic()
+    policy = parse_policy(POLICY_SPEC) if policy is None else policy
+    day_dir = Path(archived_dir) / day.isoformat()
+    stats = {"frames": 0, "duplicates": 0, "thinned": 0, "linked": 0, "bytes_saved": 0,
+             "bands": Counter(), "unreadable": 0}
+
+    start, end = frame_index.day_window(day)
+    names, thumbs, bands, inodes = [], [], [], []
+    for fr in frame_index.list_frames(str(day_dir), start, end):
+        try:
+            thumb = thumbnail(fr.path)
+            st = os.stat(fr.path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"⚠️ 読めないフレームは比べずに残します: {fr.path} ({e})")
+            stats["unreadable"] += 1
+            continue
+        names.append(os.path.basename(fr.path))
+        thumbs.append(thumb)
+        bands.append(time_info(datetime.fromtimestamp(fr.ts).hour))
+        inodes.append((st.st_ino, st.st_size))
+    stats["frames"] = len(names)
+    if not names:
+        stats["elapsed"] = time.monotonic() - t0
+        return stats
+
+    dup = find_duplicates(names, np.stack(thumbs), bands, max_changed, pixel_tol,
+                          keep_every_min)
+    stats["duplicates"] = len(dup)
+    info = dict(zip(names, inodes))
+    band_of = dict(zip(names, bands))
+    manifest = load_manifest(day, manifest_dir)
+    thinned = []
+    for name, kept in sorted(dup.items()):
+        action = policy.get(band_of[name], "keep")
+        ino, size = info[name]
+        if action == "keep" or (action == "link" and ino == info[kept][0]):
+            continue        # 何もしない / 前回リンク済み
+        stats["bands"][band_of[name]] += 1
+        stats["bytes_saved"] += size
+        if dry_run:
+            stats["thinned" if action == "thin" else "linked"] += 1
+            continue
+        try:
+            if action == "thin":
+                os.unlink(day_dir / name)
+                manifest["thinned"][name] = kept
+                thinned.append(name)
+                stats["thinned"] += 1
+            else:
+                _hardlink(day_dir / kept, day_dir / name)
+                manifest["linked"][name] = kept
+                stats["linked"] += 1
+        except OSError as e:
+            logging.error(f"❌ {action} 失敗: {name}: {e}")
+            stats["bytes_saved"] -= size
+    if not dry_run and (stats["thinned"] or stats["linked"]):
+        manifest["bytes_saved"] = manifest.get("bytes_saved", 0) + stats["bytes_saved"]
+        manifest["params"] = {"max_changed": max_changed, "pixel_tol": pixel_tol,
+                              "keep_every_min": keep_every_min, "policy": policy}
+        save_manifest(manifest, day, manifest_dir)
+        if thinned:
+            frame_catalog.record("remove", thinned, path=catalog_path)
+    stats["elapsed"] = time.monotonic() - t0
+    return stats
+
+
+def timeline(day: date, paths: Iterable[str],
+             manifest_dir: Path = MANIFEST_DIR) -> Iterator[str]:
+    """day のフレームのパスを、間引いた時刻には代わりに残したフレームを入れて時刻順に返す"""
+    thinned = load_manifest(day, manifest_dir)["thinned"]
+    if not thinned:
+        yield from paths
+        return
+    present = {os.path.basename(p): p for p in paths}
+    for name in sorted(present.keys() | thinned.keys()):
+        # 条件を変えて再実行すると、代わりのフレーム自体が間引かれていることがある
+        seen = set()
+        while name not in present and name in thinned and name not in seen:
+            seen.add(name)
+            name = thinned[name]
+        if name in present:
+            yield present[name]
+
+
+def report(manifest_dir: Path = MANIFEST_DIR) -> List[str]:
+    lines = []
+    total = 0
+    for path in sorted(Path(manifest_dir).glob("*.json")):
+        try:
+            with open(path) as f:
+                m = json.load(f)
+        except (OSError, ValueError):
+            continue
+        total += m.get("bytes_saved", 0)
+        lines.append(f"{m.get('day', path.stem)}: 間引き {len(m.get('thinned', {}))} 枚 / "
+                     f"リンク {len(m.get('linked', {}))} 枚 / "
+                     f"{m.get('bytes_saved', 0) / 1024 / 1024:.0f} MB 削減")
+    lines.append(f"合計 {total / 1024 / 1024 / 1024:.2f} GB 削減")
+    return lines
+
+
+def summary(day: date, stats: dict, dry_run: bool = False) -> str:
+    bands = ", ".join(f"{b}: {n}" for b, n in sorted(stats["bands"].items())) or "なし"
+    head = "🧪 [dry-run] 重複" if dry_run else "🧹 重複"
+    return (f"{head} {day}: {stats['frames']} 枚中 {stats['duplicates']} 枚が重複 / "
+            f"間引き {stats['thinned']} 枚・リンク {stats['linked']} 枚（{bands}）/ "
+            f"{stats['bytes_saved'] / 1024 / 1024:.0f} MB 削減 / {stats['elapsed']:.1f} 秒")
+
+
+def main():
+    p = argparse.ArgumentParser(description="ほぼ同じフレームを間引き・ハードリンク化する")
+    p.add_argument("day", nargs="?", type=date.fromisoformat, help="対象日（既定: 昨日）")
+    p.add_argument("--archived-dir", type=Path, default=ARCHIVED_DIR)
+    p.add_argument("--max-changed", type=float, default=MAX_CHANGED,
+                   help="変化した画素の割合がこれ以下なら重複")
+    p.add_argument("--pixel-tol", type=float, default=PIXEL_TOL, help="変化とみなす画素差 (0-255)")
+    p.add_argument("--policy", default=POLICY_SPEC, help="例: night=thin,evening=link")
+    p.add_argument("--dry-run", action="store_true", help="ファイルは変えずに件数と削減量だけ出す")
+    p.add_argument("--report", action="store_true", help="日ごとの削減量を出して終わる")
+    a = p.parse_args()
+
+    if a.report:
+        print("\n".join(report()))
+        return
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if not a.dry_run:
+        LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        handlers.append(logging.FileHandler(LOG_PATH))
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(message)s", handlers=handlers)
+
+    day = a.day or date.today() - timedelta(days=1)
+    stats = dedupe_day(day, a.archived_dir, policy=parse_policy(a.policy),
+                       max_changed=a.max_changed, pixel_tol=a.pixel_tol, dry_run=a.dry_run)
+    logging.info(summary(day, stats, a.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+dir_size.py — `du -s` 互換のディレクトリ使用量を差分だけ数え直す
+
+ディレクトリごとに「直下のファイルの使用量合計」と mtime をキャッシュし、
+mtime が変わったディレクトリだけ scandir し直す。archived/ の日付ディレクトリのうち
+一昨日以前のものは書き換わらない前提で、キャッシュがあれば stat もしない。
+
+値は `du -s --block-size=1K` と同じ（st_blocks 基準・ハードリンクは1回・切り上げ）。
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Optional
+
+BASE_DIR = Path(__file__).resolve().parent
+CACHE_PATH = BASE_DIR / "cache" / "dir_size.json"
+SETTLE_SEC = 120   # mtime がこれより新しいディレクトリは書き込み途中の可能性があるのでキャッシュしない
+DAY_DIR_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def _is_finished_day(name: str) -> bool:
+    """昨日より前の日付ディレクトリ（もう書き込まれない）"""
+    if not DAY_DIR_RE.match(name):
+        return False
+    return name < (date.today() - timedelta(days=1)).isoformat()
+
+
+class DirSizeCache:
+    def __init__(self, cache_path: Optional[Path] = None):
+        self.cache_path = Path(cache_path or CACHE_PATH)
+        self.entries: Dict[str, dict] = {}
+        self._roots: set = set()
+        self._visited: set = set()
+        self.rescanned = 0
+        try:
+            with open(self.cache_path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        # 今回数えたツリーの中でたどらなかった（削除された）ディレクトリは捨てる
+        def under_root(path):
+            return any(path == r or path.startswith(r + os.sep) for r in self._roots)
+        self.entries = {k: v for k, v in self.entries.items()
+                        if k in self._visited or not under_root(k)}
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_path.with_suffix(".tmp")
+            with open(tmp, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            logging.warning("dir_size キャッシュ保存失敗: %s", e)
+
+    def _scan(self, path: str, st: os.stat_result) -> dict:
+        own = st.st_blocks * 512
+        subdirs = []
+        seen = set()
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                    continue
+                est = entry.stat(follow_symlinks=False)
+                if est.st_nlink > 1:
+                    key = (est.st_dev, est.st_ino)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                own += est.st_blocks * 512
+        self.rescanned += 1
+        return {"mtime_ns": st.st_mtime_ns, "own": own, "subdirs": subdirs}
+
+    def _entry(self, path: str) -> dict:
+        cached = self.entries.get(path)
+        if cached is not None and _is_finished_day(os.path.basename(path)):
+            return cached
+        st = os.lstat(path)
+        if cached is not None and cached["mtime_ns"] == st.st_mtime_ns:
+            return cached
+        entry = self._scan(path, st)
+        if time.time() - st.st_mtime_ns / 1e9 < SETTLE_SEC:
+            # 書き込み中かもしれないので次回も数え直す
+            entry["mtime_ns"] = -1
+        self.entries[path] = entry
+        return entry
+
+    def _total(self, path: str) -> int:
+        self._visited.add(path)
+        entry = self._entry(path)
+        total = entry["own"]
+        for name in entry["subdirs"]:
+            total += self._total(os.path.join(path, name))
+        return total
+
+    def size_bytes(self, path: str) -> int:
+        path = os.path.abspath(path)
+        self._roots.add(path)
+        return self._total(path)
+
+    def size_kb(self, path: str) -> int:
+        return -(-self.size_bytes(path) // 1024)
+
+    def discard(self, path: str):
+        """削除したディレクトリ（とその下）をキャッシュから外す"""
+        path = os.path.abspath(path)
+        for key in [k for k in self.entries if k == path or k.startswith(path + os.sep)]:
+            del self.entries[key]
+        self._visited = {k for k in self._visited
+                         if not (k == path or k.startswith(path + os.sep))}
+
+    def child_sizes(self, path: str) -> Dict[str, int]:
+        """直下のサブディレクトリごとの使用量（バイト）。archived/ の日別サイズ用"""
+        path = os.path.abspath(path)
+        self._roots.add(path)
+        self._visited.add(path)
+        entry = self._entry(path)
+        return {name: self._total(os.path.join(path, name))
+                for name in entry["subdirs"]}
+
+
+def dir_size_kb(path: str, cache: Optional[DirSizeCache] = None) -> int:
+    own_cache = cache is None
+    if own_cache:
+        cache = DirSizeCache()
+    kb = cache.size_kb(path)
+    if own_cache:
+        cache.save()
+    return kb
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+frame_catalog.py — 撮影フレームの台帳 (SQLite, WAL)
+
+1フレーム1行で、撮影時刻・今のパス・サイズ・明るさ・露出モード・シャッター/ゲイン・
+archived へ移動済みか・NAS へ送信済みかを持つ。撮影（capture_daemon.py / capture.sh）・
+移動（archiver.py）・NAS 転送（nas_sync.py）がそれぞれ書き込み、
+「期間内のフレーム」「最新フレーム」「その日の未送信」はインデックスで答える。
+
+brightness CSV のパス列は archived へ移すと古くなるので、今のパスは resolve() で台帳から引く。
+台帳ファイルを作るのは rebuild だけで、無いあいだ書き手は何もせず、読み手はディレクトリをたどる。
+更新に失敗すると frames.db.stale を置き、rebuild で消えるまで読み手は台帳を使わない。
+
+    python3 frame_catalog.py add images/20261017_120000.jpg --mean 0.31 --mode auto
+    python3 frame_catalog.py rebuild      # images/ と archived/ をたどって作り直す
+    python3 frame_catalog.py stats
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import frame_index
+
+ROOT = Path("/home/pi/timelapse-system")
+DB_PATH = ROOT / "log" / "frames.db"
+IMAGES_DIR = ROOT / "images"
+ARCHIVED_DIR = ROOT / "archived"
+LOG_DIR = ROOT / "log"
+MANIFEST_DIR = LOG_DIR / "nas" / "manifest"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    name     TEXT PRIMARY KEY,          -- YYYYMMDD_HHMMSS.jpg
+    ts       INTEGER NOT NULL,          -- 撮影時刻（UNIX 秒）
+    day      TEXT NOT NULL,             -- YYYY-MM-DD
+    path     TEXT NOT NULL,
+    size     INTEGER,
+    mean     REAL,
+    mode     TEXT,                      -- auto / manual
+    shutter  TEXT,
+    gain     TEXT,
+    archived INTEGER NOT NULL DEFAULT 0,
+    synced   INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS frames_ts ON frames(ts);
+CREATE INDEX IF NOT EXISTS frames_day_synced ON frames(day, synced);
+"""
+
+# 撮影時の情報（mean など）は、後から移動・再構築で上書きしない
+UPSERT = """
+INSERT INTO frames (name, ts, day, path, size, mean, mode, shutter, gain, archived, synced)
+VALUES (:name, :ts, :day, :path, :size, :mean, :mode, :shutter, :gain, :archived, :synced)
+ON CONFLICT(name) DO UPDATE SET
+    path     = excluded.path,
+    size     = coalesce(excluded.size, size),
+    mean     = coalesce(excluded.mean, mean),
+    mode     = coalesce(excluded.mode, mode),
+    shutter  = coalesce(excluded.shutter, shutter),
+    gain     = coalesce(excluded.gain, gain),
+    archived = max(archived, excluded.archived),
+    synced   = max(synced, excluded.synced)
+"""
+
+COLUMNS = ("name", "ts", "day", "path", "size", "mean", "mode", "shutter", "gain",
+           "archived", "synced")
+
+
+class FrameRow(NamedTuple):
+    name: str
+    ts: int
+    day: str
+    path: str
+    size: Optional[int]
+    mean: Optional[float]
+    mode: Optional[str]
+    shutter: Optional[str]
+    gain: Optional[str]
+    archived: int
+    synced: int
+
+
+def _opt_float(v) -> Optional[float]:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _params(path: str, ts: Optional[float] = None, size: Optional[int] = None,
+            mean=None, mode: Optional[str] = None, shutter: Optional[str] = None,
+            gain: Optional[str] = None, archived: bool = False, synced: bool = False) -> dict:
+    name = os.path.basename(path)
+    if ts is None:
+        t = frame_index.frame_time(name)
+        ts = t.timestamp() if t else os.stat(path).st_mtime
+    return {"name": name, "ts": int(ts), "day": datetime.fromtimestamp(ts).strftime("%Y-%m-%d"),
+            "path": str(path), "size": size, "mean": _opt_float(mean), "mode": mode,
+            "shutter": shutter, "gain": gain, "archived": int(archived), "synced": int(synced)}
+
+
+class FrameCatalog:
+    def __init__(self, path: Path = DB_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # 撮影・移動・転送・監視が別プロセスで同時に開くので、ロック待ちは数秒まで許す
+        self.conn = sqlite3.connect(str(path), timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ===== 書き込み =====
+
+    def add(self, path: str, **meta):
+        """撮影したフレームを登録する（同じ名前があれば更新）"""
+        if meta.get("size") is None:
+            try:
+                meta["size"] = os.path.getsize(path)
+            except OSError:
+                pass
+        with self.conn:
+            self.conn.execute(UPSERT, _params(str(path), **meta))
+
+    def mark_archived(self, moves: Iterable[Tuple[str, str]]):
+        """[(旧パス, 新パス)] を archived 済みにする（台帳にない行は新しく作る）"""
+        rows = [_params(str(new), archived=True) for _, new in moves]
+        with self.conn:
+            self.conn.executemany(UPSERT, rows)
+
+    def mark_synced(self, names: Iterable[str]):
+        with self.conn:
+            self.conn.executemany("UPDATE frames SET synced = 1 WHERE name = ?",
+                                  ((n,) for n in names))
+
+    def remove(self, names: Iterable[str]):
+        with self.conn:
+            self.conn.executemany("DELETE FROM frames WHERE name = ?", ((n,) for n in names))
+
+    def remove_day(self, day: date):
+        """retention.py が archived/YYYY-MM-DD/ を消したあとに、その日の移動済みフレームを消す"""
+        with self.conn:
+            self.conn.execute("DELETE FROM frames WHERE day = ? AND archived = 1",
+                              (day.isoformat(),))
+
+    # ===== 問い合わせ =====
+
+    def _rows(self, sql: str, params=()) -> List[FrameRow]:
+        return [FrameRow(*r) for r in
+                self.conn.execute(f"SELECT {', '.join(COLUMNS)} FROM frames {sql}", params)]
+
+    def in_window(self, start: datetime, end: datetime) -> List[FrameRow]:
+        """start <= 撮影時刻 < end のフレーム（撮影時刻順）"""
+        return self._rows("WHERE ts >= ? AND ts < ? ORDER BY ts, name",
+                          (int(start.timestamp()), int(end.timestamp())))
+
+    def count(self, start: datetime, end: Optional[datetime] = None,
+              archived: Optional[bool] = None) -> int:
+        """期間内のフレーム数（archived=True/False で移動済み・未移動だけに絞る）"""
+        sql = "SELECT count(*) FROM frames WHERE ts >= ? AND ts < ?"
+        params = [int(start.timestamp()), int(end.timestamp()) if end else 2 ** 62]
+        if archived is not None:
+            sql += " AND archived = ?"
+            params.append(int(archived))
+        return self.conn.execute(sql, params).fetchone()[0]
+
+    def latest(self) -> Optional[FrameRow]:
+        rows = self._rows("ORDER BY ts DESC, name DESC LIMIT 1")
+        return rows[0] if rows else None
+
+    def unsynced(self, day: date) -> List[FrameRow]:
+        return self._rows("WHERE day = ? AND synced = 0 ORDER BY name", (day.isoformat(),))
+
+    def get(self, name: str) -> Optional[FrameRow]:
+        rows = self._rows("WHERE name = ?", (name,))
+        return rows[0] if rows else None
+
+    def stats(self) -> dict:
+        r = self.conn.execute(
+            "SELECT count(*), coalesce(sum(archived), 0), coalesce(sum(synced), 0), "
+            "min(day), max(day) FROM frames").fetchone()
+        return dict(zip(("frames", "archived", "synced", "first_day", "last_day"), r))
+
+    # ===== 作り直し =====
+
+    def rebuild(self, images_dir: Path = IMAGES_DIR, archived_dir: Path = ARCHIVED_DIR,
+                log_dir: Optional[Path] = LOG_DIR,
+                manifest_dir: Optional[Path] = MANIFEST_DIR) -> dict:
+        """ディスク上のフレームから台帳を作り直す
+
+        明るさ・モード・露出は brightness_*.csv から（ファイル名で突き合わせ）、
+        送信済みフラグは nas_sync のマニフェストから取る。ディスクにないフレームの行は消す。
+        """
+        t0 = time.monotonic()
+        meta = _csv_meta(log_dir) if log_dir else {}
+        synced = _manifest_sent(manifest_dir) if manifest_dir else set()
+        seen = 0
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen (name TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM seen")
+            for base, archived in ((images_dir, False), (archived_dir, True)):
+                batch = []
+                for fr in frame_index.iter_frames(str(base)):
+                    name = os.path.basename(fr.path)
+                    try:
+                        size = os.stat(fr.path).st_size
+                    except FileNotFoundError:
+                        continue
+                    m = meta.get(name, {})
+                    batch.append(_params(fr.path, ts=fr.ts, size=size, archived=archived,
+                                         synced=name in synced, **m))
+                    if len(batch) >= 5000:
+                        seen += self._flush_rebuild(batch)
+                        batch = []
+                seen += self._flush_rebuild(batch)
+            removed = self.conn.execute(
+                "DELETE FROM frames WHERE name NOT IN (SELECT name FROM seen)").rowcount
+            self.conn.execute("DROP TABLE seen")
+        return {"frames": seen, "removed": removed, "elapsed": time.monotonic() - t0}
+
+    def _flush_rebuild(self, batch: List[dict]) -> int:
+        self.conn.executemany(UPSERT, batch)
+        self.conn.executemany("INSERT OR IGNORE INTO seen (name) VALUES (?)",
+                              ((p["name"],) for p in batch))
+        return len(batch)
+
+
+def _csv_meta(log_dir: Path) -> dict:
+    """brightness_*.csv の {ファイル名: mean, mode, shutter, gain}"""
+    meta = {}
+    for path in sorted(Path(log_dir).glob("brightness_*.csv")):
+        with open(path, newline="", errors="replace") as f:
+            for row in csv.reader(f):
+                if len(row) < 8 or row[6] in ("", "N/A"):
+                    continue
+                meta[os.path.basename(row[6])] = {
+                    "mean": row[7], "mode": row[2], "shutter": row[4], "gain": row[5]}
+    return meta
+
+
+def _manifest_sent(manifest_dir: Path) -> set:
+    sent = set()
+    for path in Path(manifest_dir).glob("*.json"):
+        try:
+            with open(path) as f:
+                files = json.load(f).get("files", {})
+        except (OSError, ValueError):
+            continue
+        sent.update(name for name, rec in files.items() if rec.get("sent"))
+    return sent
+
+
+# ===== 他のスクリプトから使う関数（台帳がなくても動くように失敗は握りつぶす） =====
+
+def stale_marker(path: Optional[Path] = None) -> Path:
+    path = path or DB_PATH
+    return Path(path).with_name(Path(path).name + ".stale")
+
+
+def mark_stale(reason: str, path: Optional[Path] = None):
+    """台帳が実際のフレームとずれたことを記録する（rebuild で消える）"""
+    marker = stale_marker(path)
+    try:
+        with open(marker, "a") as f:
+            f.write(f"{datetime.now():%Y-%m-%d %H:%M:%S} {reason}\n")
+    except OSError as e:
+        logging.warning(f"台帳の不整合マーカーを書けません: {e}")
+
+
+def open_catalog(path: Optional[Path] = None) -> Optional[FrameCatalog]:
+    """台帳が既にあれば開く（無い・不整合マーカーがあれば None。呼び出し側はファイルシステムをたどる方法に戻る）"""
+    marker = stale_marker(path)
+    if marker.exists():
+        logging.warning(f"⚠️ フレーム台帳の更新に失敗しています（{marker}）。"
+                        "rebuild するまでディレクトリをたどります")
+        return None
+    return _connect(path)
+
+
+def _connect(path: Optional[Path] = None) -> Optional[FrameCatalog]:
+    path = path or DB_PATH
+    if not Path(path).exists():
+        return None
+    try:
+        return FrameCatalog(path)
+    except sqlite3.Error as e:
+        logging.warning(f"フレーム台帳を開けません: {e}")
+        return None
+
+
+def record(fn, *args, path: Optional[Path] = None, **kwargs):
+    """FrameCatalog のメソッド名 fn を呼ぶ（path が None なら DB_PATH）
+
+    台帳がまだ無ければ（rebuild 前）何もしない。中途半端な台帳を読み手が信じないように、
+    作るのは rebuild だけにしている。更新に失敗しても本来の処理は止めないが、
+    不整合マーカーを置いて読み手が台帳を信じないようにする。
+    """
+    cat = _connect(path)
+    if cat is None:
+        return
+    try:
+        with cat:
+            getattr(cat, fn)(*args, **kwargs)
+    except (sqlite3.Error, OSError) as e:
+        logging.warning(f"フレーム台帳の更新失敗（{fn}）: {e}")
+        mark_stale(f"{fn}: {e}", path)
+
+
+def resolve(path: str, db_path: Optional[Path] = None) -> Optional[str]:
+    """CSV などに残っている古いパスを、今の場所に読み替える（見つからなければ None）"""
+    if path and os.path.exists(path):
+        return path
+    cat = open_catalog(db_path)
+    if cat is None:
+        return None
+    with cat:
+        row = cat.get(os.path.basename(path or ""))
+    if row and os.path.exists(row.path):
+        return row.path
+    return None
+
+
+def main():
+    p = argparse.ArgumentParser(description="撮影フレームの台帳")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    a_add = sub.add_parser("add", help="撮影したフレームを登録")
+    a_add.add_argument("path")
+    a_add.add_argument("--mean")
+    a_add.add_argument("--mode")
+    a_add.add_argument("--shutter")
+    a_add.add_argument("--gain")
+    a_rb = sub.add_parser("rebuild", help="images/ と archived/ から作り直す")
+    a_rb.add_argument("--images", type=Path, default=IMAGES_DIR)
+    a_rb.add_argument("--archived", type=Path, default=ARCHIVED_DIR)
+    sub.add_parser("stats", help="件数の集計")
+    a_un = sub.add_parser("unsynced", help="その日の NAS 未送信フレーム")
+    a_un.add_argument("day", type=date.fromisoformat)
+    p.add_argument("--db", type=Path, default=DB_PATH)
+    a = p.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    if a.cmd == "add":
+        # capture.sh から毎回呼ばれる。台帳が無い・壊れていても撮影は止めない
+        record("add", a.path, path=a.db, mean=a.mean, mode=a.mode, shutter=a.shutter,
+               gain=a.gain)
+        return
+    if a.cmd == "rebuild":
+        with FrameCatalog(a.db) as cat:
+            r = cat.rebuild(a.images, a.archived)
+        try:
+            stale_marker(a.db).unlink()
+        except FileNotFoundError:
+            pass
+        logging.info(f"✅ 台帳を作り直しました: {r['frames']} フレーム（削除 {r['removed']} 行）"
+                     f" / {r['elapsed']:.1f} 秒")
+        return
+    # 台帳を作るのは rebuild だけ（空の台帳ができると読み手がそれを信じてしまう）
+    cat = _connect(a.db)
+    if cat is None:
+        logging.error(f"❌ フレーム台帳がありません: {a.db}（先に rebuild してください）")
+        sys.exit(1)
+    with cat:
+        if a.cmd == "stats":
+            s = cat.stats()
+            print(f"{s['frames']} フレーム（archived {s['archived']} / NAS 送信済み {s['synced']}）"
+                  f" {s['first_day'] or '-'} 〜 {s['last_day'] or '-'}")
+        elif a.cmd == "unsynced":
+            for row in cat.unsynced(a.day):
+                print(row.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+frame_index.py — ファイル名の撮影時刻による画像の検索
+
+撮影画像は YYYYMMDD_HHMMSS.jpg という名前なので、時間範囲の検索は名前だけで答えられる。
+os.scandir でディレクトリを読み、名前から時刻を取り出して絞り込む（ファイルを stat しない）。
+archived/ の YYYY-MM-DD ディレクトリは範囲外の日なら中に入らない。
+名前が規則に合わないファイルだけ mtime で判定する。
+"""
+
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, NamedTuple, Optional
+
+FRAME_RE = re.compile(r"^(\d{8}_\d{6})\.jpg$")
+DAY_DIR_RE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+
+
+class Frame(NamedTuple):
+    path: str
+    ts: float          # UNIX 時刻
+    from_name: bool    # False ならファイル名が規則外で mtime を使った
+
+
+def frame_time(name: str) -> Optional[datetime]:
+    m = FRAME_RE.match(name)
+    if not m:
+        return None
+    try:
+        return datetime.strptime(m.group(1), "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+
+
+def _day_dir_outside(name: str, start: Optional[datetime],
+                     end: Optional[datetime]) -> bool:
+    m = DAY_DIR_RE.match(name)
+    if not m:
+        return False
+    try:
+        day = date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    except ValueError:
+        return False
+    if start is not None and day < start.date():
+        return True
+    if end is not None and day > end.date():
+        return True
+    return False
+
+
+def iter_frames(base_dir: str, start: Optional[datetime] = None,
+                end: Optional[datetime] = None) -> Iterator[Frame]:
+    """base_dir 以下の .jpg のうち start <= 撮影時刻 < end のものを順不同で返す"""
+    start_ts = start.timestamp() if start else float("-inf")
+    end_ts = end.timestamp() if end else float("inf")
+    try:
+        it = os.scandir(base_dir)
+    except FileNotFoundError:
+        return
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if not _day_dir_outside(entry.name, start, end):
+                    yield from iter_frames(entry.path, start, end)
+                continue
+            if not entry.name.endswith(".jpg"):
+                continue
+            t = frame_time(entry.name)
+            if t is not None:
+                ts, from_name = t.timestamp(), True
+            else:
+                try:
+                    ts, from_name = entry.stat().st_mtime, False
+                except FileNotFoundError:
+                    continue
+            if start_ts <= ts < end_ts:
+                yield Frame(entry.path, ts, from_name)
+
+
+def list_frames(base_dir: str, start: Optional[datetime] = None,
+                end: Optional[datetime] = None) -> List[Frame]:
+    """撮影時刻順（同時刻はファイル名順）"""
+    return sorted(iter_frames(base_dir, start, end),
+                  key=lambda f: (f.ts, os.path.basename(f.path)))
+
+
+def count_frames(base_dir: str, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None) -> int:
+    return sum(1 for _ in iter_frames(base_dir, start, end))
+
+
+def count_recent(base_dir: str, since_sec: float) -> int:
+    now = datetime.now()
+    return count_frames(base_dir, now - timedelta(seconds=since_sec), None)
+
+
+def day_window(day: date):
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
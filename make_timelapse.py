@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+make_timelapse.py — archived/ の JPEG をデコードせずに Motion-JPEG の AVI へ並べる
+
+JPEG のバイト列をそのまま AVI の '00dc' チャンクとして書くだけなので、Pi でも I/O の速さで動画になる。
+フレームは日ごとにファイル名順で読み、書いたフレームの索引は一時ファイルに逃がすので、
+フレーム数が増えてもメモリ使用量は変わらない。
+
+1 GB を超える動画は OpenDML（AVI 2.0）形式で RIFF 'AVIX' を継ぎ足す。
+最初の RIFF には従来の idx1 も付けるので、古いプレーヤーでも最初の 1 GB 分は再生できる。
+
+    python3 make_timelapse.py                              # 昨日分
+    python3 make_timelapse.py --day 2026-10-16 --fps 30
+    python3 make_timelapse.py --from 2026-10-01 --to 2026-10-07 --stride 10
+"""
+
+import argparse
+import logging
+import os
+import struct
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+import dedupe
+import frame_index
+
+BASE_DIR = Path("/home/pi/timelapse-system")
+ARCHIVED_DIR = BASE_DIR / "archived"
+OUT_DIR = BASE_DIR / "timelapse"
+
+FPS = 30
+RIFF_LIMIT = 1 << 30          # 1つの RIFF の上限（OpenDML の慣例どおり 1 GB で次の AVIX へ）
+SUPER_INDEX_ENTRIES = 256     # indx に予約する RIFF の数（256 GB まで）
+
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+AVI_INDEX_OF_INDEXES = 0x00
+AVI_INDEX_OF_CHUNKS = 0x01
+DMLH_SIZE = 248
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """JPEG のヘッダ（SOF）から (幅, 高さ) を読む。JPEG でなければ None"""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:          # パディング
+            i += 1
+            continue
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker in SOF_MARKERS:
+            h, w = struct.unpack(">HH", data[i + 5:i + 9])
+            return w, h
+        i += 2 + length
+    return None
+
+
+class _Spool:
+    """索引エントリを一時ファイルに溜める（メモリに持たない）"""
+
+    def __init__(self):
+        self.f = tempfile.TemporaryFile()
+        self.count = 0
+
+    def add(self, data: bytes):
+        self.f.write(data)
+        self.count += 1
+
+    def copy_to(self, out: BinaryIO):
+        self.f.seek(0)
+        while True:
+            buf = self.f.read(1 << 20)
+            if not buf:
+                break
+            out.write(buf)
+
+    def close(self):
+        self.f.close()
+
+
+class MjpegAviWriter:
+    """JPEG をそのまま並べる Motion-JPEG AVI（OpenDML 対応）
+
+    with MjpegAviWriter(path, width, height, fps) as w:
+        w.add_frame(jpeg_bytes)
+    """
+
+    def __init__(self, path: str, width: int, height: int, fps: float = FPS,
+                 riff_limit: int = RIFF_LIMIT):
+        self.path = path
+        self.width, self.height = width, height
+        self.fps = fps
+        self.riff_limit = riff_limit
+        self.f = open(path, "wb")
+        self.frames = 0
+        self.max_chunk = 0
+        self.segments: List[Tuple[int, int, int]] = []    # (ix00 の位置, ix00 のサイズ, フレーム数)
+        self._write_headers()
+        self._idx1 = _Spool()
+        self._begin_riff(first=True)
+
+    # ===== ヘッダ =====
+
+    def _chunk_header(self, fourcc: bytes, size: int):
+        self.f.write(fourcc + struct.pack("<I", size))
+
+    def _open_list(self, kind: bytes, fourcc: bytes) -> int:
+        pos = self.f.tell()
+        self.f.write(kind + b"\0\0\0\0" + fourcc)
+        return pos
+
+    def _close_list(self, pos: int):
+        end = self.f.tell()
+        self.f.seek(pos + 4)
+        self.f.write(struct.pack("<I", end - pos - 8))
+        self.f.seek(end)
+
+    def _write_headers(self):
+        self.riff_pos = self._open_list(b"RIFF", b"AVI ")
+        hdrl = self._open_list(b"LIST", b"hdrl")
+        self.avih_pos = self.f.tell()
+        self._chunk_header(b"avih", 56)
+        self.f.write(b"\0" * 56)
+        strl = self._open_list(b"LIST", b"strl")
+        self.strh_pos = self.f.tell()
+        self._chunk_header(b"strh", 56)
+        self.f.write(b"\0" * 56)
+        self._chunk_header(b"strf", 40)
+        self.f.write(struct.pack("<IiiHH4sIiiII", 40, self.width, self.height, 1, 24,
+                                 b"MJPG", self.width * self.height * 3, 0, 0, 0, 0))
+        # OpenDML のスーパーインデックス（RIFF ごとの ix00 の場所）。中身は最後に書く
+        self.indx_pos = self.f.tell()
+        self._chunk_header(b"indx", 24 + 16 * SUPER_INDEX_ENTRIES)
+        self.f.write(b"\0" * (24 + 16 * SUPER_INDEX_ENTRIES))
+        self._close_list(strl)
+        odml = self._open_list(b"LIST", b"odml")
+        self.dmlh_pos = self.f.tell()
+        self._chunk_header(b"dmlh", DMLH_SIZE)
+        self.f.write(b"\0" * DMLH_SIZE)
+        self._close_list(odml)
+        self._close_list(hdrl)
+
+    def _write_avih(self):
+        first_frames = self.segments[0][2] if self.segments else self.frames
+        self.f.seek(self.avih_pos + 8)
+        self.f.write(struct.pack(
+            "<IIIIIIIIII16x",
+            int(round(1_000_000 / self.fps)), int(self.max_chunk * self.fps), 0,
+            AVIF_HASINDEX, first_frames, 0, 1, self.max_chunk, self.width, self.height))
+        self.f.seek(self.strh_pos + 8)
+        rate, scale = _fps_ratio(self.fps)
+        self.f.write(struct.pack(
+            "<4s4sIHHIIIIIIIIhhhh", b"vids", b"MJPG", 0, 0, 0, 0, scale, rate, 0,
+            self.frames, self.max_chunk, 0xFFFFFFFF, 0, 0, 0, self.width, self.height))
+        self.f.seek(self.dmlh_pos + 8)
+        self.f.write(struct.pack("<I", self.frames))
+
+    def _write_indx(self):
+        if len(self.segments) > SUPER_INDEX_ENTRIES:
+            raise ValueError(f"RIFF が {SUPER_INDEX_ENTRIES} 個を超えました")
+        self.f.seek(self.indx_pos + 8)
+        self.f.write(struct.pack("<HBBI4s12x", 4, 0, AVI_INDEX_OF_INDEXES,
+                                 len(self.segments), b"00dc"))
+        for pos, size, frames in self.segments:
+            self.f.write(struct.pack("<QII", pos, size, frames))
+
+    # ===== RIFF / movi =====
+
+    def _begin_riff(self, first: bool = False):
+        if not first:
+            self.riff_pos = self._open_list(b"RIFF", b"AVIX")
+        self.movi_pos = self._open_list(b"LIST", b"movi")
+        self.first_riff = first
+        self._ix = _Spool()
+
+    def _end_riff(self):
+        # ix00（この RIFF のフレームの位置。movi の中に置く）
+        ix_pos = self.f.tell()
+        n = self._ix.count
+        self._chunk_header(b"ix00", 24 + 8 * n)
+        self.f.write(struct.pack("<HBBI4sQ4x", 2, 0, AVI_INDEX_OF_CHUNKS, n, b"00dc",
+                                 self.movi_pos))
+        self._ix.copy_to(self.f)
+        self._ix.close()
+        self.segments.append((ix_pos, 32 + 8 * n, n))
+        self._close_list(self.movi_pos)
+        if self.first_riff:
+            self._chunk_header(b"idx1", 16 * self._idx1.count)
+            self._idx1.copy_to(self.f)
+            self._idx1.close()
+        self._close_list(self.riff_pos)
+
+    def add_frame(self, jpeg: bytes):
+        size = len(jpeg)
+        padded = size + (size & 1)
+        # このフレームと索引（ix00・最初の RIFF なら idx1）を足しても上限に収まらなければ次の RIFF へ
+        index_size = 32 + 8 * (self._ix.count + 1)
+        if self.first_riff:
+            index_size += 8 + 16 * (self._idx1.count + 1)
+        if self._ix.count and \
+                self.f.tell() - self.riff_pos + 8 + padded + index_size > self.riff_limit:
+            self._end_riff()
+            self._begin_riff()
+        pos = self.f.tell()
+        self._chunk_header(b"00dc", size)
+        self.f.write(jpeg)
+        if size & 1:
+            self.f.write(b"\0")
+        if self.first_riff:
+            # idx1 の位置は 'movi' の FOURCC からの相対
+            self._idx1.add(struct.pack("<4sIII", b"00dc", AVIIF_KEYFRAME,
+                                       pos - (self.movi_pos + 8), size))
+        # ix00 の位置は movi LIST の先頭からの相対で、チャンクのデータ部を指す
+        self._ix.add(struct.pack("<II", pos + 8 - self.movi_pos, size))
+        self.frames += 1
+        self.max_chunk = max(self.max_chunk, size)
+
+    def close(self):
+        if self.f.closed:
+            return
+        self._end_riff()
+        self._write_avih()
+        self._write_indx()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _fps_ratio(fps: float) -> Tuple[int, int]:
+    """dwRate / dwScale（29.97 などの小数も表せるように 1000 倍で持つ）"""
+    if float(fps).is_integer():
+        return int(fps), 1
+    return int(round(fps * 1000)), 1000
+
+
+# ===== フレームの列挙 =====
+
+def iter_day_frames(base_dir: Path, start: date, end: date,
+                    dedupe_dir: Optional[Path] = dedupe.MANIFEST_DIR) -> Iterator[str]:
+    """start〜end（両端含む）のフレームを日ごと・ファイル名順に返す（1日分ずつしか持たない）
+
+    dedupe.py で間引いた時刻には、マニフェストから代わりに残したフレームを入れる（元の時間軸のまま）。
+    """
+    day = start
+    while day <= end:
+        t0, t1 = frame_index.day_window(day)
+        day_dir = base_dir / day.isoformat()
+        src = day_dir if day_dir.is_dir() else base_dir
+        paths = [fr.path for fr in frame_index.list_frames(str(src), t0, t1)]
+        if dedupe_dir is not None:
+            paths = dedupe.timeline(day, paths, dedupe_dir)
+        yield from paths
+        day += timedelta(days=1)
+
+
+def build(paths: Iterable[str], out: str, fps: float = FPS, stride: int = 1,
+          riff_limit: int = RIFF_LIMIT) -> dict:
+    """paths の stride 枚ごとに1枚を out へ書く。統計を返す"""
+    t0 = time.monotonic()
+    writer = None
+    skipped = 0
+    total_bytes = 0
+    try:
+        for i, path in enumerate(paths):
+            if i % stride:
+                continue
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError as e:
+                logging.warning(f"⚠️ 読めないフレームを飛ばします: {path} ({e})")
+                skipped += 1
+                continue
+            size = jpeg_size(data)
+            if size is None:
+                logging.warning(f"⚠️ JPEG でないフレームを飛ばします: {path}")
+                skipped += 1
+                continue
+            if writer is None:
+                writer = MjpegAviWriter(out, size[0], size[1], fps, riff_limit)
+            elif size != (writer.width, writer.height):
+                logging.warning(f"⚠️ 解像度の違うフレームを飛ばします: {path} {size}")
+                skipped += 1
+                continue
+            writer.add_frame(data)
+            total_bytes += len(data)
+    finally:
+        if writer is not None:
+            writer.close()
+    return {
+        "frames": writer.frames if writer else 0,
+        "riffs": len(writer.segments) if writer else 0,
+        "skipped": skipped,
+        "bytes": total_bytes,
+        "elapsed": time.monotonic() - t0,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="archived/ の JPEG から MJPEG AVI のタイムラプスを作る")
+    p.add_argument("--day", type=date.fromisoformat, help="対象日（既定: 昨日）")
+    p.add_argument("--from", dest="start", type=date.fromisoformat, help="開始日")
+    p.add_argument("--to", dest="end", type=date.fromisoformat, help="終了日（含む。既定: 開始日）")
+    p.add_argument("--fps", type=float, default=FPS)
+    p.add_argument("--stride", type=int, default=1, help="N 枚ごとに1枚使う（既定 1 = 全部）")
+    p.add_argument("--base-dir", type=Path, default=ARCHIVED_DIR)
+    p.add_argument("--out", help=f"出力先（既定 {OUT_DIR}/<日付>.avi）")
+    a = p.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    if a.stride < 1:
+        p.error("--stride は 1 以上")
+    start = a.start or a.day or (datetime.now().date() - timedelta(days=1))
+    end = a.end or start
+    name = start.isoformat() if start == end else f"{start}_{end}"
+    out = a.out or str(OUT_DIR / f"{name}.avi")
+    Path(out).parent.mkdir(parents=True, exist_ok=True)
+
+    logging.info(f"🎬 {start}〜{end} のタイムラプス作成開始（{a.fps:g} fps, stride {a.stride}）")
+    stats = build(iter_day_frames(a.base_dir, start, end), out, a.fps, a.stride)
+    if stats["frames"] == 0:
+        logging.error("❌ フレームがありません")
+        if os.path.exists(out):
+            os.remove(out)
+        raise SystemExit(1)
+    mb = stats["bytes"] / 1024 / 1024
+    logging.info(f"✅ {out}: {stats['frames']} フレーム / {mb:.0f} MB / RIFF {stats['riffs']} 個 "
+                 f"/ {stats['elapsed']:.1f} 秒（{mb / max(stats['elapsed'], 1e-6):.0f} MB/s）"
+                 + (f" / 飛ばした {stats['skipped']} 枚" if stats["skipped"] else ""))
+
+
+if __name__ == "__main__":
+    main()
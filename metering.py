@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+metering.py — 輝度(Y)プレーンからの明るさ測定
+
+identify -format "%[fx:mean]" でフル解像度 JPEG をデコードする代わりに、
+lores ストリームの Y プレーン（640x360）を NumPy でまとめて集計する。
+ヒストグラムを1回作れば平均・白飛び・黒つぶれはそこから求まる。
+
+identify の mean は R,G,B の平均で、Y（輝度）の平均とは色の付いた場面でずれる。
+MANUAL_THRESHOLD やアラート・グラフの閾値は identify の値で決めてあるので、CSV の mean には
+U/V プレーンの平均から同じ尺度（METER_RGB）に直した値を書き、どの測り方かを末尾の列に残す。
+
+    python3 metering.py images/20250501_120000.jpg   # JPEG を 1/8 縮小デコードして測定
+"""
+
+import sys
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# numpy は読み込みが重いので使う関数の中で import する
+# （meter の定数・row_meter はアラートやレポートからも読むので）
+
+# mean の測り方（brightness CSV の meter 列）
+METER_IDENTIFY = "identify"   # capture.sh: JPEG の R,G,B 平均（ImageMagick %[fx:mean]）
+METER_RGB = "rgb"             # capture_daemon.py: lores の Y/U/V 平均から求めた R,G,B 平均
+METER_LUMA = "luma"           # 旧 capture_daemon.py: lores の Y 平均（identify と尺度が違う）
+# identify と同じ尺度で、同じ閾値で比べてよいもの
+COMPARABLE_METERS = (METER_IDENTIFY, METER_RGB)
+
+HIST_BINS = 16
+CLIP_LEVEL = 250    # これ以上を白飛びとみなす (0-255)
+CRUSH_LEVEL = 5     # これ以下を黒つぶれとみなす
+GRID = 3            # 領域別平均の分割数 (GRID x GRID)
+
+# brightness CSV の既存9列の後ろに追加する列
+CSV_COLUMNS = ["clipped", "crushed", "regions", "histogram", "meter"]
+METER_FIELD = 9 + CSV_COLUMNS.index("meter")
+
+
+@dataclass
+class Metering:
+    mean: float               # 0.0-1.0
+    clipped: float            # 白飛び画素の割合
+    crushed: float            # 黒つぶれ画素の割合
+    regions: List[float]      # GRID x GRID の領域別平均（行優先, 0.0-1.0）
+    histogram: List[int]      # HIST_BINS 階級の画素数
+    meter: str = METER_LUMA   # mean の測り方（chroma を渡したときは METER_RGB）
+
+    def csv_fields(self) -> List[str]:
+        # 既存の読み手がカンマ数で列を数えているので、複数値は ; で1列にまとめる
+        return [
+            f"{self.clipped:.4f}",
+            f"{self.crushed:.4f}",
+            ";".join(f"{v:.4f}" for v in self.regions),
+            ";".join(str(n) for n in self.histogram),
+            self.meter,
+        ]
+
+
+def y_plane(yuv420: "np.ndarray", height: int) -> "np.ndarray":
+    """Picamera2 の YUV420 配列 (h*3/2, w) から Y プレーンだけを取り出す（コピーなし）"""
+    return yuv420[:height]
+
+
+def uv_planes(yuv420: "np.ndarray", height: int) -> Tuple["np.ndarray", "np.ndarray"]:
+    """同じ配列の U / V プレーン（各 w/2 x h/2 が h/4 行ずつ並ぶ。コピーなし）"""
+    quarter = height // 4
+    return yuv420[height:height + quarter], yuv420[height + quarter:height + 2 * quarter]
+
+
+def rgb_mean(y_mean: float, u_mean: float, v_mean: float) -> float:
+    """Y/U/V の平均（0-255）から R,G,B 平均（0.0-1.0）を求める
+
+    still 構成の lores は sYCC（BT.601 フルレンジ）なので R+G+B は Y と U/V の一次式になり、
+    平均どうしで計算できる。画素ごとの 0-255 への丸めは無視する（彩度の高い白飛びで少しずれる）。
+    """
+    cb, cr = u_mean - 128, v_mean - 128
+    # ((Y + 1.402Cr) + (Y - 0.344136Cb - 0.714136Cr) + (Y + 1.772Cb)) / 3
+    return min(1.0, max(0.0, (y_mean + (1.427864 * cb + 0.687864 * cr) / 3) / 255))
+
+
+def measure(y: "np.ndarray",
+            chroma: Optional[Tuple["np.ndarray", "np.ndarray"]] = None) -> Metering:
+    """Y プレーンを測る。chroma（U, V）を渡すと mean を identify と同じ R,G,B 平均にする"""
+    import numpy as np
+    y = np.ascontiguousarray(y, dtype=np.uint8)
+    n = y.size
+    hist256 = np.bincount(y.ravel(), minlength=256)
+    y_sum = float(hist256 @ np.arange(256))
+    if chroma is None:
+        mean, meter = y_sum / n / 255, METER_LUMA
+    else:
+        u, v = chroma
+        mean = rgb_mean(y_sum / n, float(u.mean()), float(v.mean()))
+        meter = METER_RGB
+
+    h, w = y.shape
+    gh, gw = h // GRID, w // GRID
+    grid = y[:gh * GRID, :gw * GRID].reshape(GRID, gh, GRID, gw)
+    regions = (grid.mean(axis=(1, 3)) / 255).ravel()
+
+    return Metering(
+        mean=mean,
+        clipped=float(hist256[CLIP_LEVEL:].sum()) / n,
+        crushed=float(hist256[:CRUSH_LEVEL + 1].sum()) / n,
+        regions=[float(v) for v in regions],
+        histogram=[int(v) for v in hist256.reshape(HIST_BINS, -1).sum(axis=1)],
+        meter=meter,
+    )
+
+
+def measure_jpeg(path: str, scale: int = 8) -> Metering:
+    """JPEG を YCbCr のまま 1/scale に縮小デコード（DCT 段階で縮小）して測定
+
+    JFIF の YCbCr は lores と同じ BT.601 フルレンジなので、mean は measure() と同じく METER_RGB。
+    """
+    import numpy as np
+    from PIL import Image
+    with Image.open(path) as img:
+        img.draft("YCbCr", (img.width // scale, img.height // scale))
+        ycc = np.asarray(img.convert("YCbCr"))
+    return measure(ycc[..., 0], (ycc[..., 1], ycc[..., 2]))
+
+
+def row_meter(row: List[str]) -> str:
+    """brightness CSV の1行の mean がどの測り方か"""
+    if len(row) > METER_FIELD and row[METER_FIELD]:
+        return row[METER_FIELD]
+    # meter 列が無い行: 追加列があるのは旧 capture_daemon.py（Y 平均）、9列は capture.sh
+    return METER_LUMA if len(row) > 9 else METER_IDENTIFY
+
+
+if __name__ == "__main__":
+    for p in sys.argv[1:]:
+        m = measure_jpeg(p)
+        print(f"{p}: mean={m.mean:.4f} ({m.meter}) clipped={m.clipped:.4f}"
+              f" crushed={m.crushed:.4f}")
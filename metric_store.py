@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+metric_store.py — monitor.py の計測値ストア (SQLite)
+
+system_log.csv は追記のみで増え続け、日次サマリのたびに全行を読み直していた。
+こちらは日付列にインデックスを張り、日次集計 (daily) を書き込みのたびに
+インクリメンタルに更新するので、サマリは対象日の1行を読むだけで済む。
+"""
+
+import csv
+import math
+import sqlite3
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    ts           TEXT NOT NULL,
+    day          TEXT NOT NULL,
+    images_kb    INTEGER,
+    archived_kb  INTEGER,
+    images_pct   REAL,
+    archived_pct REAL,
+    temp_c       REAL,
+    new_img      INTEGER,
+    img_cnt      INTEGER,
+    load1        REAL,
+    mem_pct      REAL,
+    temp_min     REAL,
+    temp_max     REAL,
+    load1_min    REAL,
+    load1_max    REAL,
+    mem_min      REAL,
+    mem_max      REAL,
+    n_samples    INTEGER
+);
+CREATE INDEX IF NOT EXISTS samples_day ON samples(day);
+CREATE TABLE IF NOT EXISTS daily (
+    day              TEXT PRIMARY KEY,
+    samples          INTEGER NOT NULL,
+    images_pct_max   REAL,
+    archived_pct_max REAL,
+    temp_sum         REAL,
+    temp_count       INTEGER,
+    temp_max         REAL,
+    new_img_total    INTEGER
+);
+"""
+
+# 集計列（monitor.py --daemon の行だけが持つ）。古いDBには ALTER TABLE で足す
+AGGREGATE_COLUMNS = {
+    "temp_min": "REAL", "temp_max": "REAL",
+    "load1_min": "REAL", "load1_max": "REAL",
+    "mem_min": "REAL", "mem_max": "REAL",
+    "n_samples": "INTEGER",
+}
+
+UPSERT_DAILY = """
+INSERT INTO daily (day, samples, images_pct_max, archived_pct_max,
+                   temp_sum, temp_count, temp_max, new_img_total)
+VALUES (:day, 1, :images_pct, :archived_pct,
+        :temp_c, :temp_count, :temp_peak, :new_img)
+ON CONFLICT(day) DO UPDATE SET
+    samples          = samples + 1,
+    images_pct_max   = max(coalesce(images_pct_max, excluded.images_pct_max),
+                           coalesce(excluded.images_pct_max, images_pct_max)),
+    archived_pct_max = max(coalesce(archived_pct_max, excluded.archived_pct_max),
+                           coalesce(excluded.archived_pct_max, archived_pct_max)),
+    temp_sum         = coalesce(temp_sum, 0) + coalesce(excluded.temp_sum, 0),
+    temp_count       = temp_count + excluded.temp_count,
+    temp_max         = max(coalesce(temp_max, excluded.temp_max),
+                           coalesce(excluded.temp_max, temp_max)),
+    new_img_total    = new_img_total + coalesce(excluded.new_img_total, 0)
+"""
+
+# 一括取り込み後に samples から daily を作り直す
+REBUILD_DAILY = """
+INSERT OR REPLACE INTO daily
+SELECT day, count(*), max(images_pct), max(archived_pct),
+       sum(temp_c), count(temp_c), max(coalesce(temp_max, temp_c)),
+       coalesce(sum(new_img), 0)
+FROM samples GROUP BY day
+"""
+
+
+@dataclass
+class Sample:
+    ts: str                 # "YYYY-MM-DD HH:MM"
+    images_kb: int
+    archived_kb: int
+    images_pct: float
+    archived_pct: float
+    temp_c: Optional[float]
+    new_img: int
+    img_cnt: int
+    load1: float
+    mem_pct: float
+    # --daemon の集計行のみ（temp_c / load1 / mem_pct はその区間の平均）
+    temp_min: Optional[float] = None
+    temp_max: Optional[float] = None
+    load1_min: Optional[float] = None
+    load1_max: Optional[float] = None
+    mem_min: Optional[float] = None
+    mem_max: Optional[float] = None
+    n_samples: Optional[int] = None
+
+    @property
+    def day(self) -> str:
+        return self.ts[:10]
+
+    def csv_row(self) -> List[str]:
+        """system_log.csv と同じ書式の1行（集計行は後ろに集計列が付く）"""
+        temp = self.temp_c if self.temp_c is not None else float("nan")
+        row = [
+            self.ts, str(self.images_kb), str(self.archived_kb),
+            f"{self.images_pct:.1f}", f"{self.archived_pct:.1f}", f"{temp:.1f}",
+            str(self.new_img), str(self.img_cnt),
+            f"{self.load1:.2f}", f"{self.mem_pct:.1f}",
+        ]
+        if self.n_samples is not None:
+            def fmt(v, spec):
+                return "nan" if v is None else format(v, spec)
+            row += [fmt(self.temp_min, ".1f"), fmt(self.temp_max, ".1f"),
+                    fmt(self.load1_min, ".2f"), fmt(self.load1_max, ".2f"),
+                    fmt(self.mem_min, ".1f"), fmt(self.mem_max, ".1f"),
+                    str(self.n_samples)]
+        return row
+
+    @classmethod
+    def from_csv_row(cls, row: List[str]) -> "Sample":
+        def opt(v):
+            f = float(v)
+            return None if math.isnan(f) else f
+        extra = row[10:17]
+        row = row + ["0"] * (10 - len(row))
+        sample = cls(
+            ts=row[0],
+            images_kb=int(row[1]), archived_kb=int(row[2]),
+            images_pct=float(row[3]), archived_pct=float(row[4]),
+            temp_c=opt(row[5]),
+            new_img=int(row[6]), img_cnt=int(row[7]),
+            load1=float(row[8]), mem_pct=float(row[9]),
+        )
+        if len(extra) == 7:
+            (sample.temp_min, sample.temp_max, sample.load1_min,
+             sample.load1_max, sample.mem_min, sample.mem_max) = map(opt, extra[:6])
+            sample.n_samples = int(extra[6])
+        return sample
+
+
+@dataclass
+class DailyRollup:
+    day: str
+    samples: int
+    images_pct_max: float
+    archived_pct_max: float
+    temp_sum: Optional[float]
+    temp_count: int
+    temp_max: Optional[float]
+    new_img_total: int
+
+    @property
+    def temp_avg(self) -> Optional[float]:
+        return self.temp_sum / self.temp_count if self.temp_count else None
+
+
+SAMPLE_COLUMNS = [f.name for f in fields(Sample)]
+
+
+class MetricStore:
+    def __init__(self, path: Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        have = {r[1] for r in self.conn.execute("PRAGMA table_info(samples)")}
+        with self.conn:
+            for col, typ in AGGREGATE_COLUMNS.items():
+                if col not in have:
+                    self.conn.execute(f"ALTER TABLE samples ADD COLUMN {col} {typ}")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def is_empty(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM samples LIMIT 1").fetchone() is None
+
+    def _sample_params(self, s: Sample) -> dict:
+        params = {name: getattr(s, name) for name in SAMPLE_COLUMNS}
+        params["day"] = s.day
+        params["temp_count"] = 0 if s.temp_c is None else 1
+        params["temp_peak"] = s.temp_max if s.temp_max is not None else s.temp_c
+        return params
+
+    def append(self, sample: Sample):
+        params = self._sample_params(sample)
+        cols = SAMPLE_COLUMNS + ["day"]
+        with self.conn:
+            self.conn.execute(
+                f"INSERT INTO samples ({', '.join(cols)}) "
+                f"VALUES ({', '.join(':' + c for c in cols)})", params)
+            self.conn.execute(UPSERT_DAILY, params)
+
+    def day_samples(self, day: str) -> List[Sample]:
+        cur = self.conn.execute(
+            f"SELECT {', '.join(SAMPLE_COLUMNS)} FROM samples "
+            "WHERE day = ? ORDER BY rowid", (day,))
+        return [Sample(*r) for r in cur]
+
+    def rollup(self, day: str) -> Optional[DailyRollup]:
+        r = self.conn.execute(
+            "SELECT day, samples, images_pct_max, archived_pct_max, temp_sum, "
+            "temp_count, temp_max, new_img_total FROM daily WHERE day = ?",
+            (day,)).fetchone()
+        return DailyRollup(*r) if r else None
+
+    def iter_samples(self) -> Iterator[Sample]:
+        cur = self.conn.execute(
+            f"SELECT {', '.join(SAMPLE_COLUMNS)} FROM samples ORDER BY rowid")
+        for r in cur:
+            yield Sample(*r)
+
+    def import_csv(self, csv_path: Path, force: bool = False) -> int:
+        """既存の system_log.csv を取り込む（1回限りの移行用）
+
+        open_store() が初回に自動で取り込むので、空でないストアへの取り込みは重複になる。
+        force=True のときだけ取り込み、その場合もストアに既にある時刻の行は飛ばす。
+        """
+        if not self.is_empty() and not force:
+            raise ValueError("ストアは空ではありません（取り込み済みの可能性。重ねるなら --force）")
+        existing = {r[0] for r in self.conn.execute("SELECT DISTINCT ts FROM samples")}
+        cols = SAMPLE_COLUMNS + ["day"]
+        sql = (f"INSERT INTO samples ({', '.join(cols)}) "
+               f"VALUES ({', '.join(':' + c for c in cols)})")
+        count = 0
+        with self.conn, open(csv_path, newline="") as f:
+            for row in csv.reader(f):
+                if not row:
+                    continue
+                try:
+                    sample = Sample.from_csv_row(row)
+                except ValueError:
+                    continue
+                if sample.ts in existing:
+                    continue
+                self.conn.execute(sql, self._sample_params(sample))
+                count += 1
+            self.conn.execute(REBUILD_DAILY)
+        return count
+
+    def export_csv(self, csv_path: Path) -> int:
+        count = 0
+        with open(csv_path, "w", newline="") as f:
+            w = csv.writer(f)
+            for s in self.iter_samples():
+                w.writerow(s.csv_row())
+                count += 1
+        return count
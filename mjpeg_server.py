@@ -3,20 +3,42 @@
 # 開始エイリアス 5分 camview
 # 終了コマンド pkill -2 -f "python.*mjpeg_server.py"
 
+import argparse
+import asyncio
+import functools
+import hashlib
 import io
+import json
 import logging
 import socketserver
+import time
 from http import server
-from threading import Condition
-from picamera2 import Picamera2
-from picamera2.encoders import JpegEncoder, Quality
-from picamera2.outputs import FileOutput
+from email.utils import formatdate
+from threading import Condition, Lock
+
+from camera_backend import load_backend
+
+try:
+    # picamera2 の依存（JpegEncoder と同じ libjpeg-turbo）。ダミーカメラの環境には無いことがある
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
 
 # Configuration Constants
 PORT = 8000
 MAIN_RESOLUTION = (2304, 1296)
 LORES_RESOLUTION = (640, 360)
 FPS = 10
+MAIN_QUALITY = "LOW"
+LORES_QUALITY = "MEDIUM"
+SNAPSHOT_QUALITY = 90
+SNAPSHOT_MAX_AGE = 1.0  # 秒。この間の再リクエストにはキャッシュを返す
+# /stream.mjpg がこの品質以上で動いていれば、そのフレームを静止画としてそのまま返す
+SNAPSHOT_REUSE_QUALITY = "VERY_HIGH"
+QUALITIES = ["VERY_LOW", "LOW", "MEDIUM", "HIGH", "VERY_HIGH"]
+# Picamera2 の main ストリームの形式 → simplejpeg の colorspace（メモリ上のバイト順）
+SIMPLEJPEG_COLORSPACE = {"XBGR8888": "RGBX", "XRGB8888": "BGRX",
+                         "BGR888": "RGB", "RGB888": "BGR"}
 
 HTML_PAGE = """
 <!doctype html>
@@ -71,9 +93,11 @@ HTML_PAGE = """
 </head>
 <body>
   <div id="videoContainer">
-    <img id="camera" src="stream.mjpg" />
+    <img id="camera" src="stream_lo.mjpg" />
   </div>
   <div id="controls">
+    <button class="btn" onclick="setStream('stream_lo.mjpg')">LO</button>
+    <button class="btn" onclick="setStream('stream.mjpg')">HI</button>
     <button class="btn" onclick="setRotation(0)">0</button>
     <button class="btn" onclick="setRotation(90)">90</button>
     <button class="btn" onclick="setRotation(180)">180</button>
@@ -81,6 +105,9 @@ HTML_PAGE = """
   </div>
 
   <script>
+    function setStream(src) {
+      document.getElementById("camera").src = src;
+    }
     function setRotation(deg) {
       document.getElementById("camera").style.transform = "rotate(" + deg + "deg)";
     }
@@ -90,23 +117,291 @@ HTML_PAGE = """
 """
 
 
+class _SlotCounters:
+    def __init__(self, address):
+        self.address = address
+        self.frame = None
+        self.seq = 0
+        self.sent = 0
+        self.dropped = 0
+
+    def stats(self):
+        return {
+            "client": f"{self.address[0]}:{self.address[1]}",
+            "seq": self.seq,
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+
+    def client_stats(self):
+        return [self.stats()]
+
+
+class ClientSlot(_SlotCounters):
+    """クライアント毎の「最新フレーム」置き場。
+
+    送信が追いつかないクライアントは未送信フレームを最新で上書きし
+    (drop-to-latest)、他のクライアントやエンコーダを待たせない。
+    """
+
+    def __init__(self, address):
+        super().__init__(address)
+        self.condition = Condition()
+
+    def offer(self, seq, frame):
+        with self.condition:
+            if self.frame is not None:
+                # 前のフレームを送る前に次が来た → 捨てて最新に差し替え
+                self.dropped += 1
+            self.frame = frame
+            self.seq = seq
+            self.condition.notify()
+
+    def take(self):
+        with self.condition:
+            while self.frame is None:
+                self.condition.wait()
+            frame, self.frame = self.frame, None
+            return frame
+
+
+class AsyncClientSlot(_SlotCounters):
+    """ClientSlot の asyncio 版。イベントループのスレッドからのみ触る。"""
+
+    def __init__(self, address):
+        super().__init__(address)
+        self.event = asyncio.Event()
+
+    def offer(self, seq, frame):
+        if self.frame is not None:
+            self.dropped += 1
+        self.frame = frame
+        self.seq = seq
+        self.event.set()
+
+    async def take(self):
+        while self.frame is None:
+            self.event.clear()
+            await self.event.wait()
+        frame, self.frame = self.frame, None
+        return frame
+
+
+class AsyncFanout:
+    """StreamingOutput の購読者。フレーム1枚につき1回だけイベントループへ渡す。"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.clients = set()
+
+    def offer(self, seq, frame):
+        # エンコーダスレッドから呼ばれる
+        self.loop.call_soon_threadsafe(self._dispatch, seq, frame)
+
+    def _dispatch(self, seq, frame):
+        for client in self.clients:
+            client.offer(seq, frame)
+
+    def client_stats(self):
+        return [c.stats() for c in self.clients]
+
+
 class StreamingOutput(io.BufferedIOBase):
     def __init__(self):
         self.frame = None
-        self.condition = Condition()
+        self.frame_mono = 0.0
+        self.sequence = 0
+        self._lock = Lock()
+        self._subscribers = set()
 
     def write(self, buf):
-        with self.condition:
+        # エンコーダスレッドから呼ばれる。各クライアントのスロットに置くだけで
+        # ソケットへの書き込みは待たない。
+        with self._lock:
+            self.sequence += 1
+            seq = self.sequence
             self.frame = buf
-            self.condition.notify_all()
+            self.frame_mono = time.monotonic()
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.offer(seq, buf)
+
+    def latest(self):
+        """最後にエンコードされた JPEG とその時刻（time.monotonic）"""
+        with self._lock:
+            return self.frame, self.frame_mono
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def register(self, address):
+        return self.subscribe(ClientSlot(address))
+
+    def unregister(self, client):
+        self.unsubscribe(client)
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            "sequence": self.sequence,
+            "clients": [st for sub in subscribers for st in sub.client_stats()],
+        }
+
+
+class StreamEndpoint:
+    """解像度1つ分の配信口。エンコーダは全視聴者で1つを共有する。
+
+    最初の視聴者が来たときにエンコーダを起動し、最後の視聴者が抜けたら止めるので、
+    誰も見ていない解像度はCPUを使わない。
+    """
+
+    def __init__(self, picam2, stream, quality):
+        self.picam2 = picam2
+        self.stream = stream
+        self.quality = quality
+        self.output = StreamingOutput()
+        self.encoder = None
+        self.viewers = 0
+        self._lock = Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.encoder is None:
+                encoder = backend.JpegEncoder()
+                # 起動に失敗したら視聴者数も増やさない（増えたままだと二度と 0 に戻らず止まらない）
+                self.picam2.start_encoder(
+                    encoder, backend.FileOutput(self.output),
+                    name=self.stream, quality=self.quality)
+                self.encoder = encoder
+                logging.info("Encoder started: %s (%s)",
+                             self.stream, self.quality.name)
+            self.viewers += 1
+
+    def release(self):
+        with self._lock:
+            self.viewers -= 1
+            if self.viewers == 0 and self.encoder is not None:
+                self.picam2.stop_encoder(self.encoder)
+                self.encoder = None
+                logging.info("Encoder stopped: %s", self.stream)
+
+    def stop(self):
+        with self._lock:
+            if self.encoder is not None:
+                self.picam2.stop_encoder(self.encoder)
+                self.encoder = None
+
+    def stats(self):
+        return {
+            "stream": self.stream,
+            "quality": self.quality.name,
+            "viewers": self.viewers,
+            "encoding": self.encoder is not None,
+            **self.output.stats(),
+        }
+
+
+class SnapshotCache:
+    """動作中の Picamera2 から main ストリームのフル解像度静止画を切り出す。
+
+    カメラを止めずに1フレーム取り出すだけなので、libcamera-jpeg の起動を待つ必要がない。
+    SNAPSHOT_MAX_AGE 以内の再リクエストには同じ JPEG と ETag を返す。
+
+    フル解像度の JPEG エンコードはキャッシュが切れるたびに走るので、安い順に
+    1. /stream.mjpg のエンコーダが SNAPSHOT_REUSE_QUALITY 以上で動いていればその最新フレーム
+    2. simplejpeg で main の配列から直接（PIL の Image を作らない）
+    3. PIL（simplejpeg が無いダミーカメラ環境）
+    を使う。どれを使ったかと所要時間は "Snapshot captured" のログに出る。
+    """
+
+    def __init__(self, picam2, quality=SNAPSHOT_QUALITY,
+                 max_age=SNAPSHOT_MAX_AGE, stream=None):
+        self.picam2 = picam2
+        self.quality = quality
+        self.max_age = max_age
+        self.stream = stream
+        self.jpeg = None
+        self.etag = None
+        self.taken_at = 0.0
+        self._taken_mono = 0.0
+        self._lock = Lock()
+
+    def get(self):
+        with self._lock:
+            if self.jpeg is None or \
+                    time.monotonic() - self._taken_mono > self.max_age:
+                self._capture()
+            return self.jpeg, self.etag, self.taken_at
+
+    def _capture(self):
+        t0 = time.monotonic()
+        jpeg, source = self._stream_frame(), "stream"
+        if jpeg is None:
+            jpeg, source = self._encode()
+        self.jpeg = jpeg
+        self.etag = '"%s"' % hashlib.sha1(self.jpeg).hexdigest()[:20]
+        self.taken_at = time.time()
+        self._taken_mono = time.monotonic()
+        logging.info("Snapshot captured: %d bytes in %.0f ms (%s)",
+                     len(self.jpeg), (self._taken_mono - t0) * 1000, source)
+
+    def _stream_frame(self):
+        # 既定の LOW では静止画（capture.sh が images/ に保存する）には粗いので使わない
+        ep = self.stream
+        if ep is None or ep.encoder is None or \
+                QUALITIES.index(ep.quality.name) < QUALITIES.index(SNAPSHOT_REUSE_QUALITY):
+            return None
+        frame, mono = ep.output.latest()
+        if frame is None or time.monotonic() - mono > self.max_age:
+            return None
+        return bytes(frame)
+
+    def _encode(self):
+        fmt = getattr(self.picam2, "camera_config", None) or {}
+        colorspace = SIMPLEJPEG_COLORSPACE.get(fmt.get("main", {}).get("format"))
+        request = self.picam2.capture_request()
+        try:
+            if simplejpeg is not None and colorspace:
+                return simplejpeg.encode_jpeg(
+                    request.make_array("main"), quality=self.quality,
+                    colorspace=colorspace, colorsubsampling="420"), "simplejpeg"
+            image = request.make_image("main").convert("RGB")
+        finally:
+            request.release()
+        buf = io.BytesIO()
+        image.save(buf, format="JPEG", quality=self.quality)
+        return buf.getvalue(), "PIL"
+
+
+def all_stats():
+    return {path: ep.stats() for path, ep in endpoints.items()}
+
+
+def snapshot_headers(etag, taken_at):
+    return {
+        'ETag': etag,
+        'Cache-Control': 'no-cache',
+        'Last-Modified': formatdate(taken_at, usegmt=True),
+    }
 
 
 class StreamingHandler(server.BaseHTTPRequestHandler):
     def do_GET(self):
         if self.path in ['/', '/index.html']:
             self._send_index()
-        elif self.path == '/stream.mjpg':
-            self._stream_mjpeg()
+        elif self.path in endpoints:
+            self._stream_mjpeg(endpoints[self.path])
+        elif self.path == '/stats.json':
+            self._send_stats()
+        elif self.path == '/snapshot.jpg':
+            self._send_snapshot()
         else:
             self.send_error(404)
 
@@ -118,28 +413,63 @@ class StreamingHandler(server.BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(content)
 
-    def _stream_mjpeg(self):
+    def _send_stats(self):
+        content = json.dumps(all_stats()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Cache-Control', 'no-cache, private')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_snapshot(self):
+        try:
+            jpeg, etag, taken_at = snapshot.get()
+        except Exception as e:
+            logging.error('Snapshot failed: %s', e)
+            self.send_error(503)
+            return
+        headers = snapshot_headers(etag, taken_at)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(jpeg)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(jpeg)
+
+    def _stream_mjpeg(self, endpoint):
         self.send_response(200)
         self.send_header('Cache-Control', 'no-cache, private')
         self.send_header(
             'Content-Type', 'multipart/x-mixed-replace; boundary=FRAME')
         self.end_headers()
+        endpoint.acquire()
+        client = endpoint.output.register(self.client_address)
         try:
             while True:
-                with output.condition:
-                    output.condition.wait()
-                    frame = output.frame
+                frame = client.take()
                 self.wfile.write(b'--FRAME\r\n')
                 self.send_header('Content-Type', 'image/jpeg')
-                if frame is None:
-                    continue
                 self.send_header('Content-Length', str(len(frame)))
                 self.end_headers()
                 self.wfile.write(frame)
                 self.wfile.write(b'\r\n')
+                client.sent += 1
         except Exception as e:
             logging.warning('Client disconnected %s: %s',
                             self.client_address, str(e))
+        finally:
+            endpoint.output.unregister(client)
+            endpoint.release()
+            logging.info('Client %s: sent=%d dropped=%d',
+                         self.client_address, client.sent, client.dropped)
 
 
 class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
@@ -147,8 +477,118 @@ class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
     daemon_threads = True
 
 
-def setup_camera():
-    picam2 = Picamera2()
+async def _write_response(writer, status, content_type, content,
+                          headers=None):
+    headers = headers or {'Cache-Control': 'no-cache, private'}
+    head = f"HTTP/1.0 {status}\r\n"
+    if content_type:
+        head += f"Content-Type: {content_type}\r\n"
+    if not status.startswith("304"):
+        head += f"Content-Length: {len(content)}\r\n"
+    head += "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+    writer.write((head + "\r\n").encode("latin-1"))
+    writer.write(content)
+    await writer.drain()
+
+
+async def _async_send_snapshot(writer, request_headers):
+    loop = asyncio.get_running_loop()
+    try:
+        # 次フレームを待つのでイベントループを止めないよう別スレッドで取得
+        jpeg, etag, taken_at = await loop.run_in_executor(None, snapshot.get)
+    except Exception as e:
+        logging.error('Snapshot failed: %s', e)
+        await _write_response(writer, "503 Service Unavailable",
+                              "text/plain", b"Service Unavailable")
+        return
+    headers = snapshot_headers(etag, taken_at)
+    if request_headers.get('if-none-match') == etag:
+        await _write_response(writer, "304 Not Modified", None, b"", headers)
+    else:
+        await _write_response(writer, "200 OK", "image/jpeg", jpeg, headers)
+
+
+async def _async_stream_mjpeg(endpoint, fanout, writer, address):
+    writer.write(
+        b"HTTP/1.0 200 OK\r\n"
+        b"Cache-Control: no-cache, private\r\n"
+        b"Content-Type: multipart/x-mixed-replace; boundary=FRAME\r\n"
+        b"\r\n")
+    # エンコーダの起動・停止は短時間なのでループ上でそのまま行う
+    endpoint.acquire()
+    client = AsyncClientSlot(address)
+    fanout.clients.add(client)
+    try:
+        while True:
+            frame = await client.take()
+            writer.write(
+                b"--FRAME\r\nContent-Type: image/jpeg\r\n"
+                b"Content-Length: %d\r\n\r\n" % len(frame))
+            writer.write(frame)
+            writer.write(b"\r\n")
+            # 送信バッファが捌けるまで待つ間に届いたフレームはスロットで上書きされる
+            await writer.drain()
+            client.sent += 1
+    finally:
+        fanout.clients.discard(client)
+        endpoint.release()
+        logging.info('Client %s: sent=%d dropped=%d',
+                     address, client.sent, client.dropped)
+
+
+async def _handle_async_client(fanouts, reader, writer):
+    address = writer.get_extra_info('peername')[:2]
+    try:
+        request_line = await reader.readline()
+        request_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            request_headers[key.strip().lower()] = value.strip()
+        parts = request_line.decode('latin-1').split()
+        if len(parts) < 2:
+            return
+        method, path = parts[0], parts[1]
+        if method != 'GET':
+            await _write_response(writer, "405 Method Not Allowed",
+                                  "text/plain", b"Method Not Allowed")
+        elif path in ['/', '/index.html']:
+            await _write_response(writer, "200 OK", "text/html",
+                                  HTML_PAGE.encode('utf-8'))
+        elif path in endpoints:
+            await _async_stream_mjpeg(endpoints[path], fanouts[path],
+                                      writer, address)
+        elif path == '/stats.json':
+            await _write_response(writer, "200 OK", "application/json",
+                                  json.dumps(all_stats()).encode('utf-8'))
+        elif path == '/snapshot.jpg':
+            await _async_send_snapshot(writer, request_headers)
+        else:
+            await _write_response(writer, "404 Not Found",
+                                  "text/plain", b"Not Found")
+    except (ConnectionError, asyncio.IncompleteReadError) as e:
+        logging.warning('Client disconnected %s: %s', address, str(e))
+    finally:
+        writer.close()
+
+
+async def _serve_async(port):
+    loop = asyncio.get_running_loop()
+    fanouts = {path: ep.output.subscribe(AsyncFanout(loop))
+               for path, ep in endpoints.items()}
+    srv = await asyncio.start_server(
+        functools.partial(_handle_async_client, fanouts),
+        port=port, reuse_address=True)
+    async with srv:
+        await srv.serve_forever()
+
+
+def setup_camera(fake=False):
+    global backend
+    backend = load_backend(fake)
+    picam2 = backend.Picamera2()
     config = picam2.create_preview_configuration(
         lores={"size": LORES_RESOLUTION},
         main={"size": MAIN_RESOLUTION},
@@ -159,17 +599,30 @@ def setup_camera():
     return picam2
 
 
-def start_streaming(picam2):
-    global output
-    output = StreamingOutput()
-    picam2.start_recording(
-        JpegEncoder(), FileOutput(output), quality=Quality.LOW)
+def start_streaming(picam2, main_quality=MAIN_QUALITY,
+                    lores_quality=LORES_QUALITY):
+    global endpoints, snapshot
+    endpoints = {
+        '/stream.mjpg': StreamEndpoint(
+            picam2, "main", backend.Quality[main_quality]),
+        '/stream_lo.mjpg': StreamEndpoint(
+            picam2, "lores", backend.Quality[lores_quality]),
+    }
+    snapshot = SnapshotCache(picam2, stream=endpoints['/stream.mjpg'])
+    # エンコーダは視聴者が来るまで起動しない
+    picam2.start()
+
+
+def stop_streaming(picam2):
+    for ep in endpoints.values():
+        ep.stop()
+    picam2.stop()
 
 
-def run_server():
-    address = ('', PORT)
+def run_server(port=PORT):
+    address = ('', port)
     server = StreamingServer(address, StreamingHandler)
-    logging.info(f"Starting MJPEG preview at http://<Pi-IP>:{PORT}/")
+    logging.info(f"Starting MJPEG preview at http://<Pi-IP>:{port}/")
     try:
         server.serve_forever()
     except KeyboardInterrupt:
@@ -178,11 +631,39 @@ def run_server():
         server.shutdown()
 
 
+def run_async_server(port=PORT):
+    # 1スレッドのイベントループで全クライアントを捌く（クライアント毎のスレッドを作らない）
+    logging.info(
+        f"Starting MJPEG preview (asyncio) at http://<Pi-IP>:{port}/")
+    try:
+        asyncio.run(_serve_async(port))
+    except KeyboardInterrupt:
+        logging.info("Server shutdown requested.")
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Picamera2 MJPEG preview server")
+    p.add_argument("--engine", choices=["threaded", "asyncio"],
+                   default="threaded")
+    p.add_argument("--port", type=int, default=PORT)
+    p.add_argument("--main-quality", choices=QUALITIES, default=MAIN_QUALITY,
+                   help="/stream.mjpg の JPEG 品質")
+    p.add_argument("--lores-quality", choices=QUALITIES,
+                   default=LORES_QUALITY, help="/stream_lo.mjpg の JPEG 品質")
+    p.add_argument("--fake-camera", action="store_true",
+                   help="カメラなしでダミー映像を配信（ベンチマーク用）")
+    return p.parse_args()
+
+
 if __name__ == '__main__':
+    args = parse_args()
     logging.basicConfig(level=logging.INFO)
-    picam2 = setup_camera()
+    picam2 = setup_camera(args.fake_camera)
     try:
-        start_streaming(picam2)
-        run_server()
+        start_streaming(picam2, args.main_quality, args.lores_quality)
+        if args.engine == "asyncio":
+            run_async_server(args.port)
+        else:
+            run_server(args.port)
     finally:
-        picam2.stop_recording()
+        stop_streaming(picam2)
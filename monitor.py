@@ -5,32 +5,47 @@ monitor.py — Timelapse‑system Monitoring & Daily Summary (Slack Bot 対応
 
 import os
 import sys
-import csv
+import math
 import time
 import argparse
 import logging
 import pathlib
 import shutil
-import subprocess
+import signal
 import datetime
 from dataclasses import dataclass
-from typing import List, Optional, cast
+from typing import List, Optional, Tuple, cast
 
-
-import psutil
 from dotenv import load_dotenv
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
 
+import dir_size
+import frame_catalog
+import frame_index
+import notify_queue
+from metric_store import MetricStore, Sample
+from ring_buffer import SampleRing
 
-def count_yesterdays_images_from_archived() -> int:
-    archived_dir = "/home/pi/timelapse-system/archived"
-    yesterday = (datetime.datetime.now() -
-                 datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-    target_dir = os.path.join(archived_dir, yesterday)
-    if os.path.isdir(target_dir):
-        return len([f for f in os.listdir(target_dir) if f.endswith(".jpg")])
-    return 0
+
+def count_yesterdays_images_from_archived(date: Optional[datetime.date] = None) -> int:
+    archived_dir = DISK_PATHS["archived"]
+    if date is None:
+        date = datetime.date.today() - datetime.timedelta(days=1)
+    start, end = frame_index.day_window(date)
+    # archived/YYYY-MM-DD/ のうち対象日のディレクトリだけを名前で数える（1日1回なので安い）
+    counted = frame_index.count_frames(archived_dir, start, end)
+    cat = frame_catalog.open_catalog()
+    if cat is not None:
+        try:
+            with cat:
+                cataloged = cat.count(start, end, archived=True)
+            # 撮影側の登録失敗は見えないので、ここで台帳と実際の枚数を突き合わせる
+            if cataloged != counted:
+                logger.warning("⚠️ フレーム台帳の枚数がずれています（%s: 台帳 %d / 実際 %d）",
+                               date, cataloged, counted)
+                frame_catalog.mark_stale(f"monitor: {date} 台帳 {cataloged} / 実際 {counted}")
+        except Exception as e:
+            logger.warning("フレーム台帳の集計失敗: %s", e)
+    return counted
 
 
 ROOT = pathlib.Path(__file__).resolve().parent
@@ -43,6 +58,11 @@ TEMP_THRESHOLD = float(os.getenv("TEMP_THRESHOLD", 65.0))
 SUPPRESS_MIN = int(os.getenv("SUPPRESS_MIN", 30))
 LOAD_THRESHOLD = float(os.getenv("LOAD_THRESHOLD", 2.0))
 MEM_THRESHOLD = float(os.getenv("MEM_THRESHOLD", 80.0))
+# --daemon: 温度・負荷・メモリの取得間隔 / 集計行の書き込み間隔 / ディスク集計間隔（秒）
+SAMPLE_SEC = float(os.getenv("SAMPLE_SEC", 5))
+FLUSH_SEC = int(os.getenv("FLUSH_SEC", 3600))
+DISK_SEC = int(os.getenv("DISK_SEC", 60))
+OVERHEAD_LIMIT_PCT = 1.0
 
 DISK_PATHS = {
     "images": "/home/pi/timelapse-system/images",
@@ -50,40 +70,18 @@ DISK_PATHS = {
 }
 PARTITION_ROOT = "/home/pi"
 CSV_PATH = ROOT / "log" / "system_log.csv"
-SUPPRESS_FILE = ROOT / "log" / "last_alert"
-
-if not SLACK_BOT_TOKEN or not SLACK_DM_EMAIL:
-    raise EnvironmentError("SLACK_BOT_TOKEN または SLACK_DM_EMAIL が未設定です")
-
-
-client = WebClient(token=SLACK_BOT_TOKEN)
-
-
-def get_dm_channel() -> str:
-    try:
-        user_info = client.users_lookupByEmail(email=SLACK_DM_EMAIL)
-        user = user_info.get("user")
-        if not user or "id" not in user:
-            raise ValueError("SlackユーザーIDが取得できませんでした")
-        user_id = user["id"]
-
-        conv = client.conversations_open(users=user_id)
-        channel = conv.get("channel")
-        if not channel or "id" not in channel:
-            raise ValueError("SlackチャンネルIDが取得できませんでした")
-
-        return channel["id"]
+DB_PATH = ROOT / "log" / "system_metrics.db"
 
-    except SlackApiError as e:
-        raise RuntimeError(f"Slack API エラー: {e.response['error']}") from e
-
-
-def send_dm_message(text: str):
+# psutil は読み込みが重いので、実際に使う処理の中で import する。
+# Slack への送信は notify_queue に積むだけで、送信・再送はバックグラウンドの flusher が行う
+def send_dm_message(text: str, key: Optional[str] = None, header: str = "",
+                    suppress_sec: float = 0, spawn: bool = True) -> bool:
     try:
-        channel_id = get_dm_channel()
-        client.chat_postMessage(channel=channel_id, text=text)
+        return notify_queue.enqueue(text, key=key, header=header,
+                                    suppress_sec=suppress_sec, spawn=spawn) is not None
     except Exception as e:
-        print(f"[Slack送信エラー] {e}")
+        print(f"[Slack送信エラー] キューに積めませんでした: {e}")
+        return False
 
 
 LOG_PATH = ROOT / "log" / "monitor.log"
@@ -91,28 +89,41 @@ LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
+    # delay=True: 先に別の出先が決まっている（ベンチマークなど）とき、空の monitor.log を作らない
     handlers=[logging.FileHandler(
-        LOG_PATH), logging.StreamHandler(sys.stdout)],
+        LOG_PATH, delay=True), logging.StreamHandler(sys.stdout)],
 )
 logger = logging.getLogger(__name__)
 
 
 def dir_size_kb(path: str) -> int:
+    # du -s と同じ値。変更のあったディレクトリだけ数え直す（cache/dir_size.json）
     try:
-        out = subprocess.check_output(
-            ["du", "-s", "--block-size=1K", path], text=True)
-        return int(out.split()[0])
+        return dir_size.dir_size_kb(path)
     except Exception as e:
         logger.error("dir_size_kb失敗 %s: %s", path, e)
         return 0
 
 
+THERMAL_ZONE = pathlib.Path("/sys/class/thermal/thermal_zone0/temp")
+
+
 def cpu_temp_c() -> float:
+    # sysfs を直接読む（psutil.sensors_temperatures は全センサを走査するので高頻度だと重い）
     try:
+        return int(THERMAL_ZONE.read_text())/1000
+    except Exception:
+        pass
+    try:
+        import psutil
         return psutil.sensors_temperatures()['cpu_thermal'][0].current
     except Exception:
-        t = pathlib.Path("/sys/class/thermal/thermal_zone0/temp")
-        return int(t.read_text())/1000 if t.exists() else float("nan")
+        return float("nan")
+
+
+def mem_percent() -> float:
+    import psutil
+    return psutil.virtual_memory().percent
 
 
 @dataclass
@@ -122,92 +133,253 @@ class DiskMetric:
     pct: float
 
 
-def suppressed() -> bool:
-    return SUPPRESS_FILE.exists() and (time.time()-int(SUPPRESS_FILE.read_text())) < SUPPRESS_MIN*60
-
-
-def mark_alert(): SUPPRESS_FILE.write_text(str(int(time.time())))
+def open_store() -> MetricStore:
+    store = MetricStore(DB_PATH)
+    if store.is_empty() and CSV_PATH.exists():
+        # 初回のみ: これまでの system_log.csv を取り込む
+        n = store.import_csv(CSV_PATH)
+        logger.info("system_log.csv から %d 行を取り込みました", n)
+    return store
 
 
-def run_monitor(no_slack=False, ignore_suppress=False, force_alert=False):
-    ts = time.strftime("%Y-%m-%d %H:%M")
-    logger.info("監視開始 %s", ts)
-
+def disk_metrics(cache: Optional[dir_size.DirSizeCache] = None) -> List[DiskMetric]:
     total_kb = shutil.disk_usage(PARTITION_ROOT).total // 1024
     metrics: List[DiskMetric] = []
     for lbl, p in DISK_PATHS.items():
-        used = dir_size_kb(p)
+        if cache is None:
+            used = dir_size_kb(p)
+        else:
+            try:
+                used = cache.size_kb(p)
+            except Exception as e:
+                logger.error("dir_size_kb失敗 %s: %s", p, e)
+                used = 0
         metrics.append(DiskMetric(lbl, used, used / total_kb * 100))
+    return metrics
 
-    temp_c = cpu_temp_c()
-    load1 = os.getloadavg()[0]
-    mem_pct = psutil.virtual_memory().percent
 
-    def find_recent_images(base_dir: str, since_sec: int) -> list[float]:
+def count_recent_images(base_dir: str, since_sec: float) -> int:
+    return count_images_between(base_dir, time.time() - since_sec)
+
+
+def count_images_between(base_dir: str, start: float, end: Optional[float] = None) -> int:
+    # start <= 撮影時刻 < end（UNIX 秒）。台帳があればインデックスで数え、
+    # 無ければファイル名の撮影時刻で数える（規則外の名前のみ mtime）
+    start_dt = datetime.datetime.fromtimestamp(start)
+    end_dt = datetime.datetime.fromtimestamp(end) if end is not None else None
+    cat = frame_catalog.open_catalog()
+    if cat is not None:
         try:
-            out = subprocess.check_output(
-                ["find", base_dir, "-type", "f", "-name", "*.jpg", "-printf", "%T@\n"], text=True)
-            return [float(t) for t in out.splitlines() if time.time() - float(t) < since_sec]
+            with cat:
+                return cat.count(start_dt, end_dt)
         except Exception as e:
-            logger.warning("find失敗 %s: %s", base_dir, e)
-            return []
-
-    images_imgs = find_recent_images(DISK_PATHS["images"], 3600)
-    new_img = img_cnt = len(images_imgs)
+            logger.warning("フレーム台帳の集計失敗: %s", e)
+    try:
+        return frame_index.count_frames(base_dir, start_dt, end_dt)
+    except Exception as e:
+        logger.warning("画像カウント失敗 %s: %s", base_dir, e)
+        return 0
 
-    CSV_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with CSV_PATH.open("a", newline="") as f:
-        csv.writer(f).writerow([
-            ts, metrics[0].used_kb, metrics[1].used_kb,
-            f"{metrics[0].pct:.1f}", f"{metrics[1].pct:.1f}", f"{temp_c:.1f}",
-            new_img, img_cnt, f"{load1:.2f}", f"{mem_pct:.1f}"
-        ])
 
+def evaluate_alerts(metrics: List[DiskMetric], temp_c: float, load1: float,
+                    mem_pct: float, force_alert=False) -> List[Tuple[str, str]]:
+    """(抑制キー, 文面) のリスト"""
     alerts = []
     if force_alert:
-        alerts.append("🧪 強制テストアラート (--force-alert)")
+        alerts.append(("force", "🧪 強制テストアラート (--force-alert)"))
 
     for m in metrics:
         if m.pct >= DISK_THRESHOLD:
-            alerts.append(f"💾 {m.label} {m.pct:.1f}% (≧{DISK_THRESHOLD}%)")
+            alerts.append((f"disk:{m.label}", f"💾 {m.label} {m.pct:.1f}% (≧{DISK_THRESHOLD}%)"))
     if temp_c >= TEMP_THRESHOLD:
-        alerts.append(f"🌡️ CPU {temp_c:.1f}℃ (≧{TEMP_THRESHOLD}℃)")
+        alerts.append(("temp", f"🌡️ CPU {temp_c:.1f}℃ (≧{TEMP_THRESHOLD}℃)"))
     if load1 >= LOAD_THRESHOLD:
-        alerts.append(f"📈 LoadAvg {load1:.2f} (≧{LOAD_THRESHOLD})")
+        alerts.append(("load", f"📈 LoadAvg {load1:.2f} (≧{LOAD_THRESHOLD})"))
     if mem_pct >= MEM_THRESHOLD:
-        alerts.append(f"💽 Mem {mem_pct:.1f}% (≧{MEM_THRESHOLD}%)")
+        alerts.append(("mem", f"💽 Mem {mem_pct:.1f}% (≧{MEM_THRESHOLD}%)"))
+    return alerts
+
+
+def notify_alerts(alerts: List[Tuple[str, str]], no_slack=False, ignore_suppress=False) -> int:
+    """抑制中でないアラートを通知キューに積む（近い時刻のものは flusher が1通にまとめる）"""
+    if not alerts:
+        return 0
+    window = 0 if ignore_suppress else SUPPRESS_MIN * 60
+    host = pathlib.Path("/etc/hostname").read_text().strip()
+    queued = 0
+    for key, text in alerts:
+        key = f"monitor:{key}"
+        if no_slack:
+            if window == 0 or notify_queue.accept(key, window):
+                logger.warning("アラート: %s", text)
+                queued += 1
+        elif send_dm_message(text, key=key, header=f"🚨 *{host}*",
+                             suppress_sec=window, spawn=False):
+            queued += 1
+    if queued and not no_slack:
+        notify_queue.spawn_flusher()
+    return queued
+
 
-    if alerts and (ignore_suppress or not suppressed()) and not no_slack:
-        host = pathlib.Path("/etc/hostname").read_text().strip()
-        send_dm_message(f"🚨 *{host}*\n" + "\n".join(alerts))
-        mark_alert()
+def run_monitor(no_slack=False, ignore_suppress=False, force_alert=False):
+    ts = time.strftime("%Y-%m-%d %H:%M")
+    logger.info("監視開始 %s", ts)
+
+    metrics = disk_metrics()
+    temp_c = cpu_temp_c()
+    load1 = os.getloadavg()[0]
+    mem_pct = mem_percent()
+
+    new_img = img_cnt = count_recent_images(DISK_PATHS["images"], 3600)
+
+    with open_store() as store:
+        store.append(Sample(
+            ts=ts,
+            images_kb=metrics[0].used_kb, archived_kb=metrics[1].used_kb,
+            images_pct=round(metrics[0].pct, 1),
+            archived_pct=round(metrics[1].pct, 1),
+            temp_c=None if math.isnan(temp_c) else round(temp_c, 1),
+            new_img=new_img, img_cnt=img_cnt,
+            load1=round(load1, 2), mem_pct=round(mem_pct, 1),
+        ))
+
+    alerts = evaluate_alerts(metrics, temp_c, load1, mem_pct, force_alert)
+    if alerts and no_slack:
+        logger.info("アラート（--no-slack のため未送信）: %s", " / ".join(t for _, t in alerts))
+    elif alerts:
+        notify_alerts(alerts, ignore_suppress=ignore_suppress)
     logger.info("監視終了")
 
 
+RING_FIELDS = ("temp_c", "load1", "mem_pct")
+
+
+def _r(v: Optional[float], ndigits: int) -> Optional[float]:
+    return None if v is None else round(v, ndigits)
+
+
+def flush_interval(store: MetricStore, ring: SampleRing, start: float, end: float,
+                   metrics: List[DiskMetric]) -> Optional[Sample]:
+    """前回の書き込み start より後のリングの中身を min/avg/max の1行にして書き込む
+
+    区間は前回と重ならないように、サンプルは start < ts、撮影枚数は start <= 撮影時刻 < end で数える。
+    """
+    n = ring.count_since(start)
+    if n == 0:
+        return None
+    agg = ring.aggregate(start)
+    temp, load, mem = agg["temp_c"], agg["load1"], agg["mem_pct"]
+    new_img = count_images_between(DISK_PATHS["images"], start, end)
+    sample = Sample(
+        ts=time.strftime("%Y-%m-%d %H:%M"),
+        images_kb=metrics[0].used_kb, archived_kb=metrics[1].used_kb,
+        images_pct=round(metrics[0].pct, 1),
+        archived_pct=round(metrics[1].pct, 1),
+        temp_c=_r(temp and temp[1], 1),
+        new_img=new_img, img_cnt=new_img,
+        load1=round(load[1], 2) if load else 0.0,
+        mem_pct=round(mem[1], 1) if mem else 0.0,
+        temp_min=_r(temp and temp[0], 1), temp_max=_r(temp and temp[2], 1),
+        load1_min=_r(load and load[0], 2), load1_max=_r(load and load[2], 2),
+        mem_min=_r(mem and mem[0], 1), mem_max=_r(mem and mem[2], 1),
+        n_samples=n,
+    )
+    store.append(sample)
+    return sample
+
+
+def run_daemon(sample_sec=SAMPLE_SEC, flush_sec=FLUSH_SEC, disk_sec=DISK_SEC,
+               no_slack=False):
+    """常駐して高頻度で計測し、flush_sec ごとに min/avg/max を1行書き込む"""
+    logger.info("監視デーモン開始 sample=%.1fs flush=%ds disk=%ds",
+                sample_sec, flush_sec, disk_sec)
+    # 1区間分 + 余裕。以降メモリは増えない
+    ring = SampleRing(RING_FIELDS, int(flush_sec / sample_sec) * 2 + 1)
+    cache = dir_size.DirSizeCache()
+    store = open_store()
+
+    stopping = False
+
+    def on_term(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGTERM, on_term)
+    signal.signal(signal.SIGINT, on_term)
+
+    metrics = disk_metrics(cache)
+    cache.save()
+    now = time.time()
+    interval_start = now
+    # 書き込みは壁時計の区切り（既定なら毎正時）に揃える
+    next_flush = (now // flush_sec + 1) * flush_sec
+    next_disk = now + disk_sec
+    cpu0, wall0 = time.process_time(), time.monotonic()
+    tick = time.monotonic()
+
+    try:
+        while not stopping:
+            now = time.time()
+            if now >= next_disk:
+                metrics = disk_metrics(cache)
+                cache.save()
+                next_disk = now + disk_sec
+
+            temp_c = cpu_temp_c()
+            load1 = os.getloadavg()[0]
+            mem_pct = mem_percent()
+            ring.append(now, temp_c=None if math.isnan(temp_c) else temp_c,
+                        load1=load1, mem_pct=mem_pct)
+
+            # 閾値判定は毎サンプル（通知はアラートの種類ごとに SUPPRESS_MIN で抑制）
+            notify_alerts(evaluate_alerts(metrics, temp_c, load1, mem_pct), no_slack)
+
+            if now >= next_flush:
+                flush_interval(store, ring, interval_start, now, metrics)
+                cpu1, wall1 = time.process_time(), time.monotonic()
+                overhead = (cpu1 - cpu0) / (wall1 - wall0) * 100
+                level = logging.WARNING if overhead > OVERHEAD_LIMIT_PCT else logging.INFO
+                logger.log(level, "集計書き込み %d サンプル / 監視の CPU 使用率 %.2f%%",
+                           ring.count_since(interval_start), overhead)
+                cpu0, wall0 = cpu1, wall1
+                # 次の区間は now より後（このサンプルは今の区間で書き込み済み）
+                interval_start = now
+                next_flush += flush_sec
+                while next_flush <= now:
+                    next_flush += flush_sec
+
+            # 処理時間を差し引いて一定間隔で回す
+            tick += sample_sec
+            delay = tick - time.monotonic()
+            if delay < 0:
+                tick = time.monotonic()
+                delay = 0
+            while delay > 0 and not stopping:
+                time.sleep(min(delay, 1.0))
+                delay = tick - time.monotonic()
+    finally:
+        # 停止時は途中の区間も書き込む
+        flush_interval(store, ring, interval_start, time.time(), metrics)
+        cache.save()
+        store.close()
+        logger.info("監視デーモン終了")
+
+
 def run_daily_summary(date: Optional[datetime.date] = None, no_slack=False):
     if date is None:
         date = datetime.date.today()-datetime.timedelta(days=1)
     dstr = date.strftime("%Y-%m-%d")
-    rows: list[list[str]] = []
-    if not CSV_PATH.exists():
-        logger.warning("CSVなし")
-        return
-    with CSV_PATH.open() as f:
-        for r in csv.reader(f):
-            if r and r[0].startswith(dstr):
-                rows.append(r+['0']*10)
-    if not rows:
+    # 日次集計は書き込み時に更新済みなので、対象日の1行だけを読む
+    with open_store() as store:
+        roll = store.rollup(dstr)
+    if roll is None:
         logger.warning("対象日データなし %s", dstr)
         return
 
-    def idx(n: int, default: float = 0.0) -> List[float]:
-        return [float(r[n]) for r in rows if len(r) > n]
-
-    img_max = max(idx(3))
-    arc_max = max(idx(4))
-    temp_avg = sum(idx(5))/len(rows)
-    temp_max = max(idx(5))
-    new_total = count_yesterdays_images_from_archived()
+    img_max = roll.images_pct_max
+    arc_max = roll.archived_pct_max
+    temp_avg = roll.temp_avg if roll.temp_avg is not None else float("nan")
+    temp_max = roll.temp_max if roll.temp_max is not None else float("nan")
+    new_total = count_yesterdays_images_from_archived(date)
 
     log_kb = dir_size_kb(str(ROOT / "log"))
 
@@ -229,12 +401,38 @@ def parse_args():
     p.add_argument("--daily", action="store_true")
     p.add_argument("--date")
     p.add_argument("--force-alert", action="store_true")
+    p.add_argument("--daemon", action="store_true",
+                   help="常駐して高頻度で計測し、集計行を定期的に書き込む")
+    p.add_argument("--sample-sec", type=float, default=SAMPLE_SEC)
+    p.add_argument("--flush-sec", type=int, default=FLUSH_SEC)
+    p.add_argument("--disk-sec", type=int, default=DISK_SEC)
+    p.add_argument("--import-csv", metavar="PATH",
+                   help="system_log.csv 形式のCSVをストアに取り込む（空のストアのみ）")
+    p.add_argument("--force", action="store_true",
+                   help="--import-csv を空でないストアにも行う（既にある時刻の行は飛ばす）")
+    p.add_argument("--export-csv", metavar="PATH",
+                   help="ストアの全計測値を system_log.csv 形式で書き出す")
     return p.parse_args()
 
 
 def main():
     a = parse_args()
-    if a.daily:
+    if a.import_csv or a.export_csv:
+        with MetricStore(DB_PATH) as store:
+            if a.import_csv:
+                try:
+                    n = store.import_csv(pathlib.Path(a.import_csv), force=a.force)
+                except ValueError as e:
+                    logger.error("❌ 取り込みを中止しました: %s", e)
+                    sys.exit(1)
+                logger.info("%d 行を取り込みました: %s", n, a.import_csv)
+            if a.export_csv:
+                n = store.export_csv(pathlib.Path(a.export_csv))
+                logger.info("%d 行を書き出しました: %s", n, a.export_csv)
+        return
+    if a.daemon:
+        run_daemon(a.sample_sec, a.flush_sec, a.disk_sec, a.no_slack)
+    elif a.daily:
         tgt = None
         if a.date:
             tgt = datetime.datetime.strptime(a.date, "%Y-%m-%d").date()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+nas_sync.py — archived/YYYY-MM-DD/ を NAS へ転送する（日ごとのマニフェストで再開できる）
+
+日ごとに log/nas/manifest/YYYY-MM-DD.json へ {ファイル名: size, mtime, sha1, sent} を持ち、
+マニフェストで送信済み（かつ size・mtime が変わっていない）のファイルは送らない。
+送るファイルを BATCH_SIZE 件ずつに分け、NAS_WORKERS 本のワーカーで並行に転送し、
+バッチが終わるたびにマニフェストを書き出す（途中で落ちても次回はその続きから）。
+
+転送方法は差し替えられる。
+    rsync  … NAS_DEST が rsync://host/… や host:path のとき（--compress は付けない。JPEG は縮まない）
+    local  … NAS_DEST がローカル / マウント済みのディレクトリのとき（テスト用の一時ディレクトリにも使える）
+帯域は全ワーカー合計で BWLIMIT（KB/s）まで。rsync は本数で割った --bwlimit を渡し、
+local は共有のトークンバケット（rate_limit.TokenBucket）で抑える。
+
+    python3 nas_sync.py                      # 昨日分
+    python3 nas_sync.py 2026-10-16 --workers 3
+    python3 nas_sync.py --status 2026-10-16  # マニフェストの集計
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import frame_catalog
+from rate_limit import TokenBucket
+
+ROOT = Path("/home/pi/timelapse-system")
+ARCHIVED_DIR = ROOT / "archived"
+LOG_DIR = ROOT / "log" / "nas"
+MANIFEST_DIR = LOG_DIR / "manifest"
+
+NAS_DEST = os.getenv("NAS_DEST", "rsync://NAS/timelapse")
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", 100))
+WORKERS = int(os.getenv("NAS_WORKERS", 2))
+BWLIMIT_KB = int(os.getenv("BWLIMIT", 5000))          # 全ワーカー合計（KB/s）。0 で無制限
+CHECKSUM = os.getenv("NAS_CHECKSUM", "0") == "1"       # 送る前に sha1 を計算してマニフェストに残す
+RETRY_WAIT_SEC = 30
+COPY_CHUNK = 256 * 1024
+
+
+# ===== マニフェスト =====
+
+def manifest_path(day: date, manifest_dir: Path = MANIFEST_DIR) -> Path:
+    return Path(manifest_dir) / f"{day.isoformat()}.json"
+
+
+def load_manifest(day: date, manifest_dir: Path = MANIFEST_DIR) -> dict:
+    try:
+        with open(manifest_path(day, manifest_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"day": day.isoformat(), "files": {}}
+
+
+def save_manifest(manifest: dict, day: date, manifest_dir: Path = MANIFEST_DIR):
+    path = manifest_path(day, manifest_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest["updated"] = time.time()
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def day_status(day: date, src_root: Path = ARCHIVED_DIR,
+               manifest_dir: Path = MANIFEST_DIR) -> dict:
+    """ローカルの日付ディレクトリのうち、マニフェストで送信済みと確認できる件数"""
+    files = load_manifest(day, manifest_dir)["files"]
+    local = sent = 0
+    for entry in _scan(Path(src_root) / day.isoformat()):
+        local += 1
+        if _is_sent(files.get(entry.name), entry.stat()):
+            sent += 1
+    return {"local": local, "sent": sent, "pending": local - sent,
+            "manifest": len(files)}
+
+
+def _is_sent(rec: Optional[dict], st: os.stat_result) -> bool:
+    return bool(rec and rec.get("sent") and rec["size"] == st.st_size
+                and rec["mtime"] == int(st.st_mtime))
+
+
+def _scan(day_dir: Path):
+    try:
+        with os.scandir(day_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".jpg"):
+                    yield entry
+    except FileNotFoundError:
+        return
+
+
+# ===== 転送方法 =====
+
+class RsyncTransport:
+    """rsync で1バッチを1プロセスで送る（宛先はフラット）"""
+
+    def __init__(self, dest: str, bwlimit_kb: int = 0, workers: int = 1):
+        self.dest = dest.rstrip("/") + "/"
+        # rsync の --bwlimit はプロセスごとなので、同時に走る本数で割って合計を守る
+        self.bwlimit_kb = max(bwlimit_kb // max(workers, 1), 1) if bwlimit_kb > 0 else 0
+
+    def check(self) -> bool:
+        for i in range(3):
+            r = subprocess.run(["rsync", "--timeout=30", self.dest],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if r.returncode == 0:
+                return True
+            if i < 2:
+                logging.warning(f"⚠️ NAS 接続テスト再試行 ({i + 1}/3)...")
+                time.sleep(5)
+        return False
+
+    def send(self, src_dir: Path, names: List[str]) -> List[str]:
+        # -H: dedupe.py でハードリンクにしたフレームは、同じバッチ内なら NAS でも1枚分で済む
+        cmd = ["rsync", "-aH", "--no-t", "--files-from=-", "--partial", "--timeout=300"]
+        if self.bwlimit_kb:
+            cmd.append(f"--bwlimit={self.bwlimit_kb}")
+        cmd += [f"{src_dir}/", self.dest]
+        r = subprocess.run(cmd, input="\n".join(names) + "\n", text=True,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if r.returncode != 0:
+            _save_rsync_log(r.returncode, r.stdout)
+            raise RuntimeError(f"rsync 終了コード {r.returncode}")
+        return names
+
+
+def _save_rsync_log(code: int, output: str):
+    # 一部のファイルだけ失敗した（code 23）ときは原因を後で見られるように残す
+    if code != 23:
+        return
+    sub = LOG_DIR / "code23"
+    sub.mkdir(parents=True, exist_ok=True)
+    path = sub / f"batch_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.log"
+    path.write_text(output)
+    logging.info(f"📄 Code 23 ログを保存: {path}")
+
+
+class LocalCopyTransport:
+    """ローカル / マウント済みディレクトリへのコピー（.part に書いてから rename）"""
+
+    def __init__(self, dest: str, bucket: Optional[TokenBucket] = None):
+        self.dest = Path(dest)
+        self.bucket = bucket
+
+    def check(self) -> bool:
+        return self.dest.is_dir()
+
+    def send(self, src_dir: Path, names: List[str]) -> List[str]:
+        done = []
+        for name in names:
+            src, dst = src_dir / name, self.dest / name
+            part = dst.with_name(f".{name}.part")
+            try:
+                with open(src, "rb") as fi, open(part, "wb") as fo:
+                    for chunk in iter(lambda: fi.read(COPY_CHUNK), b""):
+                        if self.bucket:
+                            self.bucket.acquire(len(chunk))
+                        fo.write(chunk)
+                os.replace(part, dst)
+            except OSError as e:
+                logging.error(f"コピー失敗: {src} → {dst}: {e}")
+                continue
+            done.append(name)
+        return done
+
+
+def make_transport(dest: str, kind: str = "auto", bwlimit_kb: int = BWLIMIT_KB,
+                   workers: int = WORKERS):
+    if kind == "auto":
+        kind = "rsync" if dest.startswith("rsync://") or ":" in dest.split("/")[0] else "local"
+    if kind == "rsync":
+        return RsyncTransport(dest, bwlimit_kb, workers)
+    bucket = TokenBucket(bwlimit_kb * 1024, burst=bwlimit_kb * 1024) if bwlimit_kb > 0 else None
+    return LocalCopyTransport(dest, bucket)
+
+
+# ===== 同期 =====
+
+def _pending(day_dir: Path, files: Dict[str, dict]):
+    """マニフェストで送信済みになっていない（または size・mtime が変わった）ファイルと、省略した件数"""
+    pending, skipped = [], 0
+    for entry in _scan(day_dir):
+        st = entry.stat()
+        if _is_sent(files.get(entry.name), st):
+            skipped += 1
+            continue
+        files[entry.name] = {"size": st.st_size, "mtime": int(st.st_mtime), "sent": False}
+        pending.append(entry.name)
+    return sorted(pending), skipped
+
+
+def _send_batch(transport, day_dir: Path, names: List[str], checksum: bool,
+                retry_wait: float):
+    """1バッチを送る（失敗したら1回だけ待って再送）。(送れた名前, {名前: sha1}) を返す"""
+    sums = {name: _sha1(day_dir / name) for name in names} if checksum else {}
+    for attempt in (1, 2):
+        try:
+            return transport.send(day_dir, names), sums
+        except Exception as e:
+            if attempt == 2:
+                logging.error(f"❌ バッチ再試行も失敗（{names[0]} ほか {len(names)} 件）: {e}")
+                return [], sums
+            logging.warning(f"🔄 バッチ失敗（{e}）。{retry_wait:.0f} 秒後に再試行")
+            time.sleep(retry_wait)
+
+
+def sync_day(day: date, transport, src_root: Path = ARCHIVED_DIR,
+             manifest_dir: Path = MANIFEST_DIR, workers: int = WORKERS,
+             batch_size: int = BATCH_SIZE, checksum: bool = CHECKSUM,
+             retry_wait: float = RETRY_WAIT_SEC,
+             catalog_path: Optional[Path] = None) -> dict:
+    """day の未送信ファイルを送る。集計を返す
+
+    送れたファイルはバッチごとにフレーム台帳でも送信済みにする（catalog_path が None なら frame_catalog.DB_PATH）。
+    送信済みかどうかの正はマニフェストで、台帳は問い合わせ用の写し。
+    """
+    t0 = time.monotonic()
+    day_dir = Path(src_root) / day.isoformat()
+    manifest = load_manifest(day, manifest_dir)
+    files = manifest["files"]
+    pending, skipped = _pending(day_dir, files)
+    stats = {"pending": len(pending), "sent": 0, "failed": 0, "bytes": 0,
+             "skipped": skipped, "batches": 0}
+    if not pending:
+        stats["elapsed"] = time.monotonic() - t0
+        return stats
+    save_manifest(manifest, day, manifest_dir)
+
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = {pool.submit(_send_batch, transport, day_dir, b, checksum, retry_wait): b
+                   for b in batches}
+        for fut in as_completed(futures):
+            batch = futures[fut]
+            done, sums = fut.result()
+            now = time.time()
+            for name, digest in sums.items():
+                files[name]["sha1"] = digest
+            for name in done:
+                files[name]["sent"] = True
+                files[name]["sent_at"] = now
+                stats["bytes"] += files[name]["size"]
+            stats["sent"] += len(done)
+            stats["failed"] += len(batch) - len(done)
+            stats["batches"] += 1
+            # バッチごとのチェックポイント（マニフェストの書き出しはこのスレッドだけが行う）
+            save_manifest(manifest, day, manifest_dir)
+            if done:
+                frame_catalog.record("mark_synced", done, path=catalog_path)
+            logging.info(f"📦 バッチ {stats['batches']}/{len(batches)}: {len(done)}/{len(batch)} 件")
+    stats["elapsed"] = time.monotonic() - t0
+    return stats
+
+
+def main():
+    p = argparse.ArgumentParser(description="archived/ の日付ディレクトリを NAS へ転送する")
+    p.add_argument("day", nargs="?", type=date.fromisoformat, help="対象日（既定: 昨日）")
+    p.add_argument("--dest", default=NAS_DEST)
+    p.add_argument("--transport", choices=("auto", "rsync", "local"), default="auto")
+    p.add_argument("--workers", type=int, default=WORKERS)
+    p.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    p.add_argument("--bwlimit", type=int, default=BWLIMIT_KB, help="全体の上限（KB/s、0 で無制限）")
+    p.add_argument("--checksum", action="store_true", default=CHECKSUM)
+    p.add_argument("--src-root", type=Path, default=ARCHIVED_DIR)
+    p.add_argument("--status", action="store_true", help="転送せずにマニフェストの集計だけ出す")
+    a = p.parse_args()
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+    day = a.day or date.today() - timedelta(days=1)
+
+    if a.status:
+        s = day_status(day, a.src_root)
+        print(f"{day}: ローカル {s['local']} 件 / 送信済み {s['sent']} 件 / 未送信 {s['pending']} 件"
+              f"（マニフェスト {s['manifest']} 件）")
+        return
+
+    if not (a.src_root / day.isoformat()).is_dir():
+        logging.info(f"ℹ️ {day} のディレクトリがありません")
+        return
+
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    with open(LOG_DIR / ".nas_sync.lock", "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logging.info("ℹ️ 別の NAS 同期が実行中のため終了")
+            return
+
+        transport = make_transport(a.dest, a.transport, a.bwlimit, a.workers)
+        logging.info(f"🚀 {day} の NAS 同期開始（{type(transport).__name__}, "
+                     f"workers {a.workers}, {a.bwlimit or '無制限'} KB/s）")
+        if not transport.check():
+            logging.error(f"❌ NAS に接続できません: {a.dest}")
+            sys.exit(1)
+        s = sync_day(day, transport, a.src_root, workers=a.workers,
+                     batch_size=a.batch_size, checksum=a.checksum)
+
+    mb = s["bytes"] / 1024 / 1024
+    logging.info(f"✅ 送信 {s['sent']}/{s['pending']} 件（送信済みで省略 {s['skipped']} 件）"
+                 f" / {mb:.0f} MB / {s['elapsed']:.1f} 秒（{mb / max(s['elapsed'], 1e-6):.1f} MB/s）"
+                 + (f" / ❌ 未送信 {s['failed']} 件" if s["failed"] else ""))
+    if s["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+notify_queue.py — Slack 通知の送信待ちキュー（ディスク上のスプール）
+
+送る側は enqueue() で spool/notify/ に JSON を1つ書いて（tmp → rename）すぐ戻る。
+送信はバックグラウンドの flusher（`notify_queue.py --flush`）が行い、失敗したら間隔を空けて再送する。
+COALESCE_SEC 以内に積まれたテキスト通知は同じ見出しごとに1通にまとめる。
+
+通知の抑制はアラートのキーごとに log/alert_state.json の最終受付時刻で判定する
+（明るさアラートと監視アラートで別々だった last_alert_time / last_alert を置き換える）。
+
+    python3 notify_queue.py --flush     # 溜まっている通知を送る（通常は enqueue が自動で起動）
+    python3 notify_queue.py --status    # 送信待ちの一覧
+"""
+
+import argparse
+import fcntl
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BASE_DIR = Path(__file__).resolve().parent
+SPOOL_DIR = BASE_DIR / "spool" / "notify"
+STATE_PATH = BASE_DIR / "log" / "alert_state.json"
+LOG_PATH = BASE_DIR / "log" / "notify_queue.log"
+
+COALESCE_SEC = int(os.getenv("NOTIFY_COALESCE_SEC", 20))   # この間に積まれた通知はまとめて送る
+BACKOFF_BASE_SEC = 30
+BACKOFF_MAX_SEC = 1800
+
+
+def _write_atomic(path: Path, data: dict):
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _locked(path: Path, blocking: bool = True):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# ===== 抑制 =====
+
+def _load_state() -> Dict[str, float]:
+    try:
+        with open(STATE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def suppressed(key: str, window_sec: float) -> bool:
+    """key のアラートが window_sec 以内に受け付け済みか（読むだけ）"""
+    return time.time() - _load_state().get(key, 0) < window_sec
+
+
+def accept(key: str, window_sec: float) -> bool:
+    """抑制中でなければ受付時刻を記録して True"""
+    with _locked(STATE_PATH.with_suffix(".lock")):
+        state = _load_state()
+        now = time.time()
+        if now - state.get(key, 0) < window_sec:
+            return False
+        state[key] = now
+        STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _write_atomic(STATE_PATH, state)
+        return True
+
+
+# ===== キュー =====
+
+def enqueue(text: str, key: Optional[str] = None, header: str = "",
+            filepath: Optional[str] = None, title: str = "",
+            max_px: Optional[int] = None, max_bytes: Optional[int] = None,
+            suppress_sec: float = 0, spawn: bool = True) -> Optional[Path]:
+    """通知を積む。key が suppress_sec 以内に受け付け済みなら積まずに None
+
+    filepath を渡すとファイル送信（text はコメント）。ファイルはスプールにハードリンクするので、
+    送信前に images/ から移動・削除されても送れる。max_px / max_bytes は送信時の縮小指定。
+    """
+    if key and suppress_sec > 0 and not accept(key, suppress_sec):
+        return None
+    SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    item_id = f"{time.time_ns()}-{os.getpid()}-{os.urandom(3).hex()}"
+    item = {"id": item_id, "created": now, "key": key, "header": header,
+            "text": text, "attempts": 0, "next_try": now}
+    if filepath:
+        item["title"] = title
+        item["max_px"] = max_px
+        item["max_bytes"] = max_bytes
+        item["filepath"] = _keep_file(filepath, item_id)
+    path = SPOOL_DIR / f"{item_id}.json"
+    _write_atomic(path, item)
+    if spawn:
+        spawn_flusher()
+    return path
+
+
+def _keep_file(filepath: str, item_id: str) -> str:
+    # Slack 上のファイル名を変えないよう、元の名前のまま通知ごとのディレクトリに置く
+    dest = SPOOL_DIR / "files" / item_id / Path(filepath).name
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(filepath, dest)
+    except OSError:
+        try:
+            import shutil
+            shutil.copyfile(filepath, dest)
+        except OSError:
+            return filepath       # 読めないファイルは送信時にエラーとして扱う
+    return str(dest)
+
+
+def spawn_flusher():
+    """flusher を切り離して起動する（既に動いていれば新しい方はすぐ終わる）"""
+    import subprocess
+    LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(LOG_PATH, "a") as log:
+        subprocess.Popen([sys.executable, str(Path(__file__).resolve()), "--flush"],
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+                         start_new_session=True, cwd=str(BASE_DIR))
+
+
+def pending() -> List[dict]:
+    items = []
+    for path in sorted(SPOOL_DIR.glob("*.json")):
+        try:
+            with open(path) as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            continue
+        item["_path"] = str(path)
+        items.append(item)
+    return items
+
+
+def _remove(item: dict):
+    kept = item.get("filepath")
+    if kept and Path(kept).parent.parent == SPOOL_DIR / "files":
+        try:
+            os.remove(kept)
+            os.rmdir(Path(kept).parent)
+        except OSError:
+            pass
+    try:
+        os.remove(item["_path"])
+    except FileNotFoundError:
+        pass
+
+
+def _retry_later(item: dict, now: float):
+    item["attempts"] += 1
+    delay = min(BACKOFF_BASE_SEC * 2 ** (item["attempts"] - 1), BACKOFF_MAX_SEC)
+    item["next_try"] = now + delay
+    path = Path(item.pop("_path"))
+    _write_atomic(path, item)
+    item["_path"] = str(path)
+
+
+def coalesce(items: List[dict]) -> List[dict]:
+    """テキスト通知を見出しごとに1通へまとめる。[{header, text, items}] を最初の出現順で返す"""
+    groups: Dict[str, dict] = {}
+    for item in items:
+        g = groups.setdefault(item["header"], {"header": item["header"], "lines": [], "items": []})
+        g["lines"].append(item["text"])
+        g["items"].append(item)
+    out = []
+    for g in groups.values():
+        body = "\n".join(g["lines"])
+        text = f"{g['header']}\n{body}" if g["header"] else body
+        out.append({"text": text, "items": g["items"]})
+    return out
+
+
+def _send_ready(notifier_factory, now: float) -> int:
+    ready = [i for i in pending() if i.get("next_try", 0) <= now]
+    if not ready:
+        return 0
+    try:
+        notifier = notifier_factory()
+    except Exception as e:
+        logging.error("通知クライアント初期化失敗: %s", e)
+        for item in ready:
+            _retry_later(item, now)
+        return 0
+
+    sent = 0
+    texts = [i for i in ready if not i.get("filepath")]
+    for msg in coalesce(texts):
+        try:
+            ok = notifier.send_message(msg["text"])
+        except Exception as e:
+            # Wi-Fi 断・DNS 失敗（URLError / ConnectionError / timeout）は送信失敗として再送に回す
+            logging.error("通知送信失敗: %s", e)
+            ok = False
+        if ok:
+            for item in msg["items"]:
+                _remove(item)
+            sent += len(msg["items"])
+            logging.info("📨 送信 %d 件（1通にまとめて送信）", len(msg["items"]))
+        else:
+            for item in msg["items"]:
+                _retry_later(item, now)
+    for item in ready:
+        if not item.get("filepath"):
+            continue
+        if not Path(item["filepath"]).exists():
+            logging.error("送信ファイルがありません（破棄）: %s", item["filepath"])
+            _remove(item)
+            continue
+        try:
+            ok = notifier.send_file(filepath=item["filepath"], title=item.get("title", ""),
+                                    comment=item["text"], max_px=item.get("max_px"),
+                                    max_bytes=item.get("max_bytes"))
+        except Exception as e:
+            logging.error("ファイル送信失敗: %s: %s", item["filepath"], e)
+            ok = False
+        if ok:
+            _remove(item)
+            sent += 1
+        else:
+            _retry_later(item, now)
+    return sent
+
+
+def _default_notifier():
+    from dotenv import load_dotenv
+    load_dotenv(BASE_DIR / ".env")
+    import slack_notifier
+    return slack_notifier.get_notifier()
+
+
+def flush(notifier_factory=_default_notifier, coalesce_sec: float = COALESCE_SEC,
+          wait: bool = True) -> int:
+    """キューが空になるまで送る。別の flusher が送信中なら何もしない。送信件数を返す
+
+    再送待ち（最大 BACKOFF_MAX_SEC）は .flush.lock を離して待つ。待っている間に enqueue が
+    起動した flusher がロックを取り、新しい通知をすぐにまとめて送れるようにするため。
+    待つのは .wait.lock を取れた1プロセスだけで、ほかは待たずに終わる。
+    """
+    sent = 0
+    while True:
+        with _locked(SPOOL_DIR / ".flush.lock", blocking=False) as got:
+            if not got:
+                return sent
+            n, next_try = _flush_locked(notifier_factory, coalesce_sec, wait)
+            sent += n
+        if not wait:
+            return sent
+        if next_try is None:
+            # ロックを離す直前に積まれた分は、その enqueue が起動した flusher がロックを取れずに
+            # 終わっている可能性があるので、こちらで拾い直す
+            if not pending():
+                return sent
+            continue
+        with _locked(SPOOL_DIR / ".wait.lock", blocking=False) as got:
+            if not got:
+                return sent
+            time.sleep(max(1.0, next_try - time.time()))
+
+
+def _flush_locked(notifier_factory, coalesce_sec: float, wait: bool):
+    """送れるものを送る。(送信件数, 残りの最も早い再送時刻 or None) を返す"""
+    sent = 0
+    while True:
+        items = pending()
+        if not items:
+            return sent, None
+        now = time.time()
+        # 初回の通知は最初の1件から coalesce_sec 待ち、その間に積まれた分とまとめて送る
+        fresh = [i["created"] for i in items if i["attempts"] == 0]
+        if wait and fresh and now - min(fresh) < coalesce_sec:
+            time.sleep(coalesce_sec - (now - min(fresh)))
+            continue
+        sent += _send_ready(notifier_factory, time.time())
+        rest = pending()
+        if not rest or not wait:
+            return sent, None
+        next_try = min(i.get("next_try", 0) for i in rest)
+        if next_try > time.time():
+            return sent, next_try
+
+
+def main():
+    p = argparse.ArgumentParser(description="Slack 通知キュー")
+    p.add_argument("--flush", action="store_true", help="溜まっている通知を送る")
+    p.add_argument("--status", action="store_true", help="送信待ちの一覧")
+    a = p.parse_args()
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(message)s")
+    if a.status:
+        for item in pending():
+            kind = "file" if item.get("filepath") else "text"
+            first = (item["text"].splitlines() or [""])[0]
+            print(f"{time.strftime('%m-%d %H:%M:%S', time.localtime(item['created']))} "
+                  f"{kind:<4} 試行 {item['attempts']}  {item.get('key') or '-':<12} {first}")
+    if a.flush:
+        n = flush()
+        if n:
+            logging.info("✅ 通知 %d 件を送信", n)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,9 @@
 #!/usr/bin/env python3
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import pandas as pd
-import numpy as np
+import argparse
 from datetime import datetime, timedelta
 
+# numpy / matplotlib は読み込みが重いので使う関数の中で import する
+
 # ===== 設定 =====
 LOG_DIR = "/home/pi/timelapse-system/log"
 PLOT_PATH = f"{LOG_DIR}/brightness_plot.png"
@@ -18,99 +17,190 @@ TOO_BRIGHT = 0.40
 NIGHT_START_HOUR = 0
 NIGHT_END_HOUR = 6
 
-# 描画対象日数（最新7日分）
+# 描画対象日数（既定は最新7日分。--days / --from / --to で変更）
 DAYS_TO_KEEP = 7
-cutoff = datetime.now() - timedelta(days=DAYS_TO_KEEP)
-
-# ===== 対象月を2か月分取得 =====
-this_month = datetime.now().strftime("%Y-%m")
-last_month = (datetime.now().replace(day=1) -
-              timedelta(days=1)).strftime("%Y-%m")
-
-csv_files = [
-    f"{LOG_DIR}/brightness_{last_month}.csv",
-    f"{LOG_DIR}/brightness_{this_month}.csv"
-]
-
-# ===== CSV 読み込みと連結 =====
-dfs = []
-for path in csv_files:
-    try:
-        df = pd.read_csv(path, header=None, names=[
-            "timestamp", "mode", "mode_str", "time_info",
-            "shutter", "gain", "path", "mean", "ev"
-        ])
-        dfs.append(df)
-    except FileNotFoundError:
-        continue  # ファイルが存在しない場合はスキップ
-
-if not dfs:
-    raise RuntimeError("CSVファイルが見つかりません。")
-
-df = pd.concat(dfs)
-df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-df["mean"] = pd.to_numeric(df["mean"], errors="coerce")
-df["ev"] = pd.to_numeric(df["ev"], errors="coerce")
-df = df[df["timestamp"] >= cutoff]
-
-# ===== AUTO / MANUAL 区別 =====
-auto_df = df[df["mode_str"] == "auto"]
-manual_df = df[df["mode_str"] == "manual"]
-
-# ===== プロット作成 =====
-fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 9),
-                               sharex=False, gridspec_kw={"height_ratios": [3, 1]})
-
-# ===== 上：時系列の明るさ =====
-ax1.axhspan(TARGET_MIN, TARGET_MAX, color="yellow",
-            alpha=0.2, label="Target Range (0.25~0.35)")
-ax1.axhline(TARGET_MIN, color="green",
-            linestyle="--", label="Target Min (0.25)")
-ax1.axhline(TARGET_MAX, color="orange",
-            linestyle="--", label="Target Max (0.35)")
-ax1.axhline(TOO_BRIGHT, color="red", linestyle="--", label="Too Bright (0.40)")
-
-auto_sizes = np.clip((abs(auto_df["ev"].fillna(0)) + 1) * 20, 10, 100)
-manual_sizes = np.full(len(manual_df), 20)
-
-ax1.scatter(auto_df["timestamp"], auto_df["mean"],
-            color="blue", s=auto_sizes, label="Auto Mode")
-ax1.scatter(manual_df["timestamp"], manual_df["mean"],
-            color="green", s=manual_sizes, label="Manual Mode")
-
-# 夜間帯の背景
-unique_dates = df["timestamp"].dt.normalize().unique()
-for date in unique_dates:
-    night_start = date + pd.Timedelta(hours=NIGHT_START_HOUR)
-    night_end = date + pd.Timedelta(hours=NIGHT_END_HOUR)
-    ax1.axvspan(night_start, night_end, color="gray", alpha=0.15)
-
-ax1.set_ylabel("Mean Brightness")
-ax1.set_title(f"Brightness (Last {DAYS_TO_KEEP} Days)")
-ax1.grid(True)
-ax1.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d %H:%M'))
-plt.setp(ax1.get_xticklabels(), rotation=45)
-
-# ===== 下：ヒストグラム =====
-ax2.hist(df["mean"].dropna(), bins=30,
-         color="purple", alpha=0.7, edgecolor="black")
-ax2.axvline(TARGET_MIN, color="green",
-            linestyle="--", label="Target Min (0.25)")
-ax2.axvline(TARGET_MAX, color="orange",
-            linestyle="--", label="Target Max (0.35)")
-ax2.axvline(TOO_BRIGHT, color="red", linestyle="--", label="Too Bright (0.40)")
-ax2.set_xlabel("Mean Brightness")
-ax2.set_ylabel("Frequency")
-ax2.grid(True)
-ax2.legend()
-
-# ===== X軸範囲の設定 =====
-if not df.empty:
-    ax1.set_xlim(df["timestamp"].min(), df["timestamp"].max())
-
-# ===== レイアウト調整と保存 =====
-plt.tight_layout()
-ax1.legend(loc="upper left", bbox_to_anchor=(0.0, 0.45), frameon=True)
-
-plt.savefig(PLOT_PATH)
-print(f"Saved plot to: {PLOT_PATH}")
+
+# 1バケットあたりの横幅（px）。点数がバケット数以下なら生データをそのまま打つ
+BUCKET_PX = 2
+MODES = (("auto", 0, "blue"), ("manual", 1, "green"))
+
+
+def csv_files(start, end):
+    # ===== start〜end を含む月の CSV =====
+    files = []
+    month = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month <= end:
+        files.append(f"{LOG_DIR}/brightness_{month:%Y-%m}.csv")
+        month = (month + timedelta(days=32)).replace(day=1)
+    return files
+
+
+def load_brightness(start, end=None):
+    """{ts, mean, ev, mode, meter} の NumPy 配列（brightness_cache の列キャッシュから）"""
+    import brightness_cache
+
+    end = end or datetime.now()
+    cols = brightness_cache.load(csv_files(start, end), start=start, end=end)
+    if cols is None:
+        raise RuntimeError("CSVファイルが見つかりません。")
+    return cols
+
+
+def bucketize(secs, values, width, n_buckets):
+    """経過秒を幅 width 秒のバケットに分け、(min, mean, max) をバケット数の長さで返す（空は NaN）"""
+    import numpy as np
+
+    ok = ~np.isnan(values)
+    idx = secs[ok] // width
+    v = values[ok]
+    keep = (idx >= 0) & (idx < n_buckets)
+    idx, v = idx[keep], v[keep]
+
+    lo = np.full(n_buckets, np.nan)
+    hi = np.full(n_buckets, np.nan)
+    mean = np.full(n_buckets, np.nan)
+    if len(v) == 0:
+        return lo, mean, hi
+    if np.any(idx[1:] < idx[:-1]):
+        # 時計の補正などで順番が前後している行があるときだけ並べ替える
+        order = np.argsort(idx, kind="stable")
+        idx, v = idx[order], v[order]
+    starts = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+    used = idx[starts]
+    lo[used] = np.minimum.reduceat(v, starts)
+    hi[used] = np.maximum.reduceat(v, starts)
+    mean[used] = np.add.reduceat(v, starts) / np.diff(np.r_[starts, len(v)])
+    return lo, mean, hi
+
+
+def night_spans(ax, t0, t1):
+    """夜間帯の背景を1つの PolyCollection で描く（日数に関係なく artist は1つ）"""
+    import numpy as np
+    import matplotlib.dates as mdates
+    from matplotlib.collections import PolyCollection
+
+    days = np.arange(t0.astype("datetime64[D]"), t1.astype("datetime64[D]") + 1)
+    x0 = mdates.date2num(days + np.timedelta64(NIGHT_START_HOUR, "h"))
+    x1 = mdates.date2num(days + np.timedelta64(NIGHT_END_HOUR, "h"))
+    zero, one = np.zeros_like(x0), np.ones_like(x0)
+    verts = np.stack([np.c_[x0, zero], np.c_[x0, one], np.c_[x1, one], np.c_[x1, zero]], axis=1)
+    ax.add_collection(PolyCollection(verts, transform=ax.get_xaxis_transform(),
+                                     facecolor="gray", alpha=0.15, edgecolor="none"))
+
+
+def plot(cols, plot_path=PLOT_PATH, title=None):
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    import numpy as np
+
+    import brightness_cache
+    from metering import METER_LUMA
+
+    ts = cols["ts"]
+    mean = np.asarray(cols["mean"], dtype=float)
+    # 旧 capture_daemon.py の Y 平均は閾値と尺度が違うので灰色で別に描き、ヒストグラムにも入れない
+    luma = cols["meter"] == brightness_cache.METERS[METER_LUMA]
+
+    # ===== プロット作成 =====
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 9),
+                                   sharex=False, gridspec_kw={"height_ratios": [3, 1]})
+
+    # ===== 上：時系列の明るさ =====
+    ax1.axhspan(TARGET_MIN, TARGET_MAX, color="yellow",
+                alpha=0.2, label="Target Range (0.25~0.35)")
+    ax1.axhline(TARGET_MIN, color="green",
+                linestyle="--", label="Target Min (0.25)")
+    ax1.axhline(TARGET_MAX, color="orange",
+                linestyle="--", label="Target Max (0.35)")
+    ax1.axhline(TOO_BRIGHT, color="red", linestyle="--", label="Too Bright (0.40)")
+
+    long_span = False
+    if len(ts):
+        t0, t1 = ts.min(), ts.max()
+        secs = (ts - t0).astype(np.int64)
+        span = max(int(secs.max()), 1)
+        long_span = span > 7 * 86400
+        # バケット幅は軸の横幅（px）から決める。何日分でも描く要素数は横幅程度で一定
+        n_buckets = max(int(ax1.get_window_extent().width / BUCKET_PX), 1)
+        width = -(-span // n_buckets)
+        n_buckets = span // width + 1
+        centers = t0 + (np.arange(n_buckets) * width + width // 2).astype("timedelta64[s]")
+
+        series = [(name, (cols["mode"] == code) & ~luma, color, f"{name.capitalize()} Mode")
+                  for name, code, color in MODES]
+        series.append(("luma", luma, "gray", "Lores Y (old daemon, not comparable)"))
+        for name, sel, color, label in series:
+            count = int(sel.sum())
+            if count == 0:
+                continue
+            if count <= n_buckets:
+                # 点が少ないときは1点ずつ打つ（auto は EV の大きさで点を大きく）
+                if name == "auto":
+                    ev = np.nan_to_num(np.asarray(cols["ev"][sel], dtype=float))
+                    sizes = np.clip((abs(ev) + 1) * 20, 10, 100)
+                else:
+                    sizes = 20
+                ax1.scatter(ts[sel], mean[sel], color=color, s=sizes, label=label)
+                continue
+            lo, avg, hi = bucketize(secs[sel], mean[sel], width, n_buckets)
+            ax1.fill_between(centers, lo, hi, color=color, alpha=0.25, linewidth=0)
+            ax1.plot(centers, avg, color=color, linewidth=1, label=f"{label} (mean / min-max)")
+
+        night_spans(ax1, t0, t1)
+        ax1.set_xlim(t0, t1)
+
+    ax1.set_ylabel("Mean Brightness")
+    ax1.set_title(title or f"Brightness (Last {DAYS_TO_KEEP} Days)")
+    ax1.grid(True)
+    ax1.xaxis.set_major_formatter(
+        mdates.DateFormatter('%Y-%m-%d' if long_span else '%m-%d %H:%M'))
+    plt.setp(ax1.get_xticklabels(), rotation=45)
+
+    # ===== 下：ヒストグラム（集計は NumPy、描画は階段1本） =====
+    counts, edges = np.histogram(mean[~np.isnan(mean) & ~luma], bins=30)
+    ax2.stairs(counts, edges, fill=True, color="purple", alpha=0.7)
+    ax2.stairs(counts, edges, color="black")
+    ax2.axvline(TARGET_MIN, color="green",
+                linestyle="--", label="Target Min (0.25)")
+    ax2.axvline(TARGET_MAX, color="orange",
+                linestyle="--", label="Target Max (0.35)")
+    ax2.axvline(TOO_BRIGHT, color="red", linestyle="--", label="Too Bright (0.40)")
+    ax2.set_xlabel("Mean Brightness")
+    ax2.set_ylabel("Frequency")
+    ax2.grid(True)
+    ax2.legend()
+
+    # ===== レイアウト調整と保存 =====
+    plt.tight_layout()
+    ax1.legend(loc="upper left", bbox_to_anchor=(0.0, 0.45), frameon=True)
+
+    plt.savefig(plot_path)
+    plt.close(fig)
+    print(f"Saved plot to: {plot_path}")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="明るさログのグラフを作る")
+    p.add_argument("--days", type=float, default=DAYS_TO_KEEP,
+                   help=f"最新何日分を描くか（既定 {DAYS_TO_KEEP}）")
+    p.add_argument("--from", dest="start", type=datetime.fromisoformat,
+                   help="開始日時（例 2026-01-01 / 2026-01-01T12:00）。指定すると --days は無視")
+    p.add_argument("--to", dest="end", type=datetime.fromisoformat,
+                   help="終了日時（既定: 現在）")
+    p.add_argument("--out", default=PLOT_PATH, help=f"出力先（既定 {PLOT_PATH}）")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    a = parse_args(argv)
+    end = a.end or datetime.now()
+    start = a.start or end - timedelta(days=a.days)
+    if a.start or a.end:
+        title = f"Brightness ({start:%Y-%m-%d %H:%M} ~ {end:%Y-%m-%d %H:%M})"
+    else:
+        title = f"Brightness (Last {a.days:g} Days)"
+    plot(load_brightness(start, end), a.out, title)
+
+
+if __name__ == "__main__":
+    main()
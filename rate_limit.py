@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+rate_limit.py — スレッド間で共有するトークンバケット
+
+Slack のアップロード（1 トークン = 1 ファイル）や、転送帯域の制限（1 トークン = 1 バイト）に使う。
+トークンが足りないときは不足分が貯まるまで呼び出し側が待つ。
+429 の Retry-After のようにサーバから待てと言われたときは pause() でバケット全体を止める。
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    def __init__(self, rate: Optional[float], burst: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """rate: 1 秒あたりのトークン数（None か 0 以下なら無制限）、burst: 貯められる上限"""
+        self.rate = rate if rate and rate > 0 else None
+        self.burst = max(burst, 1.0)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._last = clock()
+        self._paused_until = 0.0
+        self.waited = 0.0      # acquire で待った合計秒数（計測用）
+
+    def _refill(self, now: float):
+        if self.rate is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """tokens 分を取り出す。待った秒数を返す
+
+        burst より大きい量も取り出せる（残高がマイナスになり、その分だけ後の呼び出しが待つ）。
+        """
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            wait = max(0.0, self._paused_until - now)
+            if self.rate is not None:
+                self._tokens -= tokens
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens / self.rate)
+            self.waited += wait
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """待たずに取り出せるときだけ取り出す"""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            if now < self._paused_until:
+                return False
+            if self.rate is None:
+                return True
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def pause(self, seconds: float):
+        """seconds 秒のあいだ全員を止める（Retry-After 用）。貯まっていた分も捨てる"""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = min(self._tokens, 0.0)
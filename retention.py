@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+retention.py — archived/ の古い日付ディレクトリを、NAS へのコピーを確認できたものだけ消す
+
+パーティションの使用率が RETENTION_HIGH_PCT を超えたら古い日から順に消し、
+RETENTION_LOW_PCT を下回る見込みになったところで止める。使用率に関係なく、
+IMAGE_RETENTION_DAYS より古い日も（確認できていれば）消す。
+
+消してよいのは nas_sync のマニフェストで全ファイルが送信済み（size・mtime も一致）と確認できた日だけ。
+日ごとのサイズは dir_size.DirSizeCache.child_sizes（確定した日はキャッシュのまま stat しない）から取り、
+消したあとの使用率はその合計から見積もるので、ツリー全体をたどり直さない。
+
+scripts/sync_to_nas.sh の `find -mtime +50 -exec rm -rf` の置き換え。
+
+    python3 retention.py              # 必要なら消す
+    python3 retention.py --dry-run    # 消す予定の日と見込みの使用率だけ出す
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+import dir_size
+import frame_catalog
+import nas_sync
+
+ROOT = Path("/home/pi/timelapse-system")
+ARCHIVED_DIR = ROOT / "archived"
+LOG_PATH = ROOT / "log" / "retention.log"
+
+# cron から直接起動されても監視と同じ DISK_THRESHOLD を使う
+load_dotenv(ROOT / ".env")
+
+DISK_THRESHOLD = float(os.getenv("DISK_THRESHOLD", 80.0))
+# 既定は監視アラート（DISK_THRESHOLD）の少し手前で消し始め、10 ポイント下げたところで止める
+HIGH_PCT = float(os.getenv("RETENTION_HIGH_PCT", DISK_THRESHOLD - 5))
+LOW_PCT = float(os.getenv("RETENTION_LOW_PCT", HIGH_PCT - 10))
+MAX_AGE_DAYS = int(os.getenv("IMAGE_RETENTION_DAYS", 50))
+KEEP_DAYS = int(os.getenv("RETENTION_KEEP_DAYS", 2))     # 直近この日数は使用率に関係なく残す
+
+
+class DayDir(NamedTuple):
+    day: date
+    path: Path
+    size: int          # バイト（du 互換）
+
+
+class Plan(NamedTuple):
+    evict: List[DayDir]
+    blocked: List[DayDir]      # 消したいが NAS へのコピーを確認できない日
+    used_pct: float
+    projected_pct: float
+
+
+def day_dirs(archived_dir: Path, cache: dir_size.DirSizeCache) -> List[DayDir]:
+    """archived/ 直下の日付ディレクトリ（古い順）"""
+    out = []
+    for name, size in cache.child_sizes(str(archived_dir)).items():
+        try:
+            day = date.fromisoformat(name)
+        except ValueError:
+            continue
+        out.append(DayDir(day, Path(archived_dir) / name, size))
+    return sorted(out)
+
+
+def confirmed(day: date, archived_dir: Path, manifest_dir: Path) -> bool:
+    """その日の全ファイルがマニフェストで送信済みか"""
+    return nas_sync.day_status(day, archived_dir, manifest_dir)["pending"] == 0
+
+
+def plan(archived_dir: Path = ARCHIVED_DIR, manifest_dir: Path = nas_sync.MANIFEST_DIR,
+         cache: Optional[dir_size.DirSizeCache] = None, high_pct: float = HIGH_PCT,
+         low_pct: float = LOW_PCT, max_age_days: int = MAX_AGE_DAYS,
+         keep_days: int = KEEP_DAYS, today: Optional[date] = None) -> Plan:
+    cache = cache or dir_size.DirSizeCache()
+    today = today or date.today()
+    usage = shutil.disk_usage(archived_dir)
+    used_pct = usage.used / usage.total * 100
+    pressure = used_pct >= high_pct
+    freed = 0
+    evict, blocked = [], []
+    for d in day_dirs(archived_dir, cache):
+        if d.day > today - timedelta(days=keep_days):
+            break
+        projected = (usage.used - freed) / usage.total * 100
+        expired = d.day < today - timedelta(days=max_age_days)
+        if not expired and not (pressure and projected > low_pct):
+            # 古い順に見ているので、ここより新しい日はどれも消す理由がない
+            break
+        if not confirmed(d.day, archived_dir, manifest_dir):
+            blocked.append(d)
+            continue
+        evict.append(d)
+        freed += d.size
+    return Plan(evict, blocked, used_pct, (usage.used - freed) / usage.total * 100)
+
+
+def apply(p: Plan, cache: dir_size.DirSizeCache,
+          catalog_path: Optional[Path] = None) -> int:
+    """計画どおりに消す。消せた日数を返す（フレーム台帳からもその日の行を消す）"""
+    removed = 0
+    for d in p.evict:
+        try:
+            shutil.rmtree(d.path)
+        except OSError as e:
+            logging.error(f"⚠️ 削除失敗: {d.path}: {e}")
+            continue
+        cache.discard(str(d.path))
+        frame_catalog.record("remove_day", d.day, path=catalog_path)
+        removed += 1
+        logging.info(f"🗑 {d.day} を削除（{d.size / 1024 / 1024:.0f} MB、NAS 送信済み確認済み）")
+    return removed
+
+
+def main():
+    p = argparse.ArgumentParser(description="archived/ の古い日付を NAS 送信済みのものだけ削除する")
+    p.add_argument("--archived-dir", type=Path, default=ARCHIVED_DIR)
+    p.add_argument("--high", type=float, default=HIGH_PCT, help="消し始める使用率（%%）")
+    p.add_argument("--low", type=float, default=LOW_PCT, help="消すのをやめる使用率（%%）")
+    p.add_argument("--max-age-days", type=int, default=MAX_AGE_DAYS)
+    p.add_argument("--dry-run", action="store_true")
+    a = p.parse_args()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if not a.dry_run:
+        LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        handlers.append(logging.FileHandler(LOG_PATH))
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S", handlers=handlers)
+
+    cache = dir_size.DirSizeCache()
+    pl = plan(a.archived_dir, cache=cache, high_pct=a.high, low_pct=a.low,
+              max_age_days=a.max_age_days)
+    for d in pl.blocked:
+        logging.warning(f"⚠️ {d.day} は NAS への送信を確認できないため残します"
+                        f"（{d.size / 1024 / 1024:.0f} MB）")
+    if a.dry_run:
+        for d in pl.evict:
+            print(f"削除予定: {d.day} {d.size / 1024 / 1024:.0f} MB")
+        print(f"使用率 {pl.used_pct:.1f}% → {pl.projected_pct:.1f}%（見込み）"
+              f" / 上限 {a.high:.0f}% 下限 {a.low:.0f}%")
+        return
+
+    removed = apply(pl, cache)
+    cache.save()
+    if removed:
+        logging.info(f"✅ {removed} 日分を削除: 使用率 {pl.used_pct:.1f}% → 約 {pl.projected_pct:.1f}%")
+    if pl.projected_pct >= a.high:
+        logging.warning(f"⚠️ 削除後も使用率が上限 {a.high:.0f}% を超えています"
+                        f"（約 {pl.projected_pct:.1f}%、未送信で残した日 {len(pl.blocked)} 日）")
+
+
+if __name__ == "__main__":
+    main()
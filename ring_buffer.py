@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+ring_buffer.py — 固定長・array 裏付けのサンプル用リングバッファ
+
+monitor.py --daemon が高頻度で取る温度・負荷・メモリを保持する。
+系列ごとに array('d') を1本確保し、以降はメモリを増やさず古いサンプルを上書きする。
+"""
+
+import math
+from array import array
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+Stat = Tuple[float, float, float]   # (min, avg, max)
+
+
+class SampleRing:
+    def __init__(self, fields: Sequence[str], capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self._ts = array("d", [0.0]) * capacity
+        self._cols: Dict[str, array] = {
+            f: array("d", [math.nan]) * capacity for f in self.fields}
+        self._head = 0      # 次に書き込む位置
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, ts: float, **values: float):
+        i = self._head
+        self._ts[i] = ts
+        for f in self.fields:
+            v = values.get(f)
+            self._cols[f][i] = math.nan if v is None else v
+        self._head = (i + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _indices_since(self, start_ts: float) -> Iterator[int]:
+        # 新しい順にたどり、start_ts 以前になったら止める。start_ts ちょうどのサンプルは
+        # 前の区間の最後（monitor.py は書き込んだ時刻を次の start_ts にする）なので含めない
+        for k in range(self._count):
+            i = (self._head - 1 - k) % self.capacity
+            if self._ts[i] <= start_ts:
+                return
+            yield i
+
+    def latest(self, field: str) -> Optional[float]:
+        if not self._count:
+            return None
+        v = self._cols[field][(self._head - 1) % self.capacity]
+        return None if math.isnan(v) else v
+
+    def aggregate(self, start_ts: float) -> Dict[str, Optional[Stat]]:
+        """start_ts より後のサンプルの系列ごとの (min, avg, max)。NaN は除外"""
+        lo = {f: math.inf for f in self.fields}
+        hi = {f: -math.inf for f in self.fields}
+        total = {f: 0.0 for f in self.fields}
+        n = {f: 0 for f in self.fields}
+        for i in self._indices_since(start_ts):
+            for f in self.fields:
+                v = self._cols[f][i]
+                if math.isnan(v):
+                    continue
+                lo[f] = min(lo[f], v)
+                hi[f] = max(hi[f], v)
+                total[f] += v
+                n[f] += 1
+        return {f: (lo[f], total[f] / n[f], hi[f]) if n[f] else None
+                for f in self.fields}
+
+    def count_since(self, start_ts: float) -> int:
+        return sum(1 for _ in self._indices_since(start_ts))
@@ -1,10 +1,10 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
-# ==== 処理スキップ条件 ====
+# ==== プレビュー配信中はサーバーからスナップショットを取得 ====
+PREVIEW=false
 if pgrep -f mjpeg_server.py >/dev/null; then
-  echo "[INFO] $(date '+%Y-%m-%d %H:%M:%S') mjpeg_server 実行中のため撮影スキップ" >> /home/pi/timelapse-system/log/cron.log
-  exit 0
+  PREVIEW=true
 fi
 
 # ==== 撮影条件 ====
@@ -44,48 +44,59 @@ case $HOUR in
   *) TIME_INFO="night" ;;
 esac
 
-# ==== 明るさ測定（仮撮影） ====
-libcamera-jpeg --nopreview --width 640 --height 360 --quality 50 \
-  $AWB_OPT $DENOISE_OPT --lens-position "$FOCUS_POS" \
-  -o "$TMPFILE" > /dev/null 2>&1 || true
-
-MEAN=$(identify -format "%[fx:mean]" "$TMPFILE" 2>/dev/null || echo "n/a")
-rm -f "$TMPFILE"
-
-# ==== 明るさに基づく撮影条件 ====
-if [[ "$MEAN" != "n/a" ]] && (( $(echo "$MEAN >= 0.15" | bc -l) )); then
-  AUTO_MODE=false
-  SHUTTER_OPT="--shutter 10000"
-  GAIN_OPT="--gain 3.0"
-  METER_OPT="--metering centre"
-else
+if $PREVIEW; then
+  # カメラは mjpeg_server が保持中（自動露出）。/snapshot.jpg から取得する
   AUTO_MODE=true
   EV_OPT="--ev 0"
-  METER_OPT="--metering centre"
-fi
-
-# ==== 撮影本番（最大2回リトライ） ====
-START_TIME=$(date +%s.%N)
-SUCCESS=false
-for i in {1..2}; do
-  if $AUTO_MODE; then
-    if OUTPUT=$(libcamera-jpeg --nopreview=on --width 2304 --height 1296 --quality 90 \
-      $AWB_OPT $EV_OPT $METER_OPT $DENOISE_OPT \
-      --lens-position "$FOCUS_POS" $ROT_OPT -o "$OUTFILE" 2>&1); then
-      SUCCESS=true
-      break
-    fi
+  SUCCESS=false
+  if OUTPUT=$(python3 /home/pi/timelapse-system/snapshot_client.py -o "$OUTFILE" 2>&1); then
+    SUCCESS=true
+  fi
+  echo "[INFO] $(date '+%Y-%m-%d %H:%M:%S') mjpeg_server 実行中のためスナップショットで撮影: $OUTPUT" >> "$CRONLOG"
+else
+  # ==== 明るさ測定（仮撮影） ====
+  libcamera-jpeg --nopreview --width 640 --height 360 --quality 50 \
+    $AWB_OPT $DENOISE_OPT --lens-position "$FOCUS_POS" \
+    -o "$TMPFILE" > /dev/null 2>&1 || true
+
+  MEAN=$(identify -format "%[fx:mean]" "$TMPFILE" 2>/dev/null || echo "n/a")
+  rm -f "$TMPFILE"
+
+  # ==== 明るさに基づく撮影条件 ====
+  if [[ "$MEAN" != "n/a" ]] && (( $(echo "$MEAN >= 0.15" | bc -l) )); then
+    AUTO_MODE=false
+    SHUTTER_OPT="--shutter 10000"
+    GAIN_OPT="--gain 3.0"
+    METER_OPT="--metering centre"
   else
-    if OUTPUT=$(libcamera-jpeg --nopreview=on --width 2304 --height 1296 --quality 90 \
-      $AWB_OPT $METER_OPT $DENOISE_OPT $SHUTTER_OPT $GAIN_OPT \
-      --lens-position "$FOCUS_POS" $ROT_OPT -o "$OUTFILE" 2>&1); then
-      SUCCESS=true
-      break
-    fi
+    AUTO_MODE=true
+    EV_OPT="--ev 0"
+    METER_OPT="--metering centre"
   fi
-  sleep 1
-  echo "[WARN] $(date '+%Y-%m-%d %H:%M:%S') 撮影失敗のためリトライ中..." >> "$CRONLOG"
-done
+
+  # ==== 撮影本番（最大2回リトライ） ====
+  START_TIME=$(date +%s.%N)
+  SUCCESS=false
+  for i in {1..2}; do
+    if $AUTO_MODE; then
+      if OUTPUT=$(libcamera-jpeg --nopreview=on --width 2304 --height 1296 --quality 90 \
+        $AWB_OPT $EV_OPT $METER_OPT $DENOISE_OPT \
+        --lens-position "$FOCUS_POS" $ROT_OPT -o "$OUTFILE" 2>&1); then
+        SUCCESS=true
+        break
+      fi
+    else
+      if OUTPUT=$(libcamera-jpeg --nopreview=on --width 2304 --height 1296 --quality 90 \
+        $AWB_OPT $METER_OPT $DENOISE_OPT $SHUTTER_OPT $GAIN_OPT \
+        --lens-position "$FOCUS_POS" $ROT_OPT -o "$OUTFILE" 2>&1); then
+        SUCCESS=true
+        break
+      fi
+    fi
+    sleep 1
+    echo "[WARN] $(date '+%Y-%m-%d %H:%M:%S') 撮影失敗のためリトライ中..." >> "$CRONLOG"
+  done
+fi
 
 # ==== 明るさ取得（本番画像） ====
 if ! $SUCCESS; then
@@ -105,6 +116,16 @@ EV_STR=$([[ $AUTO_MODE == true ]] && echo "${EV_OPT#--ev }" || echo "n/a")
 
 echo "$(date '+%Y-%m-%d %H:%M:%S'),indoor,$MODE_STR,$TIME_INFO,$SHUTTER_GAIN,$OUTFILE,$MEAN_FINAL,$EV_STR" >> "$LOGFILE"
 
+# ==== フレーム台帳へ登録（台帳が無い・失敗しても撮影は止めない） ====
+# python ごと落ちたときも不整合マーカーを置き、rebuild まで読み手が台帳を使わないようにする
+if [[ "$OUTFILE" != "N/A" ]]; then
+  python3 /home/pi/timelapse-system/frame_catalog.py add "$OUTFILE" \
+    --mean "$MEAN_FINAL" --mode "$MODE_STR" \
+    --shutter "${SHUTTER_GAIN%%,*}" --gain "${SHUTTER_GAIN#*,}" >> "$CRONLOG" 2>&1 \
+    || echo "$(date '+%Y-%m-%d %H:%M:%S') capture.sh: add $OUTFILE" \
+       >> /home/pi/timelapse-system/log/frames.db.stale
+fi
+
 # ==== 明るさ取得失敗ログ ====
 if [[ "$MEAN_FINAL" == "n/a" ]]; then
   echo "[ERROR] $(date '+%Y-%m-%d %H:%M:%S') 室内撮影完了、明るさ取得失敗" >> "$CRONLOG"
@@ -2,9 +2,9 @@
 import os
 import subprocess
 from datetime import datetime
-import csv
-from dotenv import load_dotenv
-from slack_notifier import SlackNotifier
+from csv_tail import tail_rows
+from metering import COMPARABLE_METERS, row_meter
+import notify_queue
 
 # ログ関数
 
@@ -13,37 +13,36 @@ def log(msg):
     print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {msg}")
 
 
-# .envの読み込み
-load_dotenv("/home/pi/timelapse-system/.env")
-SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
-SLACK_DM_EMAIL = os.getenv("SLACK_DM_EMAIL")
-
-if SLACK_BOT_TOKEN is None:
-    raise ValueError("環境変数 'SLACK_BOT_TOKEN' が設定されていません。")
-
-if SLACK_DM_EMAIL is None:
-    raise ValueError("環境変数 'SLACK_DM_EMAIL' が設定されていません。")
-
 CSV_PATH = f"/home/pi/timelapse-system/log/brightness_{datetime.now():%Y-%m}.csv"
+TREND_ROWS = 10
+# 添付は長辺 1024px・300KB までの縮小版を送る（DCT 縮小、cache/attachments/ に再利用）
+PREVIEW_MAX_PX = 1024
+PREVIEW_MAX_BYTES = 300 * 1024
 # PLOT_SCRIPT = "/home/pi/timelapse-system/plot_mean.py"
 # PLOT_IMAGE = "/home/pi/timelapse-system/log/brightness_plot.png"
 
-notifier = SlackNotifier(bot_token=SLACK_BOT_TOKEN, user_email=SLACK_DM_EMAIL)
-
 # def run_plot_script():
 #     subprocess.run(["python3", PLOT_SCRIPT], check=True)
 
 
-def analyze_trend():
+def read_recent_rows():
+    # 末尾 TREND_ROWS 行だけを後ろから読む（前回位置はキャッシュされる）
+    return tail_rows(CSV_PATH, TREND_ROWS, min_fields=8)
+
+
+def analyze_trend(rows=None):
     means = []
     try:
-        with open(CSV_PATH, "r") as f:
-            rows = list(csv.reader(f))
-            for row in rows[-10:]:
-                try:
-                    means.append(float(row[7]))
-                except ValueError:
-                    continue
+        if rows is None:
+            rows = read_recent_rows()
+        for row in rows:
+            # 旧 capture_daemon.py の Y 平均（luma）は尺度が違うので傾向に混ぜない
+            if row_meter(row) not in COMPARABLE_METERS:
+                continue
+            try:
+                means.append(float(row[7]))
+            except ValueError:
+                continue
         if len(means) < 2:
             return "データが不十分です。"
 
@@ -58,14 +57,23 @@ def analyze_trend():
         return f"解析失敗: {e}"
 
 
-def get_latest_image_path():
+def get_latest_image_path(rows=None):
+    # 台帳があれば最新フレームの今の場所を引く（CSV のパスは archived へ移すと古くなる）
+    import frame_catalog
+    cat = frame_catalog.open_catalog()
+    if cat is not None:
+        try:
+            with cat:
+                latest = cat.latest()
+            if latest and os.path.exists(latest.path):
+                return latest.path
+        except Exception:
+            pass
     try:
-        with open(CSV_PATH, "r") as f:
-            lines = f.readlines()
-            if lines:
-                last = lines[-1].strip().split(",")
-                if len(last) >= 7:
-                    return last[6]
+        if rows is None:
+            rows = read_recent_rows()
+        if rows:
+            return frame_catalog.resolve(rows[-1][6]) or rows[-1][6]
     except:
         return None
     return None
@@ -81,12 +89,10 @@ def send_report():
         # 最新データ
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         latest_mean = "n/a"
-        with open(CSV_PATH, "r") as f:
-            lines = f.readlines()
-            if lines:
-                last = lines[-1].strip().split(",")
-                latest_mean = last[7]
-        trend_summary = analyze_trend()
+        rows = read_recent_rows()
+        if rows:
+            latest_mean = rows[-1][7]
+        trend_summary = analyze_trend(rows)
 
         # コメント文生成
         comment = (
@@ -103,19 +109,21 @@ def send_report():
         #     comment=comment
         # )
 
-        # 最新画像送信
-        latest_img = get_latest_image_path()
-        image_success = False
+        # 最新画像送信（送信キューに積み、バックグラウンドの flusher が送る）
+        latest_img = get_latest_image_path(rows)
+        image_queued = False
         if latest_img and os.path.exists(latest_img):
-            image_success = notifier.send_file(
+            image_queued = notify_queue.enqueue(
+                comment,
                 filepath=latest_img,
                 title="最新撮影画像",
-                comment=comment
-            )
+                max_px=PREVIEW_MAX_PX,
+                max_bytes=PREVIEW_MAX_BYTES
+            ) is not None
 
-        # if graph_success or image_success:
-        if image_success:
-            log("✅ レポート送信完了")
+        # if graph_success or image_queued:
+        if image_queued:
+            log("📮 レポートを送信キューに追加")
         else:
             log("⚠️ レポート送信に失敗")
 
@@ -1,15 +1,65 @@
 #!/usr/bin/env python3
 import os
+import json
 import time
 import socket
 import logging
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, List, Tuple
+from typing import Any, Callable, Optional, List, NamedTuple, Tuple
 from pathlib import Path
 
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.builtin_handlers import (
+    ConnectionErrorRetryHandler, RateLimitErrorRetryHandler)
+
+from rate_limit import TokenBucket
+
+# DM の宛先キャッシュの有効期限（秒）。既定 7 日
+CACHE_TTL_SEC = int(os.getenv("SLACK_CACHE_TTL_SEC", 7 * 24 * 3600))
+
+# これらのエラーはキャッシュした宛先が無効になったことを示すので、捨てて取り直す
+STALE_CACHE_ERRORS = {
+    "channel_not_found", "not_in_channel", "is_archived",
+    "user_not_found", "user_disabled", "cannot_dm_bot",
+}
+
+# send_files の同時アップロード数と、全ワーカー共有のアップロード開始レート（ファイル/秒）
+UPLOAD_WORKERS = int(os.getenv("SLACK_UPLOAD_WORKERS", 3))
+UPLOAD_RATE_PER_SEC = float(os.getenv("SLACK_UPLOAD_RATE", 1.0))
+UPLOAD_RETRIES = 5          # 429 のときの再試行回数
+
+
+class SharedRateLimitRetryHandler(RateLimitErrorRetryHandler):
+    """429 の Retry-After を共有バケットに反映してから再試行する（他のワーカーも同じだけ待つ）"""
+
+    def __init__(self, bucket: TokenBucket, max_retry_count: int = UPLOAD_RETRIES):
+        super().__init__(max_retry_count=max_retry_count)
+        self.bucket = bucket
+
+    def prepare_for_next_attempt(self, *, state, request, response=None, error=None):
+        if response is None:
+            raise error
+        state.next_attempt_requested = True
+        retry_after = 1.0
+        for k, v in response.headers.items():
+            if k.lower() == "retry-after":
+                retry_after = float(v[0])
+                break
+        logging.warning(f"[Slack] レート制限（429）: {retry_after:.0f}秒待って再送 "
+                        f"({state.current_attempt+1}/{self.max_retry_count})")
+        self.bucket.pause(retry_after)
+        self.bucket.acquire()
+        state.increment_current_attempt()
+
+
+class UploadResult(NamedTuple):
+    path: str
+    success: bool
+    latency: float      # 秒（レート待ち・再試行を含む）
+
 
 class SlackNotifier:
     RETRY_COUNT = 10
@@ -17,40 +67,109 @@ class SlackNotifier:
     BASE_DIR = Path(__file__).resolve().parent
     USER_ID_CACHE_DIR = BASE_DIR / "cache"
 
-    def __init__(self, bot_token: str, user_email: Optional[str] = None):
-        self.client = WebClient(token=bot_token)
+    def __init__(self, bot_token: str, user_email: Optional[str] = None,
+                 cache_ttl_sec: int = CACHE_TTL_SEC, base_url: Optional[str] = None):
+        # 429 の Retry-After はこのバケットを止めて全ワーカーで守る
+        self.upload_bucket = TokenBucket(UPLOAD_RATE_PER_SEC, burst=UPLOAD_WORKERS)
+        retry_handlers = [ConnectionErrorRetryHandler(),
+                          SharedRateLimitRetryHandler(self.upload_bucket)]
+        # base_url はローカルのスタブサーバで試すとき用（benchmarks/slack_stub.py）
+        if base_url:
+            self.client = WebClient(token=bot_token, base_url=base_url,
+                                    retry_handlers=retry_handlers)
+        else:
+            self.client = WebClient(token=bot_token, retry_handlers=retry_handlers)
         self.user_email: Optional[str] = user_email
+        self.cache_ttl_sec = cache_ttl_sec
+        self.channel_id: Optional[str] = None
         self.user_id: Optional[str] = self._load_or_fetch_user_id()
 
+    def _email_hash(self) -> str:
+        # メールアドレスのハッシュでファイル名生成（安全かつ一意）
+        return hashlib.sha256((self.user_email or "").encode()).hexdigest()
+
     def _get_cache_path(self) -> Optional[str]:
         if not self.user_email:
             return None
         os.makedirs(self.USER_ID_CACHE_DIR, exist_ok=True)
-        # メールアドレスのハッシュでファイル名生成（安全かつ一意）
-        email_hash = hashlib.sha256(self.user_email.encode()).hexdigest()
-        return os.path.join(self.USER_ID_CACHE_DIR, f"user_id_{email_hash}.txt")
+        return os.path.join(self.USER_ID_CACHE_DIR, f"slack_dm_{self._email_hash()}.json")
 
-    def _load_or_fetch_user_id(self) -> Optional[str]:
+    def _load_cache(self) -> dict:
         cache_path = self._get_cache_path()
-        if cache_path and os.path.exists(cache_path):
+        if not cache_path:
+            return {}
+        try:
+            with open(cache_path, "r") as f:
+                cache = json.load(f)
+            if time.time() - cache.get("saved_at", 0) < self.cache_ttl_sec:
+                return cache
+            logging.info("[Slack] 宛先キャッシュの有効期限切れ")
+        except FileNotFoundError:
+            # 旧形式（ユーザーIDのみのテキスト）があれば引き継ぐ（saved_at なし = 要移行）
             try:
-                with open(cache_path, "r") as f:
+                with open(self._legacy_cache_path(), "r") as f:
                     user_id = f.read().strip()
-                    if user_id:
-                        logging.info(f"[Slack] キャッシュからユーザーIDを読み込み: {user_id}")
-                        return user_id
-            except Exception as e:
-                logging.warning(f"[Slack] ユーザーIDキャッシュの読み込み失敗: {e}")
+                if user_id:
+                    return {"user_id": user_id}
+            except OSError:
+                pass
+        except Exception as e:
+            logging.warning(f"[Slack] 宛先キャッシュの読み込み失敗: {e}")
+        return {}
+
+    def _legacy_cache_path(self) -> str:
+        return os.path.join(self.USER_ID_CACHE_DIR, f"user_id_{self._email_hash()}.txt")
+
+    def _remove_legacy_cache(self):
+        # 残しておくと JSON キャッシュを消したあとに古いIDが復活する
+        try:
+            os.remove(self._legacy_cache_path())
+        except OSError:
+            pass
+
+    def _save_cache(self):
+        cache_path = self._get_cache_path()
+        if not cache_path or not self.user_id:
+            return
+        try:
+            tmp = cache_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"user_id": self.user_id, "channel_id": self.channel_id,
+                           "saved_at": time.time()}, f)
+            os.replace(tmp, cache_path)
+        except Exception as e:
+            logging.warning(f"[Slack] 宛先キャッシュ保存失敗: {e}")
+
+    def invalidate_cache(self):
+        logging.info("[Slack] 宛先キャッシュを破棄します")
+        self.user_id = None
+        self.channel_id = None
+        cache_path = self._get_cache_path()
+        if cache_path:
+            try:
+                os.remove(cache_path)
+            except OSError:
+                pass
+            self._remove_legacy_cache()
+
+    def _load_or_fetch_user_id(self) -> Optional[str]:
+        cache = self._load_cache()
+        if cache.get("user_id"):
+            logging.info(f"[Slack] キャッシュからユーザーIDを読み込み: {cache['user_id']}")
+            self.channel_id = cache.get("channel_id")
+            if "saved_at" not in cache:
+                # 旧形式は JSON に書き直してから消す
+                self.user_id = cache["user_id"]
+                self._save_cache()
+                self._remove_legacy_cache()
+            return cache["user_id"]
 
         # キャッシュがなければAPIから取得
         user_id = self._get_user_id()
-        if user_id and cache_path:
-            try:
-                with open(cache_path, "w") as f:
-                    f.write(user_id)
-                logging.info(f"[Slack] ユーザーIDをキャッシュに保存: {user_id}")
-            except Exception as e:
-                logging.warning(f"[Slack] ユーザーIDキャッシュ保存失敗: {e}")
+        if user_id:
+            self.user_id = user_id
+            self._save_cache()
+            logging.info(f"[Slack] ユーザーIDをキャッシュに保存: {user_id}")
         return user_id
 
     def _get_user_id(self) -> Optional[str]:
@@ -80,6 +199,12 @@ class SlackNotifier:
         return None
 
     def _get_dm_channel_id(self) -> Optional[str]:
+        if self.channel_id:
+            return self.channel_id
+        if not self.user_id:
+            self.user_id = self._load_or_fetch_user_id()
+            if self.channel_id:
+                return self.channel_id
         if not self.user_id:
             logging.error("[Slackエラー] user_idがNoneのためDMチャンネルを開けません")
             return None
@@ -87,78 +212,156 @@ class SlackNotifier:
             conv = self.client.conversations_open(users=self.user_id)
             channel_info = conv.get("channel") if conv else None
             if channel_info and "id" in channel_info:
-                return channel_info["id"]
+                self.channel_id = channel_info["id"]
+                self._save_cache()
+                return self.channel_id
             else:
                 logging.error(f"[Slackエラー] DMチャンネルオープン失敗: レスポンスに'channel'または'id'がありません")
                 return None
         except SlackApiError as e:
             logging.error(f"[Slackエラー] DMチャンネルオープン失敗: {e.response['error']}")
+            if e.response["error"] in STALE_CACHE_ERRORS:
+                self.invalidate_cache()
             return None
 
+    def _call_dm(self, call: Callable[[str], Any], channel_id: Optional[str] = None):
+        """DM 宛て（channel_id 省略時）の API 呼び出し。キャッシュした宛先が無効なら1回だけ取り直す"""
+        if channel_id:
+            return call(channel_id)
+        for attempt in range(2):
+            channel = self._get_dm_channel_id()
+            if not channel:
+                raise ValueError("チャンネルIDが取得できませんでした")
+            try:
+                return call(channel)
+            except SlackApiError as e:
+                if attempt == 0 and e.response["error"] in STALE_CACHE_ERRORS:
+                    logging.warning(f"[Slack] キャッシュした宛先が無効です（{e.response['error']}）: 取り直します")
+                    self.invalidate_cache()
+                    continue
+                raise
+
     def send_message(self, message: str, channel_id: Optional[str] = None, thread_ts: Optional[str] = None) -> str:
         try:
-            if not channel_id and not self.user_id:
+            if not channel_id and not self.user_email:
                 raise ValueError("送信先が指定されていません")
 
-            channel = channel_id or self._get_dm_channel_id()
-            if not channel:
-                logging.error("[Slackエラー] チャンネルIDが取得できませんでした")
-                return ""
-            response = self.client.chat_postMessage(
+            response = self._call_dm(lambda channel: self.client.chat_postMessage(
                 channel=channel,
                 text=message,
                 thread_ts=thread_ts
-            )
+            ), channel_id)
             ts = response.get("ts", "")
             logging.info(f"[✅] メッセージ送信成功（ts={ts}）")
             return ts if isinstance(ts, str) else ""
         except SlackApiError as e:
             logging.error(f"[Slackエラー] メッセージ送信失敗: {e.response['error']}")
             return ""
+        except ValueError as e:
+            logging.error(f"[Slackエラー] {e}")
+            return ""
         except Exception as e:
             logging.exception(f"[Slackエラー] 不明なエラー: {e}")
             return ""
 
     def send_file(self, filepath: str, title: str = "", comment: str = "",
-                  channel_id: Optional[str] = None, thread_ts: Optional[str] = None) -> bool:
+                  channel_id: Optional[str] = None, thread_ts: Optional[str] = None,
+                  max_px: Optional[int] = None, max_bytes: Optional[int] = None) -> bool:
+        """max_px（長辺）/ max_bytes を指定すると JPEG は縮小版（cache/attachments/）を送る"""
         if not os.path.exists(filepath):
             logging.error(f"[エラー] ファイルが存在しません: {filepath}")
             return False
 
         try:
-            channel = channel_id or self._get_dm_channel_id()
-            if not channel:
-                logging.error("[Slackエラー] チャンネルIDが取得できませんでした")
-                return False
             rendered_comment = self._render_template(comment)
             rendered_title = self._render_template(title)
 
-            self.client.files_upload_v2(
-                channel=channel,
-                file=filepath,
-                title=rendered_title,
-                filename=os.path.basename(filepath),
-                initial_comment=rendered_comment,
-                thread_ts=thread_ts
-            )
-            logging.info(f"[✅] ファイル送信成功: {os.path.basename(filepath)}")
+            upload_path = filepath
+            if max_px or max_bytes:
+                import attachment_variant
+                upload_path = attachment_variant.variant(filepath, max_px, max_bytes)
+            size = os.path.getsize(upload_path)
+
+            t0 = time.monotonic()
+            self._call_dm(lambda channel: self._upload(
+                upload_path, rendered_title, rendered_comment, channel, thread_ts,
+                filename=os.path.basename(filepath)
+            ), channel_id)
+            elapsed = time.monotonic() - t0
+            note = ""
+            if upload_path != filepath:
+                note = f", 元 {os.path.getsize(filepath)/1024:.0f} KB"
+            logging.info(f"[✅] ファイル送信成功: {os.path.basename(filepath)} "
+                         f"({size/1024:.0f} KB{note}, {elapsed:.1f}秒)")
             return True
         except SlackApiError as e:
             logging.error(f"[Slackエラー] ファイル送信失敗: {e.response['error']}")
             return False
+        except ValueError as e:
+            logging.error(f"[Slackエラー] {e}")
+            return False
+
+    def _upload(self, filepath: str, title: str, comment: str,
+                channel: str, thread_ts: Optional[str], filename: Optional[str] = None):
+        # 開始レートを共有バケットで揃える（429 の再試行は SharedRateLimitRetryHandler）
+        self.upload_bucket.acquire()
+        return self.client.files_upload_v2(
+            channel=channel,
+            file=filepath,
+            title=title,
+            filename=filename or os.path.basename(filepath),
+            initial_comment=comment,
+            thread_ts=thread_ts
+        )
 
     def send_files(self, filepaths: List[str], title_template: str = "", comment_template: str = "",
-                   channel_id: Optional[str] = None, thread_ts: Optional[str] = None) -> List[Tuple[str, bool]]:
-        results = []
-        for path in filepaths:
-            success = self.send_file(
-                filepath=path,
-                title=title_template,
-                comment=comment_template,
-                channel_id=channel_id,
-                thread_ts=thread_ts
-            )
-            results.append((path, success))
+                   channel_id: Optional[str] = None, thread_ts: Optional[str] = None,
+                   max_workers: int = UPLOAD_WORKERS, max_px: Optional[int] = None,
+                   max_bytes: Optional[int] = None) -> List[Tuple[str, bool]]:
+        """複数ファイルを max_workers 本で並行アップロードする。結果は入力順の (パス, 成否)"""
+        results = self.send_files_timed(filepaths, title_template, comment_template,
+                                        channel_id, thread_ts, max_workers, max_px, max_bytes)
+        return [(r.path, r.success) for r in results]
+
+    def send_files_timed(self, filepaths: List[str], title_template: str = "",
+                         comment_template: str = "", channel_id: Optional[str] = None,
+                         thread_ts: Optional[str] = None, max_workers: int = UPLOAD_WORKERS,
+                         max_px: Optional[int] = None,
+                         max_bytes: Optional[int] = None) -> List[UploadResult]:
+        """send_files と同じ。結果にファイルごとの所要時間も入れた UploadResult を返す"""
+        if not filepaths:
+            return []
+        # 宛先はワーカーを起動する前に1回だけ解決しておく
+        channel = channel_id or self._get_dm_channel_id()
+        if not channel:
+            logging.error("[Slackエラー] チャンネルIDが取得できませんでした")
+            return [UploadResult(path, False, 0.0) for path in filepaths]
+
+        def upload(path: str) -> UploadResult:
+            t0 = time.monotonic()
+            try:
+                success = self.send_file(
+                    filepath=path,
+                    title=title_template,
+                    comment=comment_template,
+                    channel_id=channel,
+                    thread_ts=thread_ts,
+                    max_px=max_px,
+                    max_bytes=max_bytes
+                )
+            except Exception as e:
+                # 1ファイルの失敗で残りを止めない
+                logging.error(f"[Slackエラー] ファイル送信失敗: {os.path.basename(path)}: {e}")
+                success = False
+            return UploadResult(path, success, time.monotonic() - t0)
+
+        t0 = time.monotonic()
+        workers = max(1, min(max_workers, len(filepaths)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="slack-upload") as pool:
+            results = list(pool.map(upload, filepaths))
+        ok = sum(r.success for r in results)
+        logging.info(f"[Slack] {ok}/{len(results)} ファイル送信 {time.monotonic() - t0:.1f}秒"
+                     f"（最大 {max(r.latency for r in results):.1f}秒/ファイル, 並列 {workers}）")
         return results
 
     def _render_template(self, text: str) -> str:
@@ -168,3 +371,19 @@ class SlackNotifier:
             date=now.strftime("%Y-%m-%d"),
             time=now.strftime("%H:%M:%S")
         )
+
+
+_shared: Optional[SlackNotifier] = None
+
+
+def get_notifier(bot_token: Optional[str] = None,
+                 user_email: Optional[str] = None) -> SlackNotifier:
+    """プロセス内で共有する SlackNotifier（WebClient と宛先キャッシュを使い回す）"""
+    global _shared
+    if _shared is None:
+        bot_token = bot_token or os.getenv("SLACK_BOT_TOKEN")
+        user_email = user_email or os.getenv("SLACK_DM_EMAIL")
+        if not bot_token:
+            raise ValueError("環境変数 'SLACK_BOT_TOKEN' が未設定です。")
+        _shared = SlackNotifier(bot_token=bot_token, user_email=user_email)
+    return _shared
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+snapshot_client.py — mjpeg_server の /snapshot.jpg を取得して保存する
+
+プレビュー配信中はカメラを libcamera-jpeg で開けないため、capture.sh はこちらで
+動作中のサーバーから静止画を受け取る。
+
+    python3 snapshot_client.py -o images/20250501_120000.jpg
+"""
+
+import argparse
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Optional, Tuple
+
+DEFAULT_URL = "http://127.0.0.1:8000/snapshot.jpg"
+
+
+def fetch_snapshot(url: str = DEFAULT_URL, etag: Optional[str] = None,
+                   timeout: float = 10.0) -> Tuple[Optional[bytes], Optional[str]]:
+    """(JPEG, ETag) を返す。etag と一致して 304 が返った場合 JPEG は None。"""
+    req = urllib.request.Request(url)
+    if etag:
+        req.add_header("If-None-Match", etag)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as res:
+            return res.read(), res.headers.get("ETag")
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None, e.headers.get("ETag", etag)
+        raise
+
+
+def save_snapshot(path: str, url: str = DEFAULT_URL, timeout: float = 10.0) -> int:
+    jpeg, _ = fetch_snapshot(url, timeout=timeout)
+    if not jpeg:
+        raise RuntimeError("スナップショットが空です")
+    # 途中まで書かれたファイルを他のジョブに拾われないよう一時ファイル経由で置く
+    tmp = f"{path}.part"
+    with open(tmp, "wb") as f:
+        f.write(jpeg)
+    os.replace(tmp, path)
+    return len(jpeg)
+
+
+def main():
+    p = argparse.ArgumentParser(description="mjpeg_server からスナップショットを取得")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--url", default=DEFAULT_URL)
+    p.add_argument("--timeout", type=float, default=10.0)
+    a = p.parse_args()
+
+    t0 = time.monotonic()
+    try:
+        size = save_snapshot(a.output, a.url, a.timeout)
+    except Exception as e:
+        print(f"[ERROR] スナップショット取得失敗: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"[INFO] スナップショット保存: {a.output} ({size} bytes, "
+          f"{(time.monotonic() - t0) * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
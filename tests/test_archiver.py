@@ -0,0 +1,118 @@
+import errno
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import archiver
+from rate_limit import TokenBucket
+
+
+def make_frames(src, day, n, size=100):
+    paths = []
+    for i in range(n):
+        t = datetime.combine(day, datetime.min.time()) + timedelta(minutes=i)
+        p = src / f"{t:%Y%m%d_%H%M%S}.jpg"
+        p.write_bytes(b"\xff" * size)
+        paths.append(p)
+    return paths
+
+
+@pytest.fixture
+def tree(tmp_path):
+    src, dest = tmp_path / "images", tmp_path / "archived"
+    src.mkdir()
+    return src, dest, tmp_path / "archiver.journal"
+
+
+def run(src, dest, journal, **kw):
+    kw.setdefault("files_per_sec", 0)
+    # 台帳は作らない（無ければ record は何もしない）ので本物の log/frames.db には触れない
+    return archiver.archive(src, dest, journal_path=journal,
+                            catalog_path=journal.with_name("frames.db"), **kw)
+
+
+def test_dry_run_moves_nothing(tree):
+    src, dest, journal = tree
+    frames = make_frames(src, date.today() - timedelta(days=1), 5)
+    stats = run(src, dest, journal, dry_run=True)
+    assert stats["moved"] == 5
+    assert stats["bytes"] == 500
+    assert all(p.exists() for p in frames)
+    assert not dest.exists()
+    assert not journal.exists()
+
+
+def test_moves_previous_days_into_day_dirs(tree):
+    src, dest, journal = tree
+    d1, d2 = date.today() - timedelta(days=2), date.today() - timedelta(days=1)
+    make_frames(src, d1, 3)
+    make_frames(src, d2, 4)
+    today = make_frames(src, date.today(), 2)
+    stats = run(src, dest, journal)
+    assert stats["moved"] == 7
+    assert stats["copied"] == stats["failed"] == 0
+    assert stats["days"] == {d1.isoformat(): 3, d2.isoformat(): 4}
+    assert len(list((dest / d1.isoformat()).iterdir())) == 3
+    assert len(list((dest / d2.isoformat()).iterdir())) == 4
+    # 今日の分は残り、ジャーナルは正常終了で消える
+    assert all(p.exists() for p in today)
+    assert not journal.exists()
+
+
+def test_cross_device_falls_back_to_copy_and_unlink(tree, monkeypatch):
+    src, dest, journal = tree
+    day = date.today() - timedelta(days=1)
+    frames = make_frames(src, day, 3)
+
+    def exdev(a, b):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+    monkeypatch.setattr(archiver.os, "rename", exdev)
+
+    stats = run(src, dest, journal)
+    assert stats["moved"] == stats["copied"] == 3
+    for p in frames:
+        assert not p.exists()
+        assert (dest / day.isoformat() / p.name).read_bytes() == b"\xff" * 100
+    assert not list((dest / day.isoformat()).glob(".*.part"))
+
+
+def test_resume_after_crash_removes_partial_copy(tree):
+    src, dest, journal = tree
+    day = date.today() - timedelta(days=1)
+    frames = make_frames(src, day, 3)
+    # コピーの途中で落ちた状態: ジャーナルにコピー開始が残り、書きかけの .part がある
+    target = dest / day.isoformat() / frames[0].name
+    target.parent.mkdir(parents=True)
+    part = target.with_name(f".{target.name}.part")
+    part.write_bytes(b"\xff" * 10)
+    with open(journal, "w") as f:
+        f.write(json.dumps({"start": 0, "planned": 3}) + "\n")
+        f.write(json.dumps({"copy": frames[0].name, "src": str(frames[0]),
+                            "dest": str(target)}) + "\n")
+        f.write('{"moved": ')      # 書き込み途中の最後の行
+
+    stats = run(src, dest, journal)
+    assert stats["resumed"] == {"planned": 3, "moved": 0, "removed_partial": 1}
+    assert not part.exists()
+    assert stats["moved"] == 3
+    assert target.read_bytes() == b"\xff" * 100
+    assert not any(p.exists() for p in frames)
+    assert not journal.exists()
+
+
+def test_files_per_sec_budget(tree, monkeypatch):
+    src, dest, journal = tree
+    make_frames(src, date.today() - timedelta(days=1), 30)
+    clock = {"now": 0.0}
+
+    def sleep(sec):
+        clock["now"] += sec
+
+    monkeypatch.setattr(archiver, "TokenBucket", lambda rate, burst: TokenBucket(
+        rate, burst, clock=lambda: clock["now"], sleep=sleep))
+    stats = run(src, dest, journal, files_per_sec=10)
+    # burst の 10 件は待たずに、残り 20 件は 10 件/秒 → 2 秒待つ
+    assert stats["moved"] == 30
+    assert stats["waited"] == pytest.approx(2.0)
+    assert clock["now"] == pytest.approx(2.0)